@@ -4,79 +4,94 @@ EnviroPi Data Collection Script
 Logs sensor data to JSON file every 5 minutes
 """
 
-import json
+import os
 import time
 from datetime import datetime
 from pathlib import Path
 
+import enviro_alerts
+import enviro_archive
+import enviro_daemon
+import enviro_metrics
+import enviro_query
+import enviro_rollup
+import enviro_writebuf
+
 # Data directory
-DATA_DIR = Path("/home/enviropi/enviro_data")
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
 DATA_DIR.mkdir(exist_ok=True)
 
+# Accelerometer capture runs in the background between readings
+_motion = None
+
+# How long a cron run captures motion before logging its summary
+MOTION_WARMUP = 2.0
+
+def get_motion():
+    """Start high-rate accelerometer capture once"""
+    global _motion
+    if _motion is None:
+        import enviro_motion
+        motion = enviro_motion.MotionMonitor(enviro_motion.envirophat_accelerometer())
+        motion.start()
+        motion.wait(MOTION_WARMUP)
+        _motion = motion
+    return _motion
+
+@enviro_metrics.timed("read_sensors")
 def read_sensors():
     """Read all sensor values"""
-    from envirophat import light, weather, motion
+    global _motion
+    from envirophat import light, weather
     
-    return {
+    data = {
         "timestamp": datetime.now().isoformat(),
         "temperature_c": round(weather.temperature(), 2),
         "pressure_hpa": round(weather.pressure(), 2),
         "light_lux": round(light.light(), 2),
-        "accelerometer": {
-            "x": round(motion.accelerometer().x, 3),
-            "y": round(motion.accelerometer().y, 3),
-            "z": round(motion.accelerometer().z, 3)
-        }
     }
+    
+    # Accelerometer: mean orientation plus per-axis vibration since the last reading
+    try:
+        data.update(get_motion().summary())
+    except Exception as e:
+        print(f"Accelerometer error: {e}")
+        if _motion is not None:
+            _motion.stop()
+        _motion = None
+        data["accelerometer"] = None
+    
+    return data
 
+@enviro_metrics.timed("log_reading")
 def log_data():
-    """Log current sensor readings to today's JSON file"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    log_file = DATA_DIR / f"enviro_{today}.json"
-    
+    """Log current sensor readings to today's log file"""
     try:
         # Read sensors
         data = read_sensors()
         
-        # Load existing data
-        if log_file.exists():
-            with open(log_file, 'r') as f:
-                log_data = json.load(f)
-        else:
-            log_data = {"date": today, "readings": []}
-        
         # Append new reading
-        log_data["readings"].append(data)
-        
-        # Write back
-        with open(log_file, 'w') as f:
-            json.dump(log_data, f, indent=2)
+        enviro_writebuf.append(data, DATA_DIR)
+        enviro_alerts.check(data, DATA_DIR)
         
         print(f"[{data['timestamp']}] Logged: {data['temperature_c']}°C, {data['pressure_hpa']} hPa, {data['light_lux']} lux")
         
-        # Keep only last 7 days of data
+        # Closed days are compressed and kept for a year; older history lives on in the rollups
         cleanup_old_logs()
         
     except Exception as e:
         print(f"Error logging data: {e}")
 
+@enviro_metrics.timed("cleanup")
 def cleanup_old_logs():
-    """Remove log files older than 7 days"""
-    import os
-    from datetime import timedelta
-    
-    cutoff = datetime.now() - timedelta(days=7)
-    
-    for log_file in DATA_DIR.glob("enviro_*.json"):
-        file_date = log_file.stem.replace("enviro_", "")
-        try:
-            file_datetime = datetime.strptime(file_date, "%Y-%m-%d")
-            if file_datetime < cutoff:
-                os.remove(log_file)
-                print(f"Cleaned up old log: {log_file.name}")
-        except ValueError:
-            pass  # Skip malformed filenames
+    """Roll raw logs up into 1m/1h/1d tiers, compress closed days, then expire what each tier no longer needs"""
+    enviro_rollup.rollup(DATA_DIR)
+    for day in enviro_archive.archive_closed_days(DATA_DIR):
+        enviro_query.day_partials(day, DATA_DIR)   # Warm the query cache while the day is fresh
+    for log_file in enviro_rollup.apply_retention(DATA_DIR):
+        print(f"Cleaned up old log: {log_file.name}")
+    enviro_query.prune_cache(DATA_DIR)
 
 if __name__ == "__main__":
-    # For cron: run once and exit
-    log_data()
+    # For cron: run once and exit (or stay resident with --daemon)
+    enviro_daemon.main("EnviroPi data collection", log_data)
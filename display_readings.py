@@ -2,31 +2,23 @@
 """
 EnviroPi Display - Show live sensor readings on LCD
 Runs continuously, updates every 5 seconds
+Fonts and static labels are rendered once; each update sends only the
+value regions whose text changed to the ST7735
 """
 
 import time
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
-from st7735 import ST7735
-from bme280 import BME280
-from smbus2 import SMBus
-from ltr559 import LTR559
-
-# Initialize display
-disp = ST7735(
-    port=0,
-    cs=1,
-    dc=9,
-    backlight=12,
-    rotation=270,
-    spi_speed_hz=10000000
-)
-disp.begin()
-
-# Initialize sensors
-bus = SMBus(1)
-bme280 = BME280(i2c_dev=bus)
-ltr = LTR559()
+import st7735
+
+import enviro_bus
+import enviro_metrics
+
+# Panel rotation (the Enviro+ LCD is mounted landscape)
+ROTATION = 270
+
+# Seconds between updates; only changed values are redrawn, so 1 s is fine
+UPDATE_INTERVAL = 5
 
 # Colors
 COLOR_BG = (0, 0, 0)
@@ -37,78 +29,166 @@ COLOR_PRESS = (150, 255, 150)
 COLOR_LIGHT = (255, 255, 100)
 
 def read_sensors():
-    """Read all sensors with warm-up"""
-    # Discard first reading
-    _ = bme280.get_temperature()
-    _ = bme280.get_humidity()
-    _ = bme280.get_pressure()
-    time.sleep(0.5)
+    """Latest reading from the sampler (enviro_bus.py); blanks if it isn't running
+
+    The display never opens the sensors itself, so it doesn't compete with
+    the logger for the microphone or the PMS5003's UART.
+    """
+    reading = enviro_bus.latest_reading() or dict.fromkeys(
+        ["temperature_c", "humidity_pct", "pressure_hpa", "light_lux"])
     
-    # Get actual readings
-    temp_c = bme280.get_temperature()
-    temp_f = temp_c * 9/5 + 32
-    humidity = bme280.get_humidity()
-    pressure_hpa = bme280.get_pressure()
-    pressure_inhg = pressure_hpa * 0.02953  # Convert hPa to inHg
-    light = ltr.get_lux()
+    temp_c = reading["temperature_c"]
+    temp_f = temp_c * 9/5 + 32 if temp_c is not None else None
+    humidity = reading["humidity_pct"]
+    pressure_hpa = reading["pressure_hpa"]
+    pressure_inhg = pressure_hpa * 0.02953 if pressure_hpa is not None else None  # Convert hPa to inHg
+    light = reading["light_lux"]
     
     return temp_c, temp_f, humidity, pressure_hpa, pressure_inhg, light
 
-def update_display():
-    """Update display with current readings"""
-    temp_c, temp_f, humidity, pressure_hpa, pressure_inhg, light = read_sensors()
-    
-    # Create image
-    img = Image.new('RGB', (disp.width, disp.height), color=COLOR_BG)
-    draw = ImageDraw.Draw(img)
-    
-    # Try to load a font, fall back to default if not available
+def load_fonts():
+    """Load the TrueType fonts, fall back to default if not available"""
     try:
         font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 10)
         font_large = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 14)
-    except:
+    except OSError:
         font_small = ImageFont.load_default()
         font_large = ImageFont.load_default()
+    return font_small, font_large
+
+# Compact layout for 160x80: static labels, then value regions.
+# Each region is (text origin, clipping box (x0, y0, x1, y1), font size, color)
+STATIC_LABELS = [
+    ((5, 2), "EnviroPi", "small", COLOR_TEXT),
+    ((85, 30), "RH", "small", COLOR_HUM),
+    ((85, 62), "lux", "small", COLOR_LIGHT),
+]
+REGIONS = {
+    "clock": ((120, 2), (118, 0, 160, 14), "small", COLOR_TEXT),
+    "temp_f": ((5, 16), (0, 14, 85, 30), "large", COLOR_TEMP),
+    "temp_c": ((5, 30), (0, 30, 85, 46), "small", COLOR_TEMP),
+    "humidity": ((85, 16), (85, 14, 160, 30), "large", COLOR_HUM),
+    "pressure_inhg": ((5, 48), (0, 46, 85, 62), "large", COLOR_PRESS),
+    "pressure_hpa": ((5, 62), (0, 62, 85, 80), "small", COLOR_PRESS),
+    "light": ((85, 48), (85, 46, 160, 62), "large", COLOR_LIGHT),
+}
+
+class DisplayRenderer:
+    """Draws readings onto a cached background and pushes only what changed"""
+
+    def __init__(self, disp, rotation=ROTATION):
+        self.disp = disp
+        self.rotation = rotation   # As passed to ST7735(); the driver keeps its copy private
+        font_small, font_large = load_fonts()
+        self.fonts = {"small": font_small, "large": font_large}
+        self.background = self._render_background()
+        self.frame = self.background.copy()
+        self.shown = {}
+        self.full_refresh = True
+
+    def _render_background(self):
+        img = Image.new('RGB', (self.disp.width, self.disp.height), color=COLOR_BG)
+        draw = ImageDraw.Draw(img)
+        for xy, text, font, color in STATIC_LABELS:
+            draw.text(xy, text, font=self.fonts[font], fill=color)
+        return img
+
+    def _panel_window(self, box):
+        """Map a box in rotated (logical) coordinates to the panel's window"""
+        x0, y0, x1, y1 = box
+        w, h = self.disp.width, self.disp.height
+        k = (self.rotation // 90) % 4
+        if k == 0:
+            return x0, y0, x1 - 1, y1 - 1
+        if k == 1:
+            return y0, w - x1, y1 - 1, w - x0 - 1
+        if k == 2:
+            return w - x1, h - y1, w - x0 - 1, h - y0 - 1
+        return h - y1, x0, h - y0 - 1, x1 - 1
+
+    def _push(self, box, tile):
+        """Send one rectangle over SPI"""
+        col0, row0, col1, row1 = self._panel_window(box)
+        self.disp.set_window(col0, row0, col1, row1)
+        pixelbytes = st7735.image_to_data(tile, self.rotation)
+        for i in range(0, len(pixelbytes), 4096):
+            self.disp.data(pixelbytes[i:i + 4096])
+
+    def render(self, values):
+        """Redraw the regions whose text changed; returns how many were sent"""
+        dirty = []
+        for key, (xy, box, font, color) in REGIONS.items():
+            text = values[key]
+            if not self.full_refresh and self.shown.get(key) == text:
+                continue
+            tile = self.background.crop(box)
+            ImageDraw.Draw(tile).text((xy[0] - box[0], xy[1] - box[1]), text,
+                                      font=self.fonts[font], fill=color)
+            self.frame.paste(tile, box[:2])
+            self.shown[key] = text
+            dirty.append((box, tile))
+
+        partial = hasattr(self.disp, "set_window") and hasattr(self.disp, "data")
+        if self.full_refresh or not partial:
+            self.disp.display(self.frame)
+            self.full_refresh = False
+        else:
+            for box, tile in dirty:
+                self._push(box, tile)
+        return len(dirty)
+
+disp = None
+renderer = None
+
+def open_display():
+    """Initialise the LCD and the renderer drawing to it"""
+    global disp, renderer
+    disp = st7735.ST7735(
+        port=0,
+        cs=1,
+        dc=9,
+        backlight=12,
+        rotation=ROTATION,
+        spi_speed_hz=10000000
+    )
+    disp.begin()
+    renderer = DisplayRenderer(disp, ROTATION)
+
+def fmt(value, spec):
+    """Format a reading, or a placeholder if the sensor returned nothing"""
+    return "--" if value is None else format(value, spec)
+
+@enviro_metrics.timed("update_display")
+def update_display():
+    """Update display with current readings"""
+    temp_c, temp_f, humidity, pressure_hpa, pressure_inhg, light = read_sensors()
     
-    # Draw title
-    draw.text((5, 2), "EnviroPi", font=font_small, fill=COLOR_TEXT)
-    draw.text((120, 2), datetime.now().strftime("%H:%M"), font=font_small, fill=COLOR_TEXT)
-    
-    # Draw sensor readings (compact layout for 160x80)
-    y = 16
-    
-    # Temperature
-    draw.text((5, y), f"{temp_f:.1f}°F", font=font_large, fill=COLOR_TEMP)
-    draw.text((5, y+14), f"({temp_c:.1f}°C)", font=font_small, fill=COLOR_TEMP)
-    
-    # Humidity
-    draw.text((85, y), f"{humidity:.1f}%", font=font_large, fill=COLOR_HUM)
-    draw.text((85, y+14), "RH", font=font_small, fill=COLOR_HUM)
-    
-    # Pressure (both hPa and inHg)
-    y += 32
-    draw.text((5, y), f"{pressure_inhg:.2f}", font=font_large, fill=COLOR_PRESS)
-    draw.text((5, y+14), f"inHg ({pressure_hpa:.0f}hPa)", font=font_small, fill=COLOR_PRESS)
-    
-    # Light
-    draw.text((85, y), f"{light:.0f}", font=font_large, fill=COLOR_LIGHT)
-    draw.text((85, y+14), "lux", font=font_small, fill=COLOR_LIGHT)
-    
-    # Display
-    disp.display(img)
+    renderer.render({
+        "clock": datetime.now().strftime("%H:%M"),
+        "temp_f": f"{fmt(temp_f, '.1f')}°F",
+        "temp_c": f"({fmt(temp_c, '.1f')}°C)",
+        "humidity": f"{fmt(humidity, '.1f')}%",
+        "pressure_inhg": fmt(pressure_inhg, '.2f'),
+        "pressure_hpa": f"inHg ({fmt(pressure_hpa, '.0f')}hPa)",
+        "light": fmt(light, '.0f'),
+    })
 
 if __name__ == "__main__":
     print("EnviroPi Display - Starting...")
     print("Press Ctrl+C to exit")
+    open_display()
+    enviro_metrics.start()
     
     try:
         while True:
             try:
                 update_display()
-                time.sleep(5)  # Update every 5 seconds
+                enviro_metrics.export()
+                time.sleep(UPDATE_INTERVAL)
             except Exception as e:
                 print(f"Display error: {e}")
-                time.sleep(5)
+                renderer.full_refresh = True
+                time.sleep(UPDATE_INTERVAL)
     except KeyboardInterrupt:
         # Clear display
         img = Image.new('RGB', (disp.width, disp.height), color=(0, 0, 0))
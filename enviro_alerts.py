@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Alerts
+Threshold, rate-of-change and sustained-level rules evaluated on every
+logged reading. Each rule keeps O(1)-per-sample state (monotonic deques
+for window min/max), so a 3-hour window costs the same as a 5-minute one
+and history is never rescanned. Events are appended to alerts.jsonl in the
+data directory and, if ENVIROPI_ALERT_SOCKET names a Unix datagram socket,
+sent there too.
+
+Rules come from ENVIROPI_ALERTS_CONFIG (a JSON list like DEFAULT_RULES) if
+that file exists.
+
+Usage: python3 enviro_alerts.py [--replay START_DATE [END_DATE]]
+"""
+
+import argparse
+import atexit
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+ALERTS_CONFIG = Path(os.environ.get("ENVIROPI_ALERTS_CONFIG", "/home/enviropi/alerts.json"))
+ALERT_SOCKET = os.environ.get("ENVIROPI_ALERT_SOCKET")
+
+DEFAULT_RULES = [
+    {"name": "too_hot", "type": "threshold", "metric": "temperature_c", "above": 30, "clear": 29, "debounce": 2},
+    {"name": "too_cold", "type": "threshold", "metric": "temperature_c", "below": 10, "clear": 11, "debounce": 2},
+    # Barometric tendency: a fall of 3 hPa or more in 3 hours means weather is coming
+    {"name": "pressure_falling", "type": "rate", "metric": "pressure_hpa", "window": 10800, "drop": 3.0, "clear": 2.0},
+    {"name": "damp", "type": "sustained", "metric": "humidity_pct", "above": 70, "duration": 1800, "clear": 65},
+]
+
+# Daemons write their rule state at most this often (and at exit)
+SAVE_INTERVAL = 60
+
+
+class WindowExtremes:
+    """Min and max over a sliding time window, amortised O(1) per sample
+
+    Each deque holds only the samples that could still become the window's
+    min (or max), so every sample is appended and removed at most once.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._min = deque()
+        self._max = deque()
+
+    def push(self, t, value):
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((t, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((t, value))
+        cutoff = t - self.seconds
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+    def state(self):
+        return {"min": list(self._min), "max": list(self._max)}
+
+    def load(self, state):
+        self._min = deque(tuple(item) for item in state["min"])
+        self._max = deque(tuple(item) for item in state["max"])
+
+
+class Rule:
+    """Debounced, hysteretic alert on one metric
+
+    Subclasses say whether a sample meets the firing condition or the
+    (separate) clearing condition; the state only changes after `debounce`
+    consecutive samples agree.
+    """
+
+    def __init__(self, name, metric, debounce=1, **_):
+        self.name = name
+        self.metric = metric
+        self.debounce = debounce
+        self.active = False
+        self._streak = 0
+
+    def evaluate(self, t, value):
+        """(fire, clear, detail) for this sample"""
+        raise NotImplementedError
+
+    def step(self, t, value):
+        """Feed one sample; returns an event dict when the state changes"""
+        fire, clear, detail = self.evaluate(t, value)
+        change = clear if self.active else fire
+        self._streak = self._streak + 1 if change else 0
+        if self._streak < self.debounce:
+            return None
+        self._streak = 0
+        self.active = not self.active
+        return {"rule": self.name, "metric": self.metric, "state": "firing" if self.active else "cleared",
+                "value": value, **detail}
+
+    def state(self):
+        return {"active": self.active, "streak": self._streak}
+
+    def load(self, state):
+        self.active = state["active"]
+        self._streak = state["streak"]
+
+
+class ThresholdRule(Rule):
+    """Value above (or below) a level; clears on the other side of `clear`"""
+
+    def __init__(self, name, metric, above=None, below=None, clear=None, **kwargs):
+        super().__init__(name, metric, **kwargs)
+        self.above = above
+        self.below = below
+        self.clear = clear if clear is not None else (above if above is not None else below)
+
+    def evaluate(self, t, value):
+        if self.above is not None:
+            return value > self.above, value < self.clear, {"limit": self.above}
+        return value < self.below, value > self.clear, {"limit": self.below}
+
+
+class RateRule(Rule):
+    """Change within a time window, e.g. pressure falling 3 hPa in 3 h"""
+
+    def __init__(self, name, metric, window, drop=None, rise=None, clear=None, **kwargs):
+        super().__init__(name, metric, **kwargs)
+        self.window = WindowExtremes(window)
+        self.drop = drop
+        self.rise = rise
+        self.clear = clear if clear is not None else (drop if drop is not None else rise)
+
+    def evaluate(self, t, value):
+        self.window.push(t, value)
+        if self.drop is not None:
+            change = self.window.max - value
+            return change >= self.drop, change < self.clear, {"drop": round(change, 3), "window": self.window.seconds}
+        change = value - self.window.min
+        return change >= self.rise, change < self.clear, {"rise": round(change, 3), "window": self.window.seconds}
+
+    def state(self):
+        return {**super().state(), "window": self.window.state()}
+
+    def load(self, state):
+        super().load(state)
+        self.window.load(state["window"])
+
+
+class SustainedRule(Rule):
+    """Value beyond a level continuously for `duration` seconds"""
+
+    def __init__(self, name, metric, duration, above=None, below=None, clear=None, **kwargs):
+        super().__init__(name, metric, **kwargs)
+        self.duration = duration
+        self.above = above
+        self.below = below
+        self.clear = clear if clear is not None else (above if above is not None else below)
+        self._since = None
+
+    def evaluate(self, t, value):
+        beyond = value > self.above if self.above is not None else value < self.below
+        if not beyond:
+            self._since = None
+        elif self._since is None:
+            self._since = t
+        held = t - self._since if self._since is not None else 0
+        clear = value < self.clear if self.above is not None else value > self.clear
+        return beyond and held >= self.duration, clear, {"held": held}
+
+    def state(self):
+        return {**super().state(), "since": self._since}
+
+    def load(self, state):
+        super().load(state)
+        self._since = state["since"]
+
+
+RULE_TYPES = {"threshold": ThresholdRule, "rate": RateRule, "sustained": SustainedRule}
+
+
+def build_rules(config):
+    return [RULE_TYPES[spec["type"]](**{k: v for k, v in spec.items() if k != "type"}) for spec in config]
+
+
+def load_config(path=ALERTS_CONFIG):
+    if Path(path).exists():
+        with open(path, 'r') as f:
+            return json.load(f)
+    return DEFAULT_RULES
+
+
+class AlertEngine:
+    """Rules plus their persisted state and the event sink"""
+
+    def __init__(self, rules, data_dir=DATA_DIR, socket_path=ALERT_SOCKET):
+        self.rules = rules
+        self.data_dir = Path(data_dir)
+        self.socket_path = socket_path
+        self.last_t = None
+        self._saved_at = None
+
+    @property
+    def state_file(self):
+        return self.data_dir / "alerts_state.json"
+
+    @property
+    def events_file(self):
+        return self.data_dir / "alerts.jsonl"
+
+    def load(self):
+        """Restore rule state saved by an earlier run (cron mode)"""
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.last_t = state.get("last_t")
+        for rule in self.rules:
+            if rule.name in state["rules"]:
+                try:
+                    rule.load(state["rules"][rule.name])
+                except (KeyError, TypeError, IndexError):
+                    pass  # Rule changed shape; start it fresh
+
+    def save(self):
+        state = {"last_t": self.last_t, "rules": {rule.name: rule.state() for rule in self.rules}}
+        tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp, self.state_file)
+        self._saved_at = time.monotonic()
+
+    def emit(self, event):
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        fd = os.open(self.events_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        if self.socket_path:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                    s.sendto(line, self.socket_path)
+            except OSError:
+                pass  # Nobody listening
+
+    def process(self, reading):
+        """Evaluate every rule on one reading; returns the events emitted"""
+        ts = reading.get("timestamp")
+        if not ts:
+            return []
+        t = enviro_storage.timestamp_us(ts) / 1e6
+        if self.last_t is not None and t <= self.last_t:
+            return []  # Already seen (replay) or clock stepped back
+        self.last_t = t
+
+        events = []
+        for rule in self.rules:
+            value = reading.get(rule.metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+                continue
+            event = rule.step(t, value)
+            if event is not None:
+                event = {"timestamp": ts, **event}
+                self.emit(event)
+                events.append(event)
+        return events
+
+
+_engine = None
+
+def check(reading, data_dir=DATA_DIR):
+    """Run the alert rules on a freshly logged reading
+
+    The engine stays in memory in daemon mode and saves its state every
+    SAVE_INTERVAL seconds and at exit; a cron run loads the state, checks
+    its one reading and saves.
+    """
+    global _engine
+    try:
+        if _engine is None:
+            _engine = AlertEngine(build_rules(load_config()), data_dir)
+            _engine.load()
+            atexit.register(_engine.save)
+        for event in _engine.process(reading):
+            print(f"ALERT {event['rule']} {event['state']}: {event['metric']} = {event['value']}")
+        if _engine._saved_at is None or time.monotonic() - _engine._saved_at >= SAVE_INTERVAL:
+            _engine.save()
+    except Exception as e:
+        print(f"Alert error: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi alert rules")
+    parser.add_argument("--replay", nargs="+", metavar="DATE",
+                        help="run the rules over logged days (fresh state, events to stdout only)")
+    args = parser.parse_args()
+
+    if not args.replay:
+        for rule in load_config():
+            print(json.dumps(rule))
+        return 0
+
+    engine = AlertEngine(build_rules(load_config()), DATA_DIR, None)
+    engine.emit = lambda event: print(json.dumps(event))
+    day = datetime.strptime(args.replay[0], "%Y-%m-%d")
+    end = datetime.strptime(args.replay[-1], "%Y-%m-%d")
+    while day <= end:
+        for reading in enviro_storage.iter_readings(day.strftime("%Y-%m-%d"), DATA_DIR):
+            engine.process(reading)
+        day += timedelta(days=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Day Archives
+Closed day files are compressed into seekable archives: the day's lines in
+blocks of BLOCK_READINGS, each block its own gzip member (so the whole file
+still works with zcat), plus a small index of every block's time span and
+byte range. A time-range read decompresses only the blocks it overlaps.
+
+Days are archived at rollover, once the rollups have consumed them; the
+archive is verified against the day file before that is removed. A day
+converted to columnar (enviro_columnar) later takes the archive's readings
+into its .col and the archive goes; lines logged for it after that are
+archived again at the next rollover, and read after the .col.
+
+Usage: python3 enviro_archive.py                     Archive closed days
+       python3 enviro_archive.py DAY [START END]     Print a day (or a time range) from its archive
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+# Lines per gzip member: big enough to compress well (~70 KB of JSON at
+# 10 s sampling), small enough that a range read decompresses little
+BLOCK_READINGS = 512
+
+COMPRESS_LEVEL = 9
+
+# Wait this long after midnight before archiving a day, so late writes land first
+ROLLOVER_DELAY = timedelta(hours=1)
+
+INDEX_VERSION = 1
+
+
+def archive_file(day, data_dir=DATA_DIR):
+    """Path of a day's compressed archive"""
+    return Path(data_dir) / f"enviro_{day}.jsonl.gz"
+
+
+def index_file(day, data_dir=DATA_DIR):
+    """Path of a day archive's block index"""
+    return Path(data_dir) / f"enviro_{day}.jsonl.gz.idx"
+
+
+def remove_archive(day, data_dir=DATA_DIR):
+    """Delete a day's archive and its index"""
+    archive_file(day, data_dir).unlink(missing_ok=True)
+    index_file(day, data_dir).unlink(missing_ok=True)
+
+
+def _write_atomic(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _load_index(day, data_dir):
+    try:
+        with open(index_file(day, data_dir), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _compress_blocks(lines, times, offset):
+    """gzip members of BLOCK_READINGS lines each; returns (data, index blocks)"""
+    blocks, parts = [], []
+    for i in range(0, len(lines), BLOCK_READINGS):
+        data = gzip.compress(b"".join(lines[i:i + BLOCK_READINGS]), COMPRESS_LEVEL, mtime=0)
+        span = times[i:i + BLOCK_READINGS]
+        blocks.append([min(span), max(span), offset, len(data), len(span)])
+        parts.append(data)
+        offset += len(data)
+    return b"".join(parts), blocks
+
+
+def archive_day(day, data_dir=DATA_DIR, remove=True):
+    """Compress a day file into an indexed archive; returns (raw bytes, archive bytes)
+
+    Torn lines are dropped. If the day was already archived (a late write,
+    or a clock that was wrong at boot, brought its day file back), the new
+    lines are added to the archive as extra blocks. With remove=True the day
+    file is deleted once the archive has been read back and matches it.
+    """
+    source = enviro_storage.day_file(day, data_dir)
+    with open(source, 'rb') as f:
+        raw = f.read()
+    col = Path(data_dir) / f"enviro_{day}.col"
+    if col.exists():
+        # Lines a columnar copy of the day already holds aren't archived twice
+        import enviro_columnar
+        converted = enviro_columnar.ColumnarDay(col)
+        if converted.holds_archive(archive_file(day, data_dir)):
+            remove_archive(day, data_dir)   # A conversion stopped before removing it
+        raw = raw[converted.covered_bytes(source):]
+
+    lines, times = [], []
+    for line in raw.splitlines():
+        try:
+            ts = json.loads(line)["timestamp"]
+            times.append(enviro_storage.timestamp_us(ts))
+        except (ValueError, KeyError, TypeError):
+            continue  # Torn line from an interrupted write
+        lines.append(line + b"\n")
+
+    path = archive_file(day, data_dir)
+    index = _load_index(day, data_dir) if path.exists() else None
+    digest = hashlib.sha1(raw).hexdigest()
+    if index is not None and digest in index.get("sources", []):
+        # Already appended; only removing the day file was interrupted
+        if remove:
+            source.unlink()
+        return len(raw), 0
+    rebuild = path.exists() and index is None
+    if rebuild:
+        # Archive without its index: fold its lines in and rebuild both. Lines
+        # it already holds are skipped, so an interrupted rebuild can be rerun.
+        with gzip.open(path, 'rb') as f:
+            old = [line for line in f if line.strip()]
+        seen = set(old)
+        new = [(line, t) for line, t in zip(lines, times) if line not in seen]
+        old_times = []
+        for line in old:
+            try:
+                old_times.append(enviro_storage.timestamp_us(json.loads(line)["timestamp"]))
+            except (ValueError, KeyError, TypeError):
+                old_times.append(old_times[-1] if old_times else 0)
+        lines = old + [line for line, _ in new]
+        times = old_times + [t for _, t in new]
+    if not lines:
+        if remove:
+            source.unlink()
+        return len(raw), 0
+
+    if index is not None:
+        # Append: new blocks start where the indexed data ends (anything past
+        # that is a half-written append that never made it into the index)
+        end = max((b[2] + b[3] for b in index["blocks"]), default=0)
+        compressed, blocks = _compress_blocks(lines, times, end)
+        if gzip.decompress(compressed) != b"".join(lines):
+            raise ValueError(f"{day}: archive doesn't match the day file")
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+            f.seek(end)
+            f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+        index["blocks"] += blocks
+        index["readings"] += len(lines)
+        index["sources"] = index.get("sources", []) + [digest]
+        _write_atomic(index_file(day, data_dir), json.dumps(index, separators=(",", ":")).encode())
+    else:
+        compressed, blocks = _compress_blocks(lines, times, 0)
+        if gzip.decompress(compressed) != b"".join(lines):
+            raise ValueError(f"{day}: archive doesn't match the day file")
+        index = json.dumps({"version": INDEX_VERSION, "date": day, "readings": len(lines), "blocks": blocks,
+                            "sources": [digest]},
+                           separators=(",", ":")).encode()
+        if rebuild:
+            # Until the index lands the archive is read whole, which is still right
+            _write_atomic(path, compressed)
+            _write_atomic(index_file(day, data_dir), index)
+        else:
+            # Index first: an archive is only used once it exists alongside the index
+            _write_atomic(index_file(day, data_dir), index)
+            _write_atomic(path, compressed)
+    if remove:
+        source.unlink()
+    return len(raw), len(compressed)
+
+
+class ArchiveDay:
+    """Reader for one day's archive; only opens the blocks a query needs"""
+
+    def __init__(self, day, data_dir=DATA_DIR):
+        self.path = archive_file(day, data_dir)
+        try:
+            with open(index_file(day, data_dir), 'r') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = None   # No index: read the whole archive
+        self.blocks_read = 0
+
+    def _blocks(self, start_us, end_us):
+        for first, last, offset, length, _ in self.index["blocks"]:
+            if (start_us is None or last >= start_us) and (end_us is None or first <= end_us):
+                yield offset, length
+
+    def lines(self, start=None, end=None):
+        """Raw JSON lines from every block overlapping [start, end] (naive ISO)"""
+        if self.index is None:
+            with gzip.open(self.path, 'rb') as f:
+                yield from f
+            return
+        start_us = enviro_storage.timestamp_us(start) if start else None
+        end_us = enviro_storage.timestamp_us(end) if end else None
+        with open(self.path, 'rb') as f:
+            for offset, length in self._blocks(start_us, end_us):
+                f.seek(offset)
+                self.blocks_read += 1
+                yield from gzip.decompress(f.read(length)).splitlines()
+
+    def readings(self, start=None, end=None):
+        """Readings with start <= timestamp <= end (either may be None)"""
+        for line in self.lines(start, end):
+            try:
+                reading = json.loads(line)
+            except ValueError:
+                continue
+            ts = reading.get("timestamp", "")
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                yield reading
+
+
+def archive_closed_days(data_dir=DATA_DIR, now=None):
+    """Archive every day file that is over and already rolled up; returns the days"""
+    import enviro_rollup
+
+    now = now or datetime.now()
+    closed = (now - ROLLOVER_DELAY).strftime("%Y-%m-%d")
+    cursor = (enviro_rollup.load_state(data_dir).get("1m", {}).get("source") or {}).get("file", "")
+    archived = []
+    for path in sorted(Path(data_dir).glob("enviro_????-??-??.jsonl")):
+        day = path.name[7:17]
+        if day >= closed or path.name >= cursor:
+            continue
+        try:
+            raw, compressed = archive_day(day, data_dir)
+        except (OSError, ValueError) as e:
+            print(f"Archive of {day} failed: {e}")
+            continue
+        archived.append(day)
+        print(f"Archived {path.name}: {raw} -> {compressed} bytes")
+    return archived
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        day = sys.argv[1]
+        start = sys.argv[2] if len(sys.argv) > 2 else None
+        end = sys.argv[3] if len(sys.argv) > 3 else None
+        for reading in ArchiveDay(day).readings(start, end):
+            print(json.dumps(reading))
+    else:
+        archived = archive_closed_days()
+        print(f"Archived {len(archived)} days")
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Benchmarks
+Times sampling, logging, day-file loading, report statistics and log
+cleanup against synthetic data, and saves the results as JSON so runs can
+be compared over time. Runs off-device (sensors come from enviro_i2c's
+fake bus).
+
+Usage:
+  python3 enviro_bench.py [--duration day month year] [--cadence 300 10 1]
+                          [--output FILE] [--compare OLD.json]
+
+Defaults to one day and one month at 5-minute and 10-second cadence; a
+year at 1-second cadence is ~31M readings (~6 GB) and takes a long time.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DURATIONS = {"day": 1, "month": 30, "year": 365}
+
+# Readings appended per scenario when timing the logging path
+APPENDS = 2000
+
+# Sensor samples taken on the fake bus
+SAMPLES = 100
+
+# Day files loaded per scenario (spread evenly over the scenario)
+MAX_LOAD_DAYS = 31
+
+RESULTS_DIR = Path("bench_results")
+
+
+def synthetic_readings(start, count, cadence):
+    """Deterministic Enviro+-style readings every cadence seconds"""
+    for i in range(count):
+        t = start + timedelta(seconds=i * cadence)
+        hour = (t.hour + t.minute / 60) / 24 * 2 * math.pi
+        yield {
+            "timestamp": t.isoformat(),
+            "temperature_c": round(20 + 3 * math.sin(hour) + (i % 7) * 0.01, 2),
+            "pressure_hpa": round(1013 + 5 * math.sin(i / 5000) + (i % 5) * 0.01, 2),
+            "humidity_pct": round(45 + 10 * math.cos(hour) + (i % 3) * 0.1, 2),
+            "light_lux": round(max(0.0, 800 * math.sin(hour - math.pi / 2)), 2),
+            "noise_low": None,
+            "noise_mid": None,
+            "noise_high": None,
+            "noise_amp": None,
+        }
+
+
+def generate(data_dir, days, cadence, end=None):
+    """Write days of readings ending at end, as the logger would have
+
+    Day files are written in bulk rather than through append_reading() so
+    generating a year doesn't take a year; stats sidecars are then built
+    the same way the logger leaves them.
+    """
+    import enviro_stats
+    import enviro_storage
+
+    end = end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    count = int(days * 86400 // cadence)
+    current, f, written = None, None, 0
+    for reading in synthetic_readings(start, count, cadence):
+        day = reading["timestamp"][:10]
+        if day != current:
+            if f:
+                f.close()
+            current = day
+            f = open(enviro_storage.day_file(day, data_dir), 'w')
+        f.write(json.dumps(reading, separators=(",", ":")) + "\n")
+        written += 1
+    if f:
+        f.close()
+
+    for path in sorted(Path(data_dir).glob("enviro_*.jsonl")):
+        day = path.name[7:17]
+        enviro_stats.save_day(enviro_stats.rebuild_day(day, data_dir), data_dir)
+    return {"readings": written, "bytes": sum(p.stat().st_size for p in Path(data_dir).iterdir() if p.is_file())}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies, items=None):
+    """Throughput and latency percentiles (ms) for a list of per-op seconds"""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    result = {
+        "ops": len(latencies),
+        "total_s": round(total, 6),
+        "ops_per_s": round(len(latencies) / total, 2) if total else None,
+    }
+    if items is not None:
+        result["items"] = items
+        result["items_per_s"] = round(items / total, 2) if total else None
+    for p in (50, 95, 99):
+        value = percentile(latencies, p)
+        result[f"p{p}_ms"] = round(value * 1000, 4) if value is not None else None
+    return result
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_sample(data_dir):
+    """Per-sample sensor read on the fake bus (both loggers)"""
+    import enviropi_logger
+    import enviroplus_logger
+
+    results = {}
+    latencies = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        enviropi_logger.read_bmp280()
+        enviropi_logger.read_bh1750()
+        latencies.append(time.perf_counter() - start)
+    results["enviropi"] = summarize(latencies)
+
+    try:
+        import bme280, ltr559  # noqa: F401 - only checking they're installed
+    except ImportError:
+        return results
+    enviroplus_logger.read_sensors()  # Opens and warms up the drivers
+    latencies = [_timed(enviroplus_logger.read_sensors)[0] for _ in range(SAMPLES)]
+    results["enviroplus"] = summarize(latencies)
+    return results
+
+
+def bench_append(data_dir, cadence):
+    """Per-sample logging path: append_reading() incl. the stats sidecar"""
+    import enviro_storage
+
+    start = datetime.now().replace(microsecond=0)
+    latencies = []
+    for reading in synthetic_readings(start, APPENDS, cadence):
+        latencies.append(_timed(enviro_storage.append_reading, reading, data_dir)[0])
+    return summarize(latencies)
+
+
+def bench_append_buffered(data_dir, cadence):
+    """Logging through the write buffer: group commit with fsync and journal"""
+    import enviro_writebuf
+
+    buffer = enviro_writebuf.WriteBuffer(data_dir, max_age=None)
+    start = datetime.now().replace(microsecond=0)
+    latencies = []
+    for reading in synthetic_readings(start, APPENDS, cadence):
+        latencies.append(_timed(buffer.add, reading)[0])
+    latencies[-1] += _timed(buffer.close)[0]
+    return {**summarize(latencies), "writes": buffer.stats()}
+
+
+def _bench_days(data_dir):
+    days = sorted(p.name[7:17] for p in Path(data_dir).glob("enviro_*.jsonl"))
+    if len(days) > MAX_LOAD_DAYS:
+        step = len(days) / MAX_LOAD_DAYS
+        days = [days[int(i * step)] for i in range(MAX_LOAD_DAYS)]
+    return days
+
+
+def bench_load_day(data_dir):
+    """Loading whole day files"""
+    import enviro_storage
+
+    latencies, items = [], 0
+    for day in _bench_days(data_dir):
+        elapsed, data = _timed(enviro_storage.load_day, day, data_dir)
+        latencies.append(elapsed)
+        items += len(data["readings"])
+    return summarize(latencies, items)
+
+
+def bench_report(data_dir):
+    """Statistics for the daily email: from sidecars, and rebuilt from readings"""
+    import enviro_stats
+
+    days = _bench_days(data_dir)
+    warm = [_timed(lambda d: enviro_stats.summary(enviro_stats.range_stats(d, d, data_dir)), day)[0]
+            for day in days]
+    all_days = sorted(p.name[7:17] for p in Path(data_dir).glob("enviro_*.jsonl"))
+    elapsed, agg = _timed(enviro_stats.range_stats, all_days[0], all_days[-1], data_dir)
+    rebuild = []
+    for day in days:
+        rebuild.append(_timed(enviro_stats.rebuild_day, day, data_dir)[0])
+    return {
+        "day_from_sidecar": summarize(warm),
+        "full_range_from_sidecars": summarize([elapsed], agg["count"]),
+        "day_rebuild": summarize(rebuild),
+    }
+
+
+def bench_cleanup(data_dir):
+    """cleanup_old_logs(): first (catch-up) run, then a steady-state run"""
+    import collect_data
+
+    collect_data.DATA_DIR = Path(data_dir)
+    first, _ = _timed(collect_data.cleanup_old_logs)
+    steady, _ = _timed(collect_data.cleanup_old_logs)
+    return {"first_run": summarize([first]), "steady_run": summarize([steady])}
+
+
+def _run_child(name, data_dir, *args):
+    """Run one benchmark in this (fresh) process and report its peak RSS"""
+    os.environ["ENVIROPI_DATA_DIR"] = str(data_dir)
+    os.environ["ENVIROPI_CACHE_DIR"] = str(Path(data_dir) / ".cache")
+    os.environ.setdefault("ENVIROPI_FAKE_I2C", "1")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = globals()[name](data_dir, *args)
+    if isinstance(result, dict):
+        result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_isolated(name, data_dir, *args):
+    """Run a benchmark in its own process so peak RSS is its own"""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_run_child, name, str(data_dir), *args).result()
+
+
+def run_scenario(duration, cadence, work_dir):
+    data_dir = Path(work_dir) / f"{duration}_{cadence:g}s"
+    data_dir.mkdir(parents=True)
+    elapsed, info = _timed(generate, data_dir, DURATIONS[duration], cadence)
+    scenario = {"duration": duration, "cadence_s": cadence, **info, "generate_s": round(elapsed, 3)}
+
+    # Read-only benchmarks first; append and cleanup change the data
+    scenario["load_day"] = run_isolated("bench_load_day", data_dir)
+    scenario["report"] = run_isolated("bench_report", data_dir)
+    scenario["append"] = run_isolated("bench_append", data_dir, cadence)
+    scenario["append_buffered"] = run_isolated("bench_append_buffered", data_dir, cadence)
+    scenario["cleanup"] = run_isolated("bench_cleanup", data_dir)
+    shutil.rmtree(data_dir)
+    return scenario
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results, prefix="", rss=None):
+    """{"a": {"b": {"p50_ms": ...}}} -> {"a.b": {...}} for leaf summaries
+
+    Each leaf gets the peak RSS of the process that produced it.
+    """
+    flat = {}
+    rss = results.get("peak_rss_kb", rss)
+    for key, value in results.items():
+        if isinstance(value, dict) and "ops" in value:
+            flat[prefix + key] = dict(value, peak_rss_kb=value.get("peak_rss_kb", rss))
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + ".", rss))
+    return flat
+
+
+def results_table(results):
+    rows = []
+    benches = {"sample": results.get("sample", {})}
+    for s in results["scenarios"]:
+        benches[f"{s['duration']}@{s['cadence_s']:g}s"] = s
+    for label, flat in ((k, _flatten(v)) for k, v in benches.items()):
+        for name, r in flat.items():
+            rows.append(f"{label:<14} {name:<40} {r['ops_per_s'] or 0:>12.1f} "
+                        f"{r['p50_ms'] or 0:>10.3f} {r['p95_ms'] or 0:>10.3f} {r['p99_ms'] or 0:>10.3f} "
+                        f"{(r['peak_rss_kb'] or 0) / 1024:>8.1f}")
+    header = (f"{'scenario':<14} {'benchmark':<40} {'ops/s':>12} {'p50 ms':>10} {'p95 ms':>10} "
+              f"{'p99 ms':>10} {'RSS MB':>8}")
+    return "\n".join([header, "-" * len(header)] + rows)
+
+
+def compare(old, new):
+    """Lines showing p50 change per benchmark present in both runs"""
+    def index(results):
+        out = {f"sample.{k}": v for k, v in _flatten(results.get("sample", {})).items()}
+        for s in results["scenarios"]:
+            label = f"{s['duration']}@{s['cadence_s']:g}s"
+            out.update({f"{label}.{k}": v for k, v in _flatten(s).items()})
+        return out
+
+    old_index, new_index = index(old), index(new)
+    lines = []
+    for name in sorted(set(old_index) & set(new_index)):
+        a, b = old_index[name]["p50_ms"], new_index[name]["p50_ms"]
+        if a and b:
+            lines.append(f"{name:<50} {a:>10.3f} -> {b:>10.3f} ms  ({(b - a) / a * 100:+.1f}%)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi benchmarks")
+    parser.add_argument("--duration", nargs="+", choices=list(DURATIONS), default=["day", "month"])
+    parser.add_argument("--cadence", nargs="+", type=float, default=[300, 10],
+                        help="seconds between synthetic readings (default: 300 10)")
+    parser.add_argument("--output", type=Path, help="results file (default: bench_results/bench_<time>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    parser.add_argument("--work-dir", type=Path, help="where to generate data (default: a temp dir)")
+    args = parser.parse_args()
+
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        sample_dir = Path(work_dir) / "sample"
+        sample_dir.mkdir()
+        print("Benchmarking sensor sampling (fake I2C bus)...")
+        results["sample"] = run_isolated("bench_sample", sample_dir)
+
+        for duration in args.duration:
+            for cadence in args.cadence:
+                print(f"Benchmarking {duration} at {cadence:g}s cadence...")
+                results["scenarios"].append(run_scenario(duration, cadence, work_dir))
+
+    output = args.output or RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print()
+    print(results_table(results))
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            old = json.load(f)
+        print(f"\nChange in p50 vs {args.compare}:")
+        print(compare(old, results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+BH1750 ambient light sensor driver
+Keeps the sensor in continuous mode so reads don't stall on integration,
+and adapts resolution/MTreg to very bright or very dark scenes
+"""
+
+import time
+
+# BH1750 I2C address (ADDR pin low)
+BH1750_ADDR = 0x23
+
+# Opcodes
+POWER_DOWN = 0x00
+POWER_ON = 0x01
+RESET = 0x07
+CONT_H_RES = 0x10    # 1 lx resolution
+CONT_H_RES2 = 0x11   # 0.5 lx resolution
+CONT_L_RES = 0x13    # 4 lx resolution
+MTREG_HIGH = 0x40    # | MTreg[7:5]
+MTREG_LOW = 0x60     # | MTreg[4:0]
+
+# Measurement time register (sensitivity)
+MTREG_DEFAULT = 69
+MTREG_MIN = 31
+MTREG_MAX = 254
+
+# Worst-case integration time at the default MTreg, seconds
+INTEGRATION_TIME = {CONT_H_RES: 0.180, CONT_H_RES2: 0.180, CONT_L_RES: 0.024}
+
+# Adaptive ranges, least to most sensitive: (name, mode, MTreg)
+RANGES = [
+    ("bright", CONT_H_RES, MTREG_MIN),       # up to ~120k lx
+    ("normal", CONT_H_RES, MTREG_DEFAULT),   # up to ~55k lx, 1 lx steps
+    ("dark", CONT_H_RES2, MTREG_MAX),        # ~0.11 lx steps
+]
+
+# Raw count thresholds for switching range
+SATURATED = 0xFFF0
+TOO_DARK = 10
+LEAVE_DARK = 40000
+LEAVE_BRIGHT = 10000
+
+
+class BH1750Error(Exception):
+    """The BH1750 did not respond or returned unusable data"""
+
+
+class BH1750:
+    """Continuous-mode BH1750 on an open SMBus"""
+
+    def __init__(self, bus, addr=BH1750_ADDR, adaptive=True, range_name="normal"):
+        self.bus = bus
+        self.addr = addr
+        self.adaptive = adaptive
+        self._range = [r[0] for r in RANGES].index(range_name)
+        self._configured = False
+        self._ready_at = 0.0
+        self._last_read = None
+        self._last_lux = None
+
+    @property
+    def range_name(self):
+        return RANGES[self._range][0]
+
+    @property
+    def integration_time(self):
+        """Seconds per continuous-mode measurement in the current range"""
+        _, mode, mtreg = RANGES[self._range]
+        return INTEGRATION_TIME[mode] * mtreg / MTREG_DEFAULT
+
+    def configure(self):
+        """Power on, set MTreg and start continuous measurement"""
+        _, mode, mtreg = RANGES[self._range]
+        try:
+            self.bus.write_byte(self.addr, POWER_ON)
+            self.bus.write_byte(self.addr, MTREG_HIGH | (mtreg >> 5))
+            self.bus.write_byte(self.addr, MTREG_LOW | (mtreg & 0x1F))
+            self.bus.write_byte(self.addr, mode)
+        except OSError as e:
+            self._configured = False
+            raise BH1750Error(f"BH1750 at 0x{self.addr:02x} configure failed: {e}") from e
+
+        self._configured = True
+        self._ready_at = time.monotonic() + self.integration_time
+        self._last_read = None
+
+    def _read_raw(self):
+        mode = RANGES[self._range][1]
+        try:
+            if hasattr(self.bus, "i2c_rdwr"):
+                # smbus2: plain 2-byte read, measurement keeps running
+                from smbus2 import i2c_msg
+                msg = i2c_msg.read(self.addr, 2)
+                self.bus.i2c_rdwr(msg)
+                data = list(msg)
+            else:
+                # python-smbus can't do a bare read; re-sending the mode
+                # opcode returns the last result and restarts integration
+                data = self.bus.read_i2c_block_data(self.addr, mode, 2)
+                self._ready_at = time.monotonic() + self.integration_time
+        except OSError as e:
+            self._configured = False
+            raise BH1750Error(f"BH1750 at 0x{self.addr:02x} read failed: {e}") from e
+
+        if len(data) != 2:
+            raise BH1750Error(f"BH1750 at 0x{self.addr:02x} returned {len(data)} bytes")
+        return data[0] << 8 | data[1]
+
+    def _to_lux(self, raw):
+        _, mode, mtreg = RANGES[self._range]
+        lux = raw / 1.2 * MTREG_DEFAULT / mtreg
+        if mode == CONT_H_RES2:
+            lux /= 2
+        return lux
+
+    def _adapt(self, raw):
+        """Step to a neighbouring range; True if the reading is unusable"""
+        step = 0
+        if raw >= SATURATED and self._range > 0:
+            step = -1
+        elif raw < TOO_DARK and self._range < len(RANGES) - 1:
+            step = 1
+        elif self.range_name == "dark" and raw > LEAVE_DARK:
+            step = -1
+        elif self.range_name == "bright" and raw < LEAVE_BRIGHT:
+            step = 1
+        if not step:
+            return False
+
+        self._range += step
+        self.configure()
+        return raw >= SATURATED
+
+    def fresh(self):
+        """True if a new integration has finished since the last read"""
+        now = time.monotonic()
+        if now < self._ready_at:
+            return False
+        return self._last_read is None or now - self._last_read >= self.integration_time
+
+    def read(self):
+        """Light level in lux
+
+        Returns immediately with the latest completed measurement; only the
+        first read after (re)configuring waits for an integration to finish.
+        Raises BH1750Error on bus errors or a saturated sensor.
+        """
+        if not self._configured:
+            self.configure()
+
+        for _ in range(len(RANGES)):
+            if self._last_lux is not None and not self.fresh():
+                return self._last_lux
+
+            delay = self._ready_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            raw = self._read_raw()
+            lux = self._to_lux(raw)
+            self._last_read = time.monotonic()
+
+            if not (self.adaptive and self._adapt(raw)):
+                if raw >= SATURATED:
+                    raise BH1750Error(f"BH1750 at 0x{self.addr:02x} saturated")
+                self._last_lux = lux
+                return lux
+            self._last_lux = None  # Saturated; re-read in the new range
+
+        raise BH1750Error(f"BH1750 at 0x{self.addr:02x} saturated in every range")
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+BMP280 helpers shared by enviropi_logger.py and read_bmp280.py
+Calibration is read as one 24-byte block, decoded with struct and cached
+in memory and on disk (keyed by address and chip ID). Measurements use
+forced mode and poll the status register instead of sleeping blindly
+"""
+
+import json
+import os
+import struct
+import time
+from pathlib import Path
+
+# BMP280 I2C address
+BMP280_ADDR = 0x76
+
+# Registers
+REG_DIG_T1 = 0x88
+REG_CHIPID = 0xD0
+REG_STATUS = 0xF3
+REG_CONTROL = 0xF4
+REG_CONFIG = 0xF5
+REG_PRESS_MSB = 0xF7
+REG_TEMP_MSB = 0xFA
+
+# Status register: set while a conversion is running
+STATUS_MEASURING = 0x08
+
+# Power modes (low 2 bits of REG_CONTROL)
+MODE_SLEEP = 0x00
+MODE_FORCED = 0x01
+MODE_NORMAL = 0x03
+
+# Oversampling factor -> osrs_t / osrs_p register code
+OVERSAMPLING = {0: 0, 1: 1, 2: 2, 4: 3, 8: 4, 16: 5}
+
+# (temperature, pressure) oversampling, datasheet table 7 names
+PROFILES = {
+    "ultra_low": (1, 1),     # ~5.5 ms
+    "low": (1, 2),           # ~7.5 ms
+    "standard": (1, 4),      # ~11.5 ms
+    "high": (1, 8),          # ~19.5 ms
+    "ultra_high": (2, 16),   # ~37.5 ms
+    "enviropi": (4, 4),      # What the loggers always used (0x6F)
+}
+
+# How often to re-check the measuring bit once the typical time has passed
+POLL_INTERVAL = 0.0005
+
+# dig_T1..dig_P9: little-endian, T1 and P1 unsigned, the rest signed
+CAL_FORMAT = "<HhhHhhhhhhhh"
+CAL_SIZE = struct.calcsize(CAL_FORMAT)
+
+# Calibration trim values are fixed at the factory, so keep them across runs
+CAL_CACHE_DIR = Path(os.environ.get("ENVIROPI_CACHE_DIR", "/home/enviropi/.cache/enviropi"))
+
+_cal_cache = {}
+
+
+def decode_calibration(block):
+    """Decode the 24-byte trim block into (dig_T1, ..., dig_P9)"""
+    return struct.unpack(CAL_FORMAT, bytes(block))
+
+
+def _cal_cache_file(addr, chip_id, cache_dir):
+    return Path(cache_dir) / f"bmp280_{addr:02x}_chip{chip_id:02x}.json"
+
+
+def read_calibration(bus, addr=BMP280_ADDR, cache_dir=CAL_CACHE_DIR):
+    """Calibration for the sensor at addr, read from the chip at most once"""
+    if addr in _cal_cache:
+        return _cal_cache[addr]
+
+    chip_id = bus.read_byte_data(addr, REG_CHIPID)
+    cache_file = _cal_cache_file(addr, chip_id, cache_dir) if cache_dir else None
+
+    cal = None
+    if cache_file is not None and cache_file.exists():
+        try:
+            with open(cache_file, 'r') as f:
+                cal = tuple(json.load(f)["cal"])
+            if len(cal) != len(CAL_FORMAT) - 1:
+                cal = None
+        except (ValueError, KeyError, TypeError, OSError):
+            cal = None  # Corrupt cache - fall back to the chip
+
+    if cal is None:
+        block = bus.read_i2c_block_data(addr, REG_DIG_T1, CAL_SIZE)
+        cal = decode_calibration(block)
+        if cache_file is not None:
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(cache_file, 'w') as f:
+                    json.dump({"chip_id": chip_id, "cal": cal}, f)
+            except OSError as e:
+                print(f"BMP280 calibration cache not written: {e}")
+
+    _cal_cache[addr] = cal
+    return cal
+
+
+def measurement_time(osrs_t, osrs_p, typical=False):
+    """Conversion time in seconds for the given oversampling (datasheet 3.8.1)"""
+    if typical:
+        ms = 1.0 + 2.0 * osrs_t + (2.0 * osrs_p + 0.5 if osrs_p else 0.0)
+    else:
+        ms = 1.25 + 2.3 * osrs_t + (2.3 * osrs_p + 0.575 if osrs_p else 0.0)
+    return ms / 1000.0
+
+
+def ctrl_meas(osrs_t, osrs_p, mode=MODE_FORCED):
+    """Build the REG_CONTROL byte for an oversampling pair"""
+    return (OVERSAMPLING[osrs_t] << 5) | (OVERSAMPLING[osrs_p] << 2) | mode
+
+
+def read_forced(bus, profile="standard", addr=BMP280_ADDR):
+    """Trigger one forced-mode conversion and return raw (adc_t, adc_p)
+
+    Sleeps for the typical conversion time of the profile, then polls the
+    status register's measuring bit so the data is read as soon as it is
+    ready. Raises TimeoutError if the chip is still busy well past the
+    datasheet maximum.
+    """
+    osrs_t, osrs_p = PROFILES[profile] if isinstance(profile, str) else profile
+
+    bus.write_byte_data(addr, REG_CONTROL, ctrl_meas(osrs_t, osrs_p))
+    start = time.monotonic()
+    deadline = start + 2 * measurement_time(osrs_t, osrs_p) + 0.005
+    time.sleep(measurement_time(osrs_t, osrs_p, typical=True))
+
+    while bus.read_byte_data(addr, REG_STATUS) & STATUS_MEASURING:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"BMP280 at 0x{addr:02x} still measuring after "
+                               f"{(time.monotonic() - start) * 1000:.1f} ms")
+        time.sleep(POLL_INTERVAL)
+
+    data = bus.read_i2c_block_data(addr, REG_PRESS_MSB, 6)
+    return parse_raw(data)
+
+
+def parse_raw(data):
+    """Split the 6-byte F7..FC burst into 20-bit (adc_t, adc_p)"""
+    adc_p = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
+    adc_t = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
+    return (adc_t, adc_p)
+
+
+def compensate_temp(adc_t, cal):
+    """Compensate temperature"""
+    dig_T1, dig_T2, dig_T3 = cal[0], cal[1], cal[2]
+    
+    var1 = ((adc_t / 16384.0) - (dig_T1 / 1024.0)) * dig_T2
+    var2 = (((adc_t / 131072.0) - (dig_T1 / 8192.0)) ** 2) * dig_T3
+    t_fine = int(var1 + var2)
+    temp = (var1 + var2) / 5120.0
+    
+    return (temp, t_fine)
+
+
+def compensate_pressure(adc_p, t_fine, cal):
+    """Compensate pressure"""
+    dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = cal[3:12]
+    
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * dig_P6 / 32768.0
+    var2 = var2 + var1 * dig_P5 * 2.0
+    var2 = var2 / 4.0 + dig_P4 * 65536.0
+    var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * dig_P1
+    
+    if var1 == 0:
+        return 0
+    
+    pressure = 1048576.0 - adc_p
+    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+    var1 = dig_P9 * pressure * pressure / 2147483648.0
+    var2 = pressure * dig_P8 / 32768.0
+    pressure = pressure + (var1 + var2 + dig_P7) / 16.0
+    
+    return pressure / 100.0  # Convert to hPa
+
+
+def compensate_batch(adc_t, adc_p, cal):
+    """Vectorized compensate_temp/compensate_pressure over NumPy arrays
+
+    Returns (temperature_c, pressure_hpa) float64 arrays. Same float
+    formulas as the scalar functions, so results match them exactly.
+    """
+    import numpy as np
+
+    adc_t = np.asarray(adc_t, dtype=np.float64)
+    adc_p = np.asarray(adc_p, dtype=np.float64)
+    dig_T1, dig_T2, dig_T3 = cal[0], cal[1], cal[2]
+    dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = cal[3:12]
+
+    var1 = ((adc_t / 16384.0) - (dig_T1 / 1024.0)) * dig_T2
+    var2 = (((adc_t / 131072.0) - (dig_T1 / 8192.0)) ** 2) * dig_T3
+    t_fine = np.trunc(var1 + var2)
+    temp = (var1 + var2) / 5120.0
+
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * dig_P6 / 32768.0
+    var2 = var2 + var1 * dig_P5 * 2.0
+    var2 = var2 / 4.0 + dig_P4 * 65536.0
+    var1 = (dig_P3 * var1 * var1 / 524288.0 + dig_P2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * dig_P1
+
+    valid = var1 != 0
+    safe_var1 = np.where(valid, var1, 1.0)
+    pressure = 1048576.0 - adc_p
+    pressure = ((pressure - var2 / 4096.0) * 6250.0) / safe_var1
+    var1 = dig_P9 * pressure * pressure / 2147483648.0
+    var2 = pressure * dig_P8 / 32768.0
+    pressure = pressure + (var1 + var2 + dig_P7) / 16.0
+    pressure = np.where(valid, pressure / 100.0, 0.0)
+
+    return (temp, pressure)
+
+
+def _c_div(a, b):
+    """Integer division truncating toward zero, like C"""
+    import numpy as np
+
+    q = np.abs(a) // np.abs(b)
+    return np.where((a < 0) != (b < 0), -q, q)
+
+
+def compensate_batch_int(adc_t, adc_p, cal):
+    """Datasheet fixed-point compensation over NumPy arrays
+
+    Port of bmp280_compensate_T_int32 and bmp280_compensate_P_int64 from
+    the Bosch datasheet (section 3.11.3), done in int64. Returns
+    (temperature_c, pressure_hpa) as float64 arrays converted from the
+    0.01 degC and Q24.8 Pa fixed-point results.
+    """
+    import numpy as np
+
+    adc_t = np.asarray(adc_t, dtype=np.int64)
+    adc_p = np.asarray(adc_p, dtype=np.int64)
+    dig_T1, dig_T2, dig_T3 = (np.int64(c) for c in cal[0:3])
+    dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = (
+        np.int64(c) for c in cal[3:12])
+
+    var1 = (((adc_t >> 3) - (dig_T1 << 1)) * dig_T2) >> 11
+    var2 = (((((adc_t >> 4) - dig_T1) * ((adc_t >> 4) - dig_T1)) >> 12) * dig_T3) >> 14
+    t_fine = var1 + var2
+    temp = (t_fine * 5 + 128) >> 8
+
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * dig_P6
+    var2 = var2 + ((var1 * dig_P5) << 17)
+    var2 = var2 + (dig_P4 << 35)
+    var1 = ((var1 * var1 * dig_P3) >> 8) + ((var1 * dig_P2) << 12)
+    var1 = (((np.int64(1) << 47) + var1) * dig_P1) >> 33
+
+    valid = var1 != 0
+    safe_var1 = np.where(valid, var1, 1)
+    p = 1048576 - adc_p
+    p = _c_div(((p << 31) - var2) * 3125, safe_var1)
+    var1 = (dig_P9 * (p >> 13) * (p >> 13)) >> 25
+    var2 = (dig_P8 * p) >> 19
+    p = ((p + var1 + var2) >> 8) + (dig_P7 << 4)
+    p = np.where(valid, p, 0)
+
+    return (temp / 100.0, p / 25600.0)
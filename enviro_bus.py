@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Sample Bus
+One process reads the sensors and publishes each reading into a
+shared-memory ring buffer; the display and the logger read from it
+instead of opening the I2C devices themselves
+
+Usage: python3 enviro_bus.py [--interval SECONDS]
+"""
+
+import argparse
+import math
+import mmap
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+
+import enviro_daemon
+import enviro_storage
+
+# Shared-memory file (tmpfs, never touches the SD card)
+SHM_PATH = Path("/dev/shm/enviropi_samples")
+
+# Fixed record layout; bump LAYOUT_VERSION whenever FIELDS changes
+FIELDS = [
+    "temperature_c", "pressure_hpa", "humidity_pct", "light_lux",
+    "noise_low", "noise_mid", "noise_high", "noise_amp",
+    "noise_low_peak", "noise_mid_peak", "noise_high_peak", "noise_peak",
+    "pm1_ug_m3", "pm25_ug_m3", "pm10_ug_m3",
+]
+LAYOUT_VERSION = 3
+
+# Each record's noise and PM values cover one sampler interval; combining
+# records into a longer interval energy-averages the Leq levels (dBFS),
+# takes the loudest peak and averages the particulates. Everything else
+# is an instantaneous value, taken from the newest record.
+LEQ_FIELDS = ["noise_low", "noise_mid", "noise_high", "noise_amp"]
+PEAK_FIELDS = ["noise_low_peak", "noise_mid_peak", "noise_high_peak", "noise_peak"]
+MEAN_FIELDS = ["pm1_ug_m3", "pm25_ug_m3", "pm10_ug_m3"]
+MAGIC = b"ENVP"
+
+# magic, layout version, capacity, record size, records published
+HEADER = struct.Struct("<4sIIIQ")
+HEADER_SIZE = 64
+# sequence number (0 while being written), timestamp in us, float32 values
+RECORD = struct.Struct("<Qq" + "f" * len(FIELDS))
+
+CAPACITY = 1024
+
+# Readings older than this are treated as "sampler not running"
+MAX_AGE = 30
+
+
+class SampleRing:
+    """Single-producer, many-reader ring of fixed-size reading records"""
+
+    def __init__(self, path=SHM_PATH, capacity=CAPACITY, create=False):
+        self.path = Path(path)
+        size = HEADER_SIZE + capacity * RECORD.size
+
+        if create:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                self._mm = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            existing = HEADER.unpack_from(self._mm, 0)
+            if existing[:4] != (MAGIC, LAYOUT_VERSION, capacity, RECORD.size):
+                self._mm[:size] = bytes(size)
+                HEADER.pack_into(self._mm, 0, MAGIC, LAYOUT_VERSION, capacity, RECORD.size, 0)
+        else:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                self._mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+            magic, version, capacity, record_size, _ = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != LAYOUT_VERSION or record_size != RECORD.size:
+                self._mm.close()
+                raise ValueError(f"{self.path} has an incompatible sample layout")
+
+        self.capacity = capacity
+
+    def close(self):
+        self._mm.close()
+
+    @property
+    def head(self):
+        """Number of records published so far"""
+        return HEADER.unpack_from(self._mm, 0)[4]
+
+    def _offset(self, seq):
+        return HEADER_SIZE + ((seq - 1) % self.capacity) * RECORD.size
+
+    def publish(self, reading):
+        """Write a reading dict into the next slot"""
+        seq = self.head + 1
+        offset = self._offset(seq)
+        values = [reading.get(field) for field in FIELDS]
+        values = [math.nan if v is None else v for v in values]
+        ts = enviro_storage.timestamp_us(reading["timestamp"])
+
+        # Mark the slot busy, fill it, then publish the sequence number
+        struct.pack_into("<Q", self._mm, offset, 0)
+        RECORD.pack_into(self._mm, offset, 0, ts, *values)
+        struct.pack_into("<Q", self._mm, offset, seq)
+        struct.pack_into("<Q", self._mm, 16, seq)
+        return seq
+
+    def read(self, seq):
+        """Reading published as seq, or None if overwritten or mid-write"""
+        if seq < 1 or seq > self.head or self.head - seq >= self.capacity:
+            return None
+        offset = self._offset(seq)
+        record = RECORD.unpack_from(self._mm, offset)
+        if record[0] != seq or struct.unpack_from("<Q", self._mm, offset)[0] != seq:
+            return None
+
+        reading = {"timestamp": enviro_storage.from_timestamp_us(record[1])}
+        for field, value in zip(FIELDS, record[2:]):
+            reading[field] = None if math.isnan(value) else round(value, 2)
+        return reading
+
+    def latest(self):
+        """Most recently published reading, or None"""
+        for _ in range(3):
+            reading = self.read(self.head)
+            if reading is not None:
+                return reading
+        return None
+
+    def read_since(self, seq):
+        """Readings published after seq, and the new position"""
+        head = self.head
+        start = max(seq + 1, head - self.capacity + 1, 1)
+        readings = [self.read(s) for s in range(start, head + 1)]
+        return [r for r in readings if r is not None], head
+
+
+def energy_mean(levels):
+    """Leq (dB) of several equal-length intervals, from their Leq values"""
+    return 10 * math.log10(sum(10 ** (level / 10) for level in levels) / len(levels))
+
+
+def aggregate(readings):
+    """One reading covering all of the given (time-ordered) records"""
+    reading = dict(readings[-1])
+    for field in LEQ_FIELDS + PEAK_FIELDS + MEAN_FIELDS:
+        values = [r[field] for r in readings if r.get(field) is not None]
+        if not values:
+            reading[field] = None
+        elif field in LEQ_FIELDS:
+            reading[field] = round(energy_mean(values), 2)
+        elif field in PEAK_FIELDS:
+            reading[field] = max(values)
+        else:
+            reading[field] = round(sum(values) / len(values), 1)
+    return reading
+
+
+_ring = None
+
+def _open_ring(path):
+    global _ring
+    if _ring is None:
+        _ring = SampleRing(path)
+    return _ring
+
+
+def _fresh(reading, max_age):
+    if reading is None:
+        return False
+    age = datetime.now() - datetime.fromisoformat(reading["timestamp"])
+    return age.total_seconds() <= max_age
+
+
+def latest_reading(max_age=MAX_AGE, path=SHM_PATH):
+    """Latest reading from a running sampler, or None if it isn't running"""
+    global _ring
+    try:
+        reading = _open_ring(path).latest()
+    except (OSError, ValueError):
+        _ring = None
+        return None
+    return reading if _fresh(reading, max_age) else None
+
+
+def interval_reading(since, max_age=MAX_AGE, path=SHM_PATH):
+    """Reading aggregated over every record after since (naive ISO), for a
+    logger that samples less often than the sampler publishes; None if
+    the sampler isn't running"""
+    global _ring
+    try:
+        ring = _open_ring(path)
+        records, _ = ring.read_since(0)
+    except (OSError, ValueError):
+        _ring = None
+        return None
+    records = [r for r in records if r["timestamp"] > since]
+    if not records or not _fresh(records[-1], max_age):
+        return None
+    return aggregate(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi sampler - publishes readings to shared memory")
+    parser.add_argument("--interval", type=float, default=5,
+                        help="seconds between samples (default: 5)")
+    args = parser.parse_args()
+
+    # Only the sampler touches the sensors
+    import enviroplus_logger
+
+    ring = SampleRing(create=True)
+
+    def sample():
+        try:
+            ring.publish(enviroplus_logger.read_sensors())
+        except Exception as e:
+            print(f"Sampler error: {e}")
+
+    print(f"EnviroPi sampler - publishing to {SHM_PATH} every {args.interval:g}s")
+    try:
+        enviro_daemon.run_every(args.interval, sample)
+    except KeyboardInterrupt:
+        print("\nSampler stopped.")
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()
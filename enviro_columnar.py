@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Columnar Day Files
+A compact binary layout for finished days (enviro_YYYY-MM-DD.col): an int64
+microsecond time column, one float32 column per metric with NaN for None,
+and a sparse time index, all read through numpy.memmap. Range queries and
+whole-day statistics touch only the columns and rows they need, with no
+JSON parsing, and a day converts back to exactly the readings it came from.
+
+Columnar and archive files coexist per day: converting an archived day
+takes the archive's readings into the .col, then removes the archive, and
+anything logged for the day later is archived at rollover as usual. Either
+way the day is kept for the archive retention period.
+
+Usage: python3 enviro_columnar.py [--replace] DAY [DAY ...]   Convert (and verify) days
+       python3 enviro_columnar.py --all [--replace]           Every finished day
+       python3 enviro_columnar.py --stats DAY                 Day statistics from the columns
+
+File layout:
+  "ENVC" | version (u16) | header length (u32) | JSON header | columns (8-byte aligned)
+The header lists each column's name, dtype and offset, the sparse index
+(every INDEX_STRIDE-th timestamp) and any values that aren't numeric.
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+MAGIC = b"ENVC"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+
+# One index entry per this many rows: a range lookup bisects the index,
+# then at most this many timestamps
+INDEX_STRIDE = 64
+
+# Per-row state of a field that isn't in every reading, or can be null as a whole
+MISSING, NULL, PRESENT = 0, 1, 2
+
+
+def col_file(day, data_dir=DATA_DIR):
+    """Path of the columnar file for a day"""
+    return Path(data_dir) / f"enviro_{day}.col"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _float_dtype(values):
+    """float32 if every value comes back unchanged from it, else float64"""
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, int):
+            if abs(v) > 2 ** 24:
+                return "<f8"
+        elif float(str(np.float32(v))) != v and not math.isnan(v):
+            return "<f8"
+    return "<f4"
+
+
+def _numeric_column(arrays, column, values):
+    """Store a numeric column; a float column that also holds ints (45 as well
+    as 45.5) gets a "#int" flag per row so they come back as ints"""
+    name = column["name"]
+    column["kind"] = "int" if all(v is None or isinstance(v, int) for v in values) else "float"
+    arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=_float_dtype(values))
+    if column["kind"] == "float" and any(isinstance(v, int) for v in values):
+        arrays[name + "#int"] = np.array([isinstance(v, int) for v in values], dtype="u1")
+        column["ints"] = name + "#int"
+    return column
+
+
+def encode(readings):
+    """(header, {column name: array}) for a list of readings"""
+    rows = len(readings)
+    fields = []
+    for reading in readings:
+        for name in reading:
+            if name not in fields and name != "timestamp":
+                fields.append(name)
+
+    times = np.array([enviro_storage.timestamp_us(r["timestamp"]) for r in readings], dtype="<i8")
+    arrays = {"timestamp": times}
+    columns = [{"name": "timestamp", "kind": "time"}]
+    extras = {}
+
+    for name in fields:
+        values = [r.get(name) for r in readings]
+        state = np.array([PRESENT if name in r and r[name] is not None else NULL if name in r else MISSING
+                          for r in readings], dtype="u1")
+        present = [v for v in values if v is not None]
+        keys = None
+        if all(isinstance(v, dict) for v in present) and present:
+            keys = list(present[0])
+            if not all(list(v) == keys and all(x is None or _is_number(x) for x in v.values()) for v in present):
+                keys = None
+
+        if all(_is_number(v) for v in present):
+            column = _numeric_column(arrays, {"name": name, "field": name}, values)
+            if (state == MISSING).any():
+                arrays[name + "#state"] = state
+                column["state"] = name + "#state"
+            columns.append(column)
+        elif keys is not None:
+            arrays[name + "#state"] = state
+            columns.append({"name": name + "#state", "field": name, "kind": "dict", "keys": keys})
+            for key in keys:
+                columns.append(_numeric_column(arrays, {"name": f"{name}.{key}", "field": name, "key": key},
+                                               [v[key] if v else None for v in values]))
+        else:
+            # Strings and other shapes stay as JSON values, by row
+            extras[name] = {str(i): v for i, (v, s) in enumerate(zip(values, state)) if s != MISSING}
+
+    sorted_times = bool(rows < 2 or (np.diff(times) >= 0).all())
+    header = {
+        "rows": rows,
+        "sorted": sorted_times,
+        "index_stride": INDEX_STRIDE,
+        "index": times[::INDEX_STRIDE].tolist() if sorted_times else [],
+        "columns": columns,
+        "extras": extras,
+    }
+    return header, arrays
+
+
+def write(readings, path, covers=None, archive=None):
+    """Write readings as a columnar file (atomically)
+
+    covers={"bytes": n, "first": line} records that the readings include
+    the first n bytes of the day file starting with that line, so readers
+    carry on from there instead of reading them twice. archive={"bytes": n}
+    records that they include the day's archive while it is that size.
+    """
+    header, arrays = encode(readings)
+    if covers:
+        header["covers"] = covers
+    if archive:
+        header["archive"] = archive
+    offset = 0
+    layout = []
+    for name, array in arrays.items():
+        layout.append({"name": name, "dtype": array.dtype.str, "offset": offset})
+        offset += array.nbytes
+        offset += -offset % 8
+    header["layout"] = layout
+
+    meta = json.dumps(header, separators=(",", ":")).encode()
+    start = PREAMBLE.size + len(meta)
+    start += -start % 8
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(meta)))
+        f.write(meta)
+        f.write(b"\0" * (start - PREAMBLE.size - len(meta)))
+        for entry in layout:
+            f.seek(start + entry["offset"])
+            f.write(arrays[entry["name"]].tobytes())
+    os.replace(tmp, path)
+    return path.stat().st_size
+
+
+class ColumnarDay:
+    """Memory-mapped reader for one .col file
+
+    Columns are mapped lazily, so reading the temperature of a day never
+    touches the pressure column's pages.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            magic, version, length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: not a version {VERSION} columnar day file")
+            self.header = json.loads(f.read(length))
+        self.rows = self.header["rows"]
+        start = PREAMBLE.size + length
+        self._data_start = start + (-start % 8)
+        self._layout = {entry["name"]: entry for entry in self.header["layout"]}
+        self._maps = {}
+
+    def covered_bytes(self, day_path):
+        """How much of a day file this .col already holds (0 if it's another file)"""
+        covers = self.header.get("covers")
+        if not covers:
+            return 0
+        try:
+            with open(day_path, 'rb') as f:
+                first = f.readline()
+                size = f.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return 0
+        if first.decode(errors="replace") != covers["first"] or size < covers["bytes"]:
+            return 0   # Day file removed and started again by a late write
+        return covers["bytes"]
+
+    def holds_archive(self, archive_path):
+        """Whether this .col already holds every reading in the day's archive"""
+        archive = self.header.get("archive")
+        try:
+            return bool(archive) and Path(archive_path).stat().st_size == archive["bytes"]
+        except FileNotFoundError:
+            return False
+
+    @property
+    def fields(self):
+        """Metric fields in first-seen order"""
+        names = [c["field"] for c in self.header["columns"] if "field" in c]
+        return list(dict.fromkeys(names)) + list(self.header["extras"])
+
+    def column(self, name):
+        """A column as a read-only memmap (timestamp, metric, or "field.key")"""
+        if name not in self._maps:
+            entry = self._layout[name]
+            if not self.rows:
+                self._maps[name] = np.zeros(0, dtype=entry["dtype"])
+            else:
+                self._maps[name] = np.memmap(self.path, dtype=entry["dtype"], mode="r",
+                                             offset=self._data_start + entry["offset"], shape=(self.rows,))
+        return self._maps[name]
+
+    @property
+    def times(self):
+        return self.column("timestamp")
+
+    def row_range(self, start=None, end=None):
+        """(first, last) row indices with start <= time < end (µs or naive ISO)"""
+        if isinstance(start, str):
+            start = enviro_storage.timestamp_us(start)
+        if isinstance(end, str):
+            end = enviro_storage.timestamp_us(end)
+        if not self.header["sorted"]:
+            raise ValueError(f"{self.path}: rows are not in time order")
+        return self._bound(start, 0), self._bound(end, self.rows)
+
+    def _bound(self, t, default):
+        """First row with time >= t, via the sparse index then one block"""
+        if t is None:
+            return default
+        index, stride = self.header["index"], self.header["index_stride"]
+        block = max(0, int(np.searchsorted(index, t, side="left")) - 1)
+        lo = block * stride
+        hi = min(self.rows, lo + 2 * stride)
+        return lo + int(np.searchsorted(self.times[lo:hi], t, side="left"))
+
+    def values(self, name, start=None, end=None):
+        """A metric's values (NaN for None/missing) for a time range"""
+        lo, hi = self.row_range(start, end) if start is not None or end is not None else (0, self.rows)
+        return self.column(name)[lo:hi]
+
+    def stats(self, name, start=None, end=None):
+        """count/mean/min/max/stddev of a metric, ignoring NaN"""
+        values = np.asarray(self.values(name, start, end))
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {"count": 0, "mean": None, "min": None, "max": None, "stddev": 0.0}
+        wide = values.astype(np.float64)
+        return {
+            "count": int(len(values)),
+            "mean": float(wide.mean()),
+            "min": float(str(values.min())),
+            "max": float(str(values.max())),
+            "stddev": float(wide.std(ddof=1)) if len(values) > 1 else 0.0,
+        }
+
+    @staticmethod
+    def _decode(column, array):
+        """Column values as Python numbers (None for NaN)"""
+        if column["kind"] == "int":
+            return [None if v != v else int(v) for v in array.tolist()]
+        # Shortest repr that round-trips the stored width: 1006.53, not 1006.530029296875
+        return [None if v == "nan" else float(v) for v in np.asarray(array).astype(str)]
+
+    def readings(self, start=None, end=None):
+        """Rows back as reading dicts, exactly as they were logged"""
+        lo, hi = self.row_range(start, end) if start is not None or end is not None else (0, self.rows)
+        times = self.times[lo:hi].tolist()
+        decoded = []
+        for column in self.header["columns"][1:]:
+            array = self.column(column["name"])[lo:hi]
+            values = array.tolist() if column["kind"] == "dict" else self._decode(column, array)
+            if "ints" in column:
+                flags = self.column(column["ints"])[lo:hi].tolist()
+                values = [int(v) if flag and v is not None else v for v, flag in zip(values, flags)]
+            state = self.column(column["state"])[lo:hi].tolist() if "state" in column else None
+            decoded.append((column, values, state))
+        extras = self.header["extras"]
+
+        out = []
+        for i in range(hi - lo):
+            reading = {"timestamp": enviro_storage.from_timestamp_us(times[i])}
+            for column, values, state in decoded:
+                field = column["field"]
+                if column["kind"] == "dict":
+                    if values[i] == NULL:
+                        reading[field] = None
+                    elif values[i] == PRESENT:
+                        reading[field] = {}
+                elif "key" in column:
+                    if isinstance(reading.get(field), dict):
+                        reading[field][column["key"]] = values[i]
+                elif state is None or state[i] != MISSING:
+                    reading[field] = values[i]
+            for name, by_row in extras.items():
+                if str(lo + i) in by_row:
+                    reading[name] = by_row[str(lo + i)]
+            out.append(reading)
+        return out
+
+    def close(self):
+        self._maps = {}
+
+
+def convert_day(day, data_dir=DATA_DIR, replace=False):
+    """Write a day's .col file and check it round-trips; returns (json bytes, col bytes)
+
+    With replace=True the JSON Lines file is removed afterwards, but only
+    once the rollups have consumed it. The .col records how much of the day
+    file it holds, so lines logged later are still read from there. An
+    archived day's archive is taken into the .col and then removed.
+    """
+    import enviro_archive
+    archive = enviro_archive.archive_file(day, data_dir)
+    path = col_file(day, data_dir)
+    if path.exists() and ColumnarDay(path).holds_archive(archive):
+        enviro_archive.remove_archive(day, data_dir)   # Finish an interrupted conversion
+
+    # One snapshot of the day file's complete lines, so the .col records
+    # exactly how much of it it holds even while the logger appends
+    source = enviro_storage.day_file(day, data_dir)
+    data = source.read_bytes() if source.exists() else b""
+    data = data[:data.rfind(b"\n") + 1]
+    skip = ColumnarDay(path).covered_bytes(source) if path.exists() else 0
+
+    readings = list(enviro_storage.iter_readings(day, data_dir, day_file_lines=False))
+    readings += enviro_storage._parse_lines(io.BytesIO(data[skip:]))
+    if not readings:
+        raise ValueError(f"No readings for {day}")
+    covers = {"bytes": len(data), "first": data[:data.find(b"\n") + 1].decode(errors="replace")} if data else None
+    archived = {"bytes": archive.stat().st_size} if archive.exists() else None
+    tmp = path.with_name(path.name + ".new")
+    size = write(readings, tmp, covers, archived)
+    # Compared as JSON: 45 == 45.0 in Python, but not in the day file
+    if json.dumps(ColumnarDay(tmp).readings()) != json.dumps(readings):
+        tmp.unlink()
+        raise ValueError(f"{day}: columnar copy doesn't round-trip; kept JSON only")
+    os.replace(tmp, path)
+    if archived:
+        enviro_archive.remove_archive(day, data_dir)
+
+    json_size = len(data)
+    if replace and data:
+        import enviro_rollup
+        cursor = (enviro_rollup.load_state(data_dir).get("1m", {}).get("source") or {}).get("file", "")
+        if source.name >= cursor:
+            print(f"{day}: not rolled up yet, keeping {source.name}")
+        elif source.stat().st_size != len(data):
+            print(f"{day}: {source.name} grew while converting, keeping it")
+        else:
+            source.unlink()
+    return json_size, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert day files to the columnar format")
+    parser.add_argument("days", nargs="*", metavar="DAY")
+    parser.add_argument("--all", action="store_true", help="every day before today")
+    parser.add_argument("--replace", action="store_true",
+                        help="delete each JSON Lines file once converted, verified and rolled up")
+    parser.add_argument("--stats", metavar="DAY", help="print a converted day's statistics")
+    args = parser.parse_args()
+
+    if args.stats:
+        day = ColumnarDay(col_file(args.stats))
+        fields = [f for f in day.fields if f in day._layout]
+        json.dump({f: day.stats(f) for f in fields}, sys.stdout, indent=2)
+        print()
+        return 0
+
+    days = list(args.days)
+    if args.all:
+        today = datetime.now().strftime("%Y-%m-%d")
+        days += sorted(p.name[7:17] for p in DATA_DIR.glob("enviro_????-??-??.jsonl") if p.name[7:17] < today)
+    if not days:
+        parser.error("give days to convert, or --all")
+
+    status = 0
+    for day in days:
+        try:
+            json_size, size = convert_day(day, DATA_DIR, args.replace)
+            ratio = f" ({size / json_size:.0%} of JSON)" if json_size else ""
+            print(f"{day}: {size} bytes{ratio}")
+        except Exception as e:
+            print(f"{day}: {e}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
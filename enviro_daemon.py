@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Daemon Helpers
+Drift-free sampling loop so the loggers can stay resident instead of
+cold-starting from cron for every sample
+"""
+
+import argparse
+import math
+import signal
+import sys
+import time
+
+import enviro_metrics
+
+
+def next_boundary(interval, now=None):
+    """Next wall-clock time that is a whole multiple of interval"""
+    if now is None:
+        now = time.time()
+    return (math.floor(now / interval) + 1) * interval
+
+
+def run_every(interval, task, align=True):
+    """Call task() every interval seconds until interrupted
+
+    Targets are absolute times, so the time task() takes never accumulates
+    as drift. With align=True samples land on wall-clock boundaries
+    (e.g. :00, :05, :10 for a 300 s interval), matching */5 cron timing.
+    """
+    next_run = next_boundary(interval) if align else time.time()
+
+    while True:
+        delay = next_run - time.time()
+        if delay > interval:
+            # Wall clock stepped backwards (NTP sync) - re-align
+            next_run = next_boundary(interval) if align else time.time()
+            delay = next_run - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        if enviro_metrics.ENABLED:
+            enviro_metrics.observe("enviropi_loop_jitter_seconds", max(0.0, time.time() - next_run),
+                                   enviro_metrics.JITTER_BUCKETS)
+
+        task()
+
+        next_run += interval
+        now = time.time()
+        if next_run <= now:
+            # Overran one or more slots; skip them rather than bursting
+            if enviro_metrics.ENABLED:
+                enviro_metrics.inc("enviropi_loop_skipped_total", math.ceil((now - next_run) / interval))
+            next_run = next_boundary(interval, now) if align else now
+        if enviro_metrics.ENABLED:
+            enviro_metrics.export()
+
+
+def exit_on_sigterm():
+    """Treat SIGTERM (systemctl stop) like a normal exit, so atexit handlers
+    such as the write buffer's final flush still run"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def parse_args(description):
+    """Command line shared by the loggers: one-shot (cron) or --daemon"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay resident and sample on a timer instead of exiting")
+    parser.add_argument("--interval", type=float, default=300,
+                        help="seconds between samples in daemon mode (default: 300)")
+    return parser.parse_args()
+
+
+def main(description, task):
+    """Run task once, or forever on a timer with --daemon"""
+    args = parse_args(description)
+    enviro_metrics.start()
+    if not args.daemon:
+        task()
+        return
+
+    exit_on_sigterm()
+    print(f"{description} - sampling every {args.interval:g}s (Ctrl+C to exit)")
+    try:
+        run_every(args.interval, task)
+    except KeyboardInterrupt:
+        print("\nLogger stopped.")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Fleet Collector
+Pulls readings from several EnviroPi nodes in parallel (each through the
+incremental enviro_sync mirror), merges them into one time-ordered store
+tagged by node, and summarises each room and the whole house
+
+Usage: python3 enviro_fleet.py [--config FILE] [--node NAME=SOURCE[,ROOM]] [--day YYYY-MM-DD]
+
+The config file lists the nodes:
+  {"nodes": [{"name": "living", "source": "enviropi@192.168.2.15", "room": "Living room"}]}
+"""
+
+import argparse
+import heapq
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+import enviro_stats
+import enviro_storage
+import enviro_sync
+
+CONFIG_FILE = Path.home() / ".config" / "enviropi" / "fleet.json"
+
+# Merged store lives alongside the per-node mirrors
+MERGED_DIR = enviro_sync.MIRROR_ROOT / "fleet"
+
+# Nodes pulled at once; collection time stays at roughly the slowest node
+MAX_WORKERS = 8
+
+# Per-node limits
+TIMEOUT = 60
+RETRIES = 2
+RETRY_BACKOFF = 2
+
+
+def load_nodes(path=CONFIG_FILE):
+    with open(path, 'r') as f:
+        nodes = json.load(f)["nodes"]
+    for node in nodes:
+        node.setdefault("room", node["name"])
+    return nodes
+
+
+def parse_node(spec):
+    """NAME=SOURCE[,ROOM] from the command line"""
+    name, _, rest = spec.partition("=")
+    source, _, room = rest.partition(",")
+    if not name or not source:
+        raise argparse.ArgumentTypeError(f"expected NAME=SOURCE[,ROOM], got {spec!r}")
+    return {"name": name, "source": source, "room": room or name}
+
+
+def collect_node(node, mirror_root, timeout=TIMEOUT, retries=RETRIES, backoff=RETRY_BACKOFF,
+                 deadline=None):
+    """Sync one node's mirror, retrying failed attempts with backoff
+
+    node["source"] is a spec for enviro_sync.source_for() or a source object.
+    Nothing is retried, and nothing more is written to the mirror, once
+    `deadline` (a time.monotonic() value) has passed.
+    """
+    source = node["source"]
+    if isinstance(source, str):
+        source = enviro_sync.source_for(source)
+    if isinstance(source, enviro_sync.SSHSource):
+        source.timeout = timeout
+        source.deadline = deadline
+    mirror = Path(mirror_root) / node["name"]
+    for attempt in range(retries + 1):
+        try:
+            return enviro_sync.sync(source, mirror, deadline=deadline)
+        except (OSError, subprocess.TimeoutExpired):
+            delay = backoff * 2 ** attempt
+            if attempt == retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            time.sleep(delay)
+
+
+def collect(nodes, mirror_root=enviro_sync.MIRROR_ROOT, workers=MAX_WORKERS,
+            timeout=TIMEOUT, retries=RETRIES, backoff=RETRY_BACKOFF):
+    """Sync every node concurrently; returns {name: summary or {"error": ...}}
+
+    A node that hasn't finished within its time budget (timeout per attempt,
+    plus backoff) is reported as timed out and doesn't hold up the rest; its
+    worker gets the same deadline, so it stops rather than carrying on
+    writing to the mirror after collect() has returned.
+    """
+    budget = timeout * (retries + 1) + backoff * (2 ** retries - 1)
+    deadline = time.monotonic() + budget
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(nodes))))
+    futures = {pool.submit(collect_node, node, mirror_root, timeout, retries, backoff,
+                           deadline): node["name"] for node in nodes}
+    done, not_done = wait(futures, timeout=budget)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for future, name in futures.items():
+        if future in not_done:
+            results[name] = {"error": f"timed out after {budget:g}s"}
+        elif future.exception() is not None:
+            results[name] = {"error": str(future.exception())}
+        else:
+            results[name] = future.result()
+    return results
+
+
+def _node_readings(node, day, mirror_root):
+    for reading in enviro_storage.iter_readings(day, Path(mirror_root) / node["name"]):
+        if reading.get("timestamp"):
+            yield reading["timestamp"], node["name"], reading
+
+
+def merge_day(nodes, day, mirror_root=enviro_sync.MIRROR_ROOT, merged_dir=MERGED_DIR):
+    """Merge a day across nodes and aggregate it, in a single pass
+
+    Each node's day file is already in time order, so a heap merge yields
+    one time-ordered stream; every reading is written to the merged day
+    file (tagged with its node) and folded into its room's and the house's
+    running aggregates as it goes by.
+    """
+    merged_dir = Path(merged_dir)
+    merged_dir.mkdir(parents=True, exist_ok=True)
+    rooms = {node["name"]: node["room"] for node in nodes}
+    room_aggs = {}
+    house = enviro_stats.new_day(day)
+
+    path = enviro_storage.day_file(day, merged_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    streams = [_node_readings(node, day, mirror_root) for node in nodes]
+    with open(tmp, 'w') as f:
+        for _, name, reading in heapq.merge(*streams, key=lambda item: item[0]):
+            f.write(json.dumps({**reading, "node": name}, separators=(",", ":")) + "\n")
+            room = rooms[name]
+            if room not in room_aggs:
+                room_aggs[room] = enviro_stats.new_day(day)
+            enviro_stats.update(room_aggs[room], reading)
+            enviro_stats.update(house, reading)
+    os.replace(tmp, path)
+
+    report = {
+        "date": day,
+        "rooms": {room: enviro_stats.summary(agg) for room, agg in sorted(room_aggs.items())},
+        "house": enviro_stats.summary(house),
+    }
+    report_path = merged_dir / f"fleet_{day}.stats.json"
+    tmp = report_path.with_name(report_path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, report_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect and merge readings from several EnviroPi nodes")
+    parser.add_argument("--config", type=Path, default=None, help=f"node list (default: {CONFIG_FILE})")
+    parser.add_argument("--node", type=parse_node, action="append", default=[],
+                        help="NAME=SOURCE[,ROOM]; may be repeated")
+    parser.add_argument("--day", help="day to merge and summarise (default: days with new data, and today)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds per ssh call to a node")
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    args = parser.parse_args()
+
+    nodes = list(args.node)
+    if args.config or not nodes:
+        nodes += load_nodes(args.config or CONFIG_FILE)
+
+    results = collect(nodes, workers=args.workers, timeout=args.timeout, retries=args.retries)
+    days = {datetime.now().strftime("%Y-%m-%d")}
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name}: failed - {result['error']}", file=sys.stderr)
+        else:
+            print(f"{name}: {result['readings']} new readings")
+            days.update(result["days"])
+    if args.day:
+        days = {args.day}
+
+    for day in sorted(days):
+        report = merge_day(nodes, day)
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if all("error" in r for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
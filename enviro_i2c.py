@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+EnviroPi I2C bus selection and hardware simulator
+open_bus() returns the real SMBus on the Pi, or a register-level fake when
+ENVIROPI_FAKE_I2C is set (or fake= is passed), so the loggers can run and
+be benchmarked on any Linux machine
+
+  ENVIROPI_FAKE_I2C=1|enviropi|enviroplus   Use the fake bus (board's devices)
+  ENVIROPI_FAKE_I2C_LATENCY=0.0005          Seconds added to every transaction
+  ENVIROPI_FAKE_I2C_FAULT_RATE=0.01         Fraction of transactions that fail
+"""
+
+import errno
+import os
+import random
+import struct
+import time
+from collections import Counter
+
+import enviro_bmp280
+import enviro_metrics
+
+FAKE_ENV = "ENVIROPI_FAKE_I2C"
+LATENCY_ENV = "ENVIROPI_FAKE_I2C_LATENCY"
+FAULT_RATE_ENV = "ENVIROPI_FAKE_I2C_FAULT_RATE"
+
+# Worked example from the Bosch BMP280 datasheet: 25.08 degC, 1006.53 hPa
+BOSCH_CAL = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+BOSCH_ADC_T = 519888
+BOSCH_ADC_P = 415148
+
+# BME280 humidity trim (dig_H1..dig_H6) and raw reading, ~43 %RH at 25 degC
+BME280_HUM_CAL = (75, 362, 0, 324, 0, 30)
+BME280_ADC_H = 28800
+
+
+class RegisterDevice:
+    """Byte-addressed register map with auto-incrementing block access"""
+
+    def __init__(self):
+        self.regs = bytearray(256)
+
+    def read_reg(self, reg):
+        return self.regs[reg]
+
+    def write_reg(self, reg, value):
+        self.regs[reg] = value & 0xFF
+
+    def read(self, reg, length):
+        return [self.read_reg((reg + i) & 0xFF) for i in range(length)]
+
+    def write(self, reg, values):
+        for i, value in enumerate(values):
+            self.write_reg((reg + i) & 0xFF, value)
+
+    def command(self, value):
+        """Single byte written without a register (SMBus send byte)"""
+        self.write_reg(value, 0)
+
+    def receive(self, length):
+        """Bytes read without a register (SMBus receive byte)"""
+        return [0] * length
+
+
+class FakeBMP280(RegisterDevice):
+    """BMP280: chip ID, calibration block, forced/normal mode, ADC registers"""
+
+    CHIP_ID = 0x58
+
+    def __init__(self, adc_t=BOSCH_ADC_T, adc_p=BOSCH_ADC_P, cal=BOSCH_CAL):
+        super().__init__()
+        self.regs[0x88:0x88 + enviro_bmp280.CAL_SIZE] = struct.pack(enviro_bmp280.CAL_FORMAT, *cal)
+        self.regs[enviro_bmp280.REG_CHIPID] = self.CHIP_ID
+        self._busy_until = 0.0
+        self.set_raw(adc_t, adc_p)
+
+    def set_raw(self, adc_t, adc_p):
+        """Set the 20-bit ADC values the next measurement returns"""
+        self.regs[0xF7:0xFA] = bytes([(adc_p >> 12) & 0xFF, (adc_p >> 4) & 0xFF, (adc_p << 4) & 0xF0])
+        self.regs[0xFA:0xFD] = bytes([(adc_t >> 12) & 0xFF, (adc_t >> 4) & 0xFF, (adc_t << 4) & 0xF0])
+
+    def _conversion_time(self):
+        ctrl = self.regs[enviro_bmp280.REG_CONTROL]
+        factors = {code: factor for factor, code in enviro_bmp280.OVERSAMPLING.items()}
+        osrs_t = factors.get(ctrl >> 5, 16)
+        osrs_p = factors.get((ctrl >> 2) & 0x07, 16)
+        return enviro_bmp280.measurement_time(osrs_t, osrs_p, typical=True)
+
+    def write_reg(self, reg, value):
+        if reg == 0xE0 and value == 0xB6:
+            self.regs[0xF2:0xF6] = bytes(4)  # Soft reset
+            return
+        super().write_reg(reg, value)
+        if reg == enviro_bmp280.REG_CONTROL and value & 0x03 in (0x01, 0x02):
+            self._busy_until = time.monotonic() + self._conversion_time()
+
+    def read_reg(self, reg):
+        busy = time.monotonic() < self._busy_until
+        ctrl = self.regs[enviro_bmp280.REG_CONTROL]
+        if not busy and ctrl & 0x03 in (0x01, 0x02):
+            self.regs[enviro_bmp280.REG_CONTROL] = ctrl & ~0x03  # Back to sleep
+        if reg == enviro_bmp280.REG_STATUS:
+            return enviro_bmp280.STATUS_MEASURING if busy else 0
+        return self.regs[reg]
+
+
+class FakeBME280(FakeBMP280):
+    """BME280: BMP280 register map plus humidity trim and ADC"""
+
+    CHIP_ID = 0x60
+
+    def __init__(self, adc_t=BOSCH_ADC_T, adc_p=BOSCH_ADC_P, adc_h=BME280_ADC_H,
+                 cal=BOSCH_CAL, hum_cal=BME280_HUM_CAL):
+        super().__init__(adc_t, adc_p, cal)
+        h1, h2, h3, h4, h5, h6 = hum_cal
+        self.regs[0xA1] = h1
+        self.regs[0xE1:0xE8] = struct.pack(
+            "<hBBBBb", h2, h3, (h4 >> 4) & 0xFF, ((h5 & 0x0F) << 4) | (h4 & 0x0F), (h5 >> 4) & 0xFF, h6)
+        self.set_humidity_raw(adc_h)
+
+    def set_humidity_raw(self, adc_h):
+        self.regs[0xFD:0xFF] = bytes([(adc_h >> 8) & 0xFF, adc_h & 0xFF])
+
+
+class FakeBH1750(RegisterDevice):
+    """BH1750: opcode-driven, returns counts for a configurable lux level"""
+
+    def __init__(self, lux=250.0):
+        super().__init__()
+        self.lux = lux
+        self.powered = False
+        self.mode = None
+        self.mtreg = 69
+        self._ready_at = 0.0
+
+    def command(self, value):
+        if value == 0x00:
+            self.powered = False
+            self.mode = None
+        elif value == 0x01:
+            self.powered = True
+        elif value & 0xF8 == 0x40:
+            self.mtreg = (self.mtreg & 0x1F) | ((value & 0x07) << 5)
+        elif value & 0xE0 == 0x60:
+            self.mtreg = (self.mtreg & 0xE0) | (value & 0x1F)
+        elif value in (0x10, 0x11, 0x13, 0x20, 0x21, 0x23):
+            self.powered = True
+            self.mode = value
+            integration = 0.024 if value & 0x03 == 0x03 else 0.180
+            self._ready_at = time.monotonic() + integration * self.mtreg / 69
+
+    def receive(self, length):
+        if self.mode is None or time.monotonic() < self._ready_at:
+            return [0] * length
+        raw = self.lux * 1.2 * self.mtreg / 69
+        if self.mode & 0x03 == 0x01:
+            raw *= 2
+        raw = min(int(raw), 0xFFFF)
+        return [raw >> 8, raw & 0xFF][:length]
+
+    def read(self, reg, length):
+        # Block reads send the "register" byte as an opcode first: the sensor
+        # returns its last result and the opcode restarts integration
+        data = self.receive(length)
+        self.command(reg)
+        return data
+
+
+class FakeLTR559(RegisterDevice):
+    """LTR-559: part ID, soft reset, ALS/PS status and data registers"""
+
+    def __init__(self, ch0=1000, ch1=200, proximity=0):
+        super().__init__()
+        self.regs[0x86] = 0x92    # PART_ID: part 0x9, revision 0x2
+        self.regs[0x87] = 0x05    # MANUFACTURER_ID
+        self.regs[0x8C] = 0x05    # ALS_PS_STATUS: new ALS and PS data
+        self.set_raw(ch0, ch1, proximity)
+
+    def set_raw(self, ch0, ch1, proximity=0):
+        self.regs[0x88:0x8C] = bytes([ch1 & 0xFF, ch1 >> 8, ch0 & 0xFF, ch0 >> 8])
+        self.regs[0x8D:0x8F] = bytes([proximity & 0xFF, (proximity >> 8) & 0x07])
+
+    def write_reg(self, reg, value):
+        if reg == 0x80:
+            value &= ~0x02  # Software reset completes immediately
+        super().write_reg(reg, value)
+
+
+def make_board(board):
+    """Devices present on each supported board, by I2C address"""
+    if board == "enviroplus":
+        return {0x76: FakeBME280(), 0x23: FakeLTR559()}
+    if board == "enviropi":
+        return {0x76: FakeBMP280(), 0x23: FakeBH1750()}
+    raise ValueError(f"Unknown board {board!r} (expected 'enviropi' or 'enviroplus')")
+
+
+class FakeSMBus:
+    """Drop-in for smbus.SMBus / smbus2.SMBus backed by register models
+
+    Like python-smbus there is no i2c_rdwr(), so drivers take their
+    plain-SMBus code paths.
+    """
+
+    def __init__(self, bus=1, board="enviropi", devices=None, latency=0.0, fault_rate=0.0, seed=0):
+        self.bus = bus
+        self.devices = devices if devices is not None else make_board(board)
+        self.latency = latency
+        self.fault_rate = fault_rate
+        self._rng = random.Random(seed)
+        self.transactions = 0
+        self.faults = 0
+        self.per_device = Counter()
+
+    def _device(self, addr):
+        self.transactions += 1
+        self.per_device[addr] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fault_rate and self._rng.random() < self.fault_rate:
+            self.faults += 1
+            raise OSError(errno.EREMOTEIO, f"Remote I/O error (injected) at 0x{addr:02x}")
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(errno.EREMOTEIO, f"Remote I/O error: no device at 0x{addr:02x}")
+        return device
+
+    def read_byte(self, addr):
+        return self._device(addr).receive(1)[0]
+
+    def write_byte(self, addr, value):
+        self._device(addr).command(value)
+
+    def read_byte_data(self, addr, reg):
+        return self._device(addr).read(reg, 1)[0]
+
+    def write_byte_data(self, addr, reg, value):
+        self._device(addr).write(reg, [value])
+
+    def read_word_data(self, addr, reg):
+        low, high = self._device(addr).read(reg, 2)
+        return low | high << 8
+
+    def write_word_data(self, addr, reg, value):
+        self._device(addr).write(reg, [value & 0xFF, value >> 8])
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        return self._device(addr).read(reg, length)
+
+    def write_i2c_block_data(self, addr, reg, values):
+        self._device(addr).write(reg, list(values))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_buses = {}
+
+def open_bus(bus_id=1, board="enviropi", fake=None, module="smbus2"):
+    """Shared SMBus for this process: real hardware, or FakeSMBus
+
+    fake=None follows ENVIROPI_FAKE_I2C; fake=True uses the caller's board,
+    or pass a board name to pick its devices.
+    """
+    if fake is None:
+        fake = os.environ.get(FAKE_ENV, "")
+        if fake.lower() in ("", "0", "false", "no"):
+            fake = False
+        elif fake.lower() in ("1", "true", "yes"):
+            fake = True
+
+    key = (bus_id, module, fake)
+    if key in _buses:
+        return _buses[key]
+
+    if fake:
+        bus = FakeSMBus(
+            bus_id,
+            board=board if fake is True else fake,
+            latency=float(os.environ.get(LATENCY_ENV, 0)),
+            fault_rate=float(os.environ.get(FAULT_RATE_ENV, 0)),
+        )
+    elif module == "smbus":
+        import smbus
+        bus = smbus.SMBus(bus_id)
+    else:
+        import smbus2
+        bus = smbus2.SMBus(bus_id)
+
+    if enviro_metrics.ENABLED:
+        bus = enviro_metrics.InstrumentedBus(bus)
+    _buses[key] = bus
+    return bus
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Pipeline Metrics
+Latency histograms for each pipeline stage (sensor reads, logging, display
+updates), I2C transaction and error counts per device, write buffer bytes
+and flushes, and daemon loop jitter, in the Prometheus text format.
+
+Off unless configured; when off, timed() hands back the undecorated
+function and the bus isn't wrapped, so there is nothing left to cost.
+
+  ENVIROPI_METRICS_DIR=/var/lib/node_exporter/textfile_collector
+      Write <script>.prom there after every sample (node exporter textfile collector)
+  ENVIROPI_METRICS_PORT=9101
+      Serve http://<pi>:9101/metrics from a background thread
+
+Usage: python3 enviro_metrics.py FILE.prom   Summarise a metrics file
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+from pathlib import Path
+
+METRICS_DIR = os.environ.get("ENVIROPI_METRICS_DIR", "")
+METRICS_PORT = int(os.environ.get("ENVIROPI_METRICS_PORT", 0) or 0)
+ENABLED = bool(METRICS_DIR or METRICS_PORT)
+
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JITTER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Help text for each metric family
+HELP = {
+    "enviropi_stage_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "enviropi_stage_errors_total": ("counter", "Pipeline stage calls that raised"),
+    "enviropi_i2c_transactions_total": ("counter", "I2C transactions per device address"),
+    "enviropi_i2c_errors_total": ("counter", "Failed I2C transactions per device address"),
+    "enviropi_loop_jitter_seconds": ("histogram", "How late each daemon loop iteration started"),
+    "enviropi_loop_skipped_total": ("counter", "Daemon loop slots skipped after an overrun"),
+    "enviropi_writebuf_readings_total": ("counter", "Readings added to the write buffer"),
+    "enviropi_writebuf_flushes_total": ("counter", "Write buffer flushes"),
+    "enviropi_writebuf_bytes_total": ("counter", "Bytes written to day files"),
+    "enviropi_writebuf_journal_bytes_total": ("counter", "Bytes written to the redo journal"),
+    "enviropi_writebuf_flush_seconds_total": ("counter", "Time spent flushing the write buffer"),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = Counter()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # Last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Add a value to a histogram"""
+    key = (name, _labels(labels))
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        _histograms[key].observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    with _lock:
+        _counters[(name, _labels(labels))] += amount
+
+
+def timed(stage):
+    """Decorator recording a function's latency (and raised errors) as a stage
+
+    Returns the function unchanged when metrics are off.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                inc("enviropi_stage_errors_total", stage=stage)
+                raise
+            finally:
+                observe("enviropi_stage_seconds", time.perf_counter() - start, stage=stage)
+        return wrapper
+    return decorate
+
+
+class _Stage:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            inc("enviropi_stage_errors_total", stage=self.stage)
+        observe("enviropi_stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+
+
+_NO_STAGE = nullcontext()
+
+def stage(name):
+    """Context manager timing part of a function as its own stage"""
+    return _Stage(name) if ENABLED else _NO_STAGE
+
+
+class InstrumentedBus:
+    """SMBus wrapper counting transactions and errors per device address
+
+    Every SMBus method takes the address first; i2c_rdwr() is counted once
+    per message address.
+    """
+
+    def __init__(self, bus):
+        object.__setattr__(self, "_bus", bus)
+
+    def __setattr__(self, name, value):
+        setattr(self._bus, name, value)   # e.g. FakeSMBus.fault_rate in tests
+
+    def __getattr__(self, name):
+        attr = getattr(self._bus, name)
+        if not callable(attr) or name.startswith("_") or name in ("close", "open"):
+            return attr
+
+        @wraps(attr)
+        def call(*args, **kwargs):
+            if name == "i2c_rdwr":
+                devices = {f"0x{msg.addr:02x}" for msg in args}
+            else:
+                devices = {f"0x{args[0]:02x}"} if args and isinstance(args[0], int) else {"unknown"}
+            for device in devices:
+                inc("enviropi_i2c_transactions_total", device=device)
+            try:
+                return attr(*args, **kwargs)
+            except OSError:
+                for device in devices:
+                    inc("enviropi_i2c_errors_total", device=device)
+                raise
+        return call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._bus.close()
+
+
+def _writebuf_counters():
+    """Counters from the write buffers this process has open (if any)"""
+    writebuf = sys.modules.get("enviro_writebuf")
+    if writebuf is None:
+        return {}
+    totals = Counter()
+    for buffer in writebuf._buffers.values():
+        totals["enviropi_writebuf_readings_total"] += buffer.readings
+        totals["enviropi_writebuf_flushes_total"] += buffer.flushes
+        totals["enviropi_writebuf_bytes_total"] += buffer.bytes_written
+        totals["enviropi_writebuf_journal_bytes_total"] += buffer.journal_bytes
+        totals["enviropi_writebuf_flush_seconds_total"] += buffer.flush_seconds
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    families = {}
+    with _lock:
+        for (name, labels), hist in sorted(_histograms.items()):
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(hist.buckets + (None,), hist.counts):
+                cumulative += count
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+        for (name, labels), value in sorted(_counters.items()):
+            families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value}")
+    for name, value in _writebuf_counters().items():
+        families.setdefault(name, []).append(f"{name} {value}")
+
+    out = []
+    for name, lines in families.items():
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def job_name():
+    return Path(sys.argv[0]).stem or "enviropi"
+
+
+def export(directory=None):
+    """Write <script>.prom atomically for the node exporter textfile collector"""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return None
+    path = Path(directory) / f"{job_name()}.prom"
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, 'w') as f:
+            f.write(render())
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Metrics export failed: {e}")
+        return None
+    return path
+
+
+def serve(port=None):
+    """Serve /metrics over HTTP from a daemon thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port or METRICS_PORT), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start():
+    """Start whichever exporters are configured (call once from a script's main)"""
+    if not ENABLED:
+        return
+    if METRICS_PORT:
+        try:
+            serve()
+        except OSError as e:
+            print(f"Metrics endpoint unavailable on port {METRICS_PORT}: {e}")
+    if METRICS_DIR:
+        atexit.register(export)
+
+
+def reset():
+    """Forget everything recorded so far"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def summarize(text):
+    """Readable lines from a metrics file: counters, and count/mean per histogram"""
+    sums, counts, out = {}, {}, []
+    for line in text.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+        series, value = line.rsplit(" ", 1)
+        if "_bucket" in series:
+            continue
+        if series.split("{")[0].endswith("_sum"):
+            sums[series.replace("_sum", "", 1)] = float(value)
+        elif series.split("{")[0].endswith("_count"):
+            counts[series.replace("_count", "", 1)] = float(value)
+        else:
+            out.append(f"{series} {value}")
+    for series, count in counts.items():
+        mean = sums.get(series, 0) / count * 1000 if count else 0
+        out.append(f"{series} n={count:g} mean={mean:.2f} ms")
+    return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], 'r') as f:
+        for line in summarize(f.read()):
+            print(line)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Migration
+Backfills a new store from a data directory holding any mix of day files:
+old whole-document enviro_YYYY-MM-DD.json files and current .jsonl ones,
+written by collect_data.py (Enviro pHAT: accelerometer), enviropi_logger.py
+(temperature/pressure/light) or enviroplus_logger.py (humidity, noise_*).
+Each day's schema is detected, readings are normalised to the current
+layout and written through a storage backend into --dest.
+
+Days are converted in parallel, one per worker process. Legacy documents
+are parsed a reading at a time, so a huge day never has to fit in memory
+(except for the columnar backend, which needs whole columns). A manifest in
+--dest records what each day was built from; re-running skips days whose
+inputs haven't changed, so an interrupted backfill just picks up again.
+
+Usage: python3 enviro_migrate.py --dest DIR [--backend jsonl|columnar] [--source DIR] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import enviro_stats
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+MANIFEST_NAME = ".migrate_manifest.json"
+
+# Bytes read at a time from a legacy document
+CHUNK_SIZE = 64 * 1024
+
+# Fields each logger writes; a reading's schema is told apart by the extras
+SCHEMAS = {
+    "envirophat": ["temperature_c", "pressure_hpa", "light_lux", "accelerometer"],
+    "enviroplus": ["temperature_c", "pressure_hpa", "humidity_pct", "light_lux",
+                   "noise_low", "noise_mid", "noise_high", "noise_amp"],
+    "enviropi": ["temperature_c", "pressure_hpa", "light_lux"],
+}
+
+READINGS_KEY = re.compile(r'"readings"\s*:\s*\[')
+
+
+def iter_legacy(path, chunk_size=CHUNK_SIZE):
+    """Yield the readings of a {"date", "readings": [...]} document (or a
+    bare list) one at a time, holding only about a chunk in memory
+
+    A document cut off mid-way (crash while it was being rewritten) yields
+    every reading before the cut.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = f.read(chunk_size)
+        eof = len(buf) < chunk_size
+
+        # Find the start of the readings array
+        stripped = buf.lstrip()
+        if stripped.startswith("["):
+            pos = len(buf) - len(stripped) + 1
+        else:
+            while True:
+                match = READINGS_KEY.search(buf)
+                if match:
+                    pos = match.end()
+                    break
+                if eof:
+                    return
+                more = f.read(chunk_size)
+                eof = len(more) < chunk_size
+                buf = buf[-64:] + more
+
+        while True:
+            # Skip separators, fetching more input as needed
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    return
+                more = f.read(chunk_size)
+                eof = len(more) < chunk_size
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                reading, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    return  # Truncated document
+                more = f.read(chunk_size)
+                eof = len(more) < chunk_size
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield reading
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def iter_jsonl(path):
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                pass  # Torn line from an interrupted write
+
+
+def detect_schema(reading):
+    if "accelerometer" in reading:
+        return "envirophat"
+    if "humidity_pct" in reading or any(k.startswith("noise_") for k in reading):
+        return "enviroplus"
+    return "enviropi"
+
+
+def normalize(reading):
+    """A reading in the current layout, or None if it has no usable timestamp
+
+    Timestamps become naive local isoformat() strings, an accelerometer
+    given as [x, y, z] becomes {x, y, z}, and every field of the reading's
+    schema is present (None if it wasn't logged).
+    """
+    if not isinstance(reading, dict):
+        return None
+    try:
+        ts = datetime.fromisoformat(str(reading["timestamp"]).replace("Z", "+00:00"))
+    except (KeyError, ValueError):
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone().replace(tzinfo=None)
+
+    out = {"timestamp": ts.isoformat()}
+    for name, value in reading.items():
+        if name == "timestamp":
+            continue
+        if name == "accelerometer" and isinstance(value, (list, tuple)) and len(value) == 3:
+            value = dict(zip("xyz", value))
+        out[name] = value
+    for name in SCHEMAS[detect_schema(out)]:
+        out.setdefault(name, None)
+    return out
+
+
+def day_sources(source_dir):
+    """{day: [input files]} for every day in a data directory"""
+    days = {}
+    for path in sorted(Path(source_dir).glob("enviro_????-??-??.json*")):
+        if path.suffix in (".json", ".jsonl"):
+            days.setdefault(path.name[7:17], []).append(path)
+    return days
+
+
+def read_day(paths, counts):
+    """Normalised readings from a day's inputs (legacy document first)"""
+    for path in sorted(paths, key=lambda p: p.suffix != ".json"):
+        raw = iter_legacy(path) if path.suffix == ".json" else iter_jsonl(path)
+        for reading in raw:
+            reading = normalize(reading)
+            if reading is None:
+                counts["skipped"] += 1
+                continue
+            counts["readings"] += 1
+            counts["schemas"].add(detect_schema(reading))
+            yield reading
+
+
+def write_jsonl(day, readings, dest):
+    """Backend: a JSON Lines day file plus its stats sidecar"""
+    path = enviro_storage.day_file(day, dest)
+    tmp = path.with_name(path.name + ".tmp")
+    agg = enviro_stats.new_day(day)
+    with open(tmp, 'w') as f:
+        for reading in readings:
+            f.write(json.dumps(reading, separators=(",", ":")) + "\n")
+            enviro_stats.update(agg, reading)
+    os.replace(tmp, path)
+    agg["bytes"] = path.stat().st_size
+    enviro_stats.save_day(agg, dest)
+    return path.name
+
+
+def write_columnar(day, readings, dest):
+    """Backend: a columnar .col day file plus its stats sidecar"""
+    import enviro_columnar
+    readings = list(readings)
+    agg = enviro_stats.new_day(day)
+    for reading in readings:
+        enviro_stats.update(agg, reading)
+    path = enviro_columnar.col_file(day, dest)
+    enviro_columnar.write(readings, path)
+    enviro_stats.save_day(agg, dest)
+    return path.name
+
+
+BACKENDS = {
+    "jsonl": write_jsonl,
+    "columnar": write_columnar,
+}
+
+
+def _fingerprint(paths):
+    return {p.name: [p.stat().st_size, p.stat().st_mtime_ns] for p in paths}
+
+
+def migrate_day(day, paths, dest, backend):
+    """Convert one day (runs in a worker process); returns its manifest entry"""
+    paths = [Path(p) for p in paths]
+    sources = _fingerprint(paths)
+    counts = {"readings": 0, "skipped": 0, "schemas": set()}
+    output = BACKENDS[backend](day, read_day(paths, counts), Path(dest))
+    return {
+        "sources": sources,
+        "backend": backend,
+        "schema": "+".join(sorted(counts["schemas"])) or None,
+        "readings": counts["readings"],
+        "skipped": counts["skipped"],
+        "output": output,
+    }
+
+
+def load_manifest(dest):
+    try:
+        with open(Path(dest) / MANIFEST_NAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"days": {}}
+
+
+def save_manifest(manifest, dest):
+    path = Path(dest) / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def pending_days(source_dir, dest, backend, manifest):
+    """Days whose inputs (or backend) changed since they were converted"""
+    todo = {}
+    for day, paths in day_sources(source_dir).items():
+        entry = manifest["days"].get(day)
+        if entry and entry["backend"] == backend and entry["sources"] == _fingerprint(paths):
+            continue
+        todo[day] = paths
+    return todo
+
+
+def migrate(source_dir, dest, backend="jsonl", workers=None, progress=None):
+    """Convert every new or changed day; returns {day: manifest entry or {"error"}}"""
+    source_dir, dest = Path(source_dir), Path(dest)
+    if source_dir.resolve() == dest.resolve():
+        raise ValueError("--dest must be a different directory from the source")
+    dest.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(dest)
+    todo = pending_days(source_dir, dest, backend, manifest)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(migrate_day, day, [str(p) for p in paths], str(dest), backend): day
+                   for day, paths in sorted(todo.items())}
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                results[day] = {"error": str(e)}
+            else:
+                results[day] = entry
+                manifest["days"][day] = entry
+                save_manifest(manifest, dest)  # Progress survives an interruption
+            if progress:
+                progress(day, results[day])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate EnviroPi day files into a new store")
+    parser.add_argument("--source", type=Path, default=DATA_DIR, help=f"data directory (default: {DATA_DIR})")
+    parser.add_argument("--dest", type=Path, required=True, help="directory for the migrated store")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="jsonl")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    def progress(day, entry):
+        if "error" in entry:
+            print(f"{day}: failed - {entry['error']}")
+        else:
+            skipped = f", {entry['skipped']} skipped" if entry["skipped"] else ""
+            print(f"{day}: {entry['readings']} readings ({entry['schema']}{skipped}) -> {entry['output']}")
+
+    try:
+        results = migrate(args.source, args.dest, args.backend, args.workers, progress)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    failed = sum(1 for r in results.values() if "error" in r)
+    print(f"{len(results) - failed} days converted, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
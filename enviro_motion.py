@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Motion Capture
+Samples the Enviro pHAT accelerometer (LSM303D) at a few hundred Hz in a
+background thread, all three axes from one read, into a preallocated NumPy
+buffer. Each logged reading gets only a per-axis summary of the interval -
+RMS, peak, crest factor and dominant frequency of the vibration, plus the
+mean orientation - so raw samples never reach the SD card.
+
+Usage: python3 enviro_motion.py [--seconds N] [--rate HZ]
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Samples per second; capture raises the LSM303D's output data rate to suit
+SAMPLE_RATE = 200
+
+# LSM303D CTRL_REG1: AODR in bits 7-4, bits 2-0 enable the x, y and z axes
+CTRL_REG1 = 0x20
+AXES_ENABLED = 0x07
+
+# Accelerometer output data rates (Hz) by AODR code
+OUTPUT_RATES = {1: 3.125, 2: 6.25, 3: 12.5, 4: 25, 5: 50, 6: 100, 7: 200, 8: 400, 9: 800, 10: 1600}
+
+# Buffer length; a summary covers at most this much of the interval
+BUFFER_SECONDS = 300
+
+AXES = ("x", "y", "z")
+
+# Vibration fields in every reading, per axis
+STATS = ("rms", "peak", "crest", "hz")
+VIBRATION_FIELDS = [f"vib_{axis}_{stat}" for axis in AXES for stat in STATS]
+
+
+class MotionBuffer:
+    """Preallocated (N, 3) float32 ring of samples and their times"""
+
+    def __init__(self, capacity):
+        self.samples = np.zeros((capacity, 3), dtype=np.float32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0      # Samples since the last reset (may exceed capacity)
+
+    def append(self, t, x, y, z):
+        i = self.count % self.capacity
+        row = self.samples[i]
+        row[0] = x
+        row[1] = y
+        row[2] = z
+        self.times[i] = t
+        self.count += 1
+
+    def contents(self):
+        """(times, samples) in time order, copied out of the ring"""
+        n = min(self.count, self.capacity)
+        start = self.count % self.capacity if self.count > self.capacity else 0
+        order = np.roll(np.arange(n), -start)
+        return self.times[order], self.samples[order]
+
+    def reset(self):
+        self.count = 0
+
+
+def summarize(times, samples):
+    """Reading fields for one interval of (N, 3) accelerometer samples
+
+    Gravity and mounting tilt are removed as each axis's mean, which is
+    reported separately as the orientation. RMS and peak are of what is
+    left; the dominant frequency is the strongest Hann-windowed FFT bin at
+    the rate the samples actually arrived.
+    """
+    n = len(samples)
+    if n < 2:
+        fields = dict.fromkeys(VIBRATION_FIELDS)
+        fields["accelerometer"] = None
+        return fields
+
+    data = samples.astype(np.float64)
+    mean = data.mean(axis=0)
+    ac = data - mean
+    rms = np.sqrt(np.mean(ac ** 2, axis=0))
+    peak = np.abs(ac).max(axis=0)
+
+    rate = (n - 1) / (times[-1] - times[0]) if times[-1] > times[0] else SAMPLE_RATE
+    spectrum = np.abs(np.fft.rfft(ac * np.hanning(n)[:, None], axis=0))
+    spectrum[0] = 0
+    dominant = np.argmax(spectrum, axis=0) * rate / n
+
+    fields = {"accelerometer": {axis: round(float(mean[i]), 3) for i, axis in enumerate(AXES)}}
+    for i, axis in enumerate(AXES):
+        fields[f"vib_{axis}_rms"] = round(float(rms[i]), 4)
+        fields[f"vib_{axis}_peak"] = round(float(peak[i]), 4)
+        fields[f"vib_{axis}_crest"] = round(float(peak[i] / rms[i]), 2) if rms[i] > 0 else None
+        fields[f"vib_{axis}_hz"] = round(float(dominant[i]), 1) if rms[i] > 0 else None
+    return fields
+
+
+def output_rate_code(rate):
+    """Slowest AODR code giving at least two sensor updates per sample"""
+    for code, hz in sorted(OUTPUT_RATES.items()):
+        if hz >= 2 * rate:
+            return code
+    return max(OUTPUT_RATES)
+
+
+class LSM303DAccelerometer:
+    """envirophat's accelerometer read, with the output data rate raised during capture
+
+    envirophat's setup() leaves the LSM303D at 50 Hz, so sampling any faster
+    repeats samples and aliases anything above 25 Hz. configure() writes the
+    AODR bits for the capture rate and restore() puts the old value back.
+    """
+
+    def __init__(self, motion):
+        self.motion = motion
+        self._saved = None
+
+    def __call__(self):
+        return self.motion.accelerometer()
+
+    def configure(self, rate):
+        self.motion.setup()     # So a lazy setup() can't overwrite the rate later
+        bus, addr = self.motion.i2c_bus, self.motion.addr
+        if self._saved is None:
+            self._saved = bus.read_byte_data(addr, CTRL_REG1)
+        bus.write_byte_data(addr, CTRL_REG1, output_rate_code(rate) << 4 | AXES_ENABLED)
+
+    def restore(self):
+        if self._saved is not None:
+            self.motion.i2c_bus.write_byte_data(self.motion.addr, CTRL_REG1, self._saved)
+            self._saved = None
+
+
+def envirophat_accelerometer():
+    """The Enviro pHAT's accelerometer read (x, y, z in g)"""
+    from envirophat import motion
+    return LSM303DAccelerometer(motion)
+
+
+class MotionMonitor:
+    """Background capture at a fixed rate, summarised on demand
+
+    read() must return all three axes from a single sensor read (e.g.
+    envirophat's motion.accelerometer). Sample times are absolute targets,
+    so a slow read delays one sample rather than the rest of the interval.
+    A read with configure(rate)/restore() (LSM303DAccelerometer) is set up
+    for the capture rate on start() and put back on stop().
+    """
+
+    def __init__(self, read, rate=SAMPLE_RATE, seconds=BUFFER_SECONDS, clock=time.monotonic):
+        self.read = read
+        self.rate = rate
+        self.clock = clock
+        self.buffer = MotionBuffer(int(rate * seconds))
+        self.errors = 0
+        self.missed = 0     # Sample slots skipped because a read overran
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """Take one sample now"""
+        x, y, z = self.read()
+        t = self.clock()
+        with self._lock:
+            self.buffer.append(t, x, y, z)
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_time = self.clock()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except OSError:
+                self.errors += 1
+            next_time += period
+            delay = next_time - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                skipped = int(-delay / period)
+                self.missed += skipped
+                next_time += skipped * period
+
+    def start(self):
+        if hasattr(self.read, "configure"):
+            self.read.configure(self.rate)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="motion", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if hasattr(self.read, "restore"):
+            self.read.restore()
+
+    def wait(self, timeout):
+        """Block until there is enough to summarise (or timeout); True if anything was captured"""
+        deadline = time.monotonic() + timeout
+        while self.buffer.count < self.rate * timeout and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.buffer.count > 0
+
+    def summary(self, reset=True):
+        """Reading fields for the samples since the last summary"""
+        with self._lock:
+            times, samples = self.buffer.contents()
+            if reset:
+                self.buffer.reset()
+        fields = summarize(times, samples)
+        fields["motion_samples"] = len(samples)
+        return fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi accelerometer vibration summary")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=SAMPLE_RATE, help="samples per second")
+    args = parser.parse_args()
+
+    try:
+        monitor = MotionMonitor(envirophat_accelerometer(), args.rate, max(args.seconds, 1))
+        monitor.start()
+        time.sleep(args.seconds)
+        monitor.stop()
+    except Exception as e:
+        print(f"Motion capture failed: {e}")
+        return 1
+
+    fields = monitor.summary()
+    print(f"{fields['motion_samples']} samples ({monitor.missed} missed, {monitor.errors} errors)")
+    print(f"orientation: {fields['accelerometer']}")
+    for axis in AXES:
+        print(f"{axis}: rms {fields[f'vib_{axis}_rms']} g, peak {fields[f'vib_{axis}_peak']} g, "
+              f"crest {fields[f'vib_{axis}_crest']}, dominant {fields[f'vib_{axis}_hz']} Hz")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Noise Monitor
+Captures the Enviro+ microphone (ADAU7002) continuously into a
+preallocated ring buffer and turns it into per-band sound levels with
+batched NumPy FFTs over overlapping Hann windows. read_sensors() takes a
+summary (Leq and peak per band) each time it logs.
+
+Set ENVIROPI_NOISE_WAV to a WAV file to use it instead of the microphone.
+
+Usage: python3 enviro_noise.py [--wav FILE] [--seconds N]   Print levels
+       python3 enviro_noise.py --bench [--seconds N]       Processing speed
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# FFT window and hop (50% overlap): 64 ms windows, a new one every 32 ms
+WINDOW = 1024
+HOP = 512
+
+# Ring buffer length; processing may fall this far behind before frames drop
+RING_SECONDS = 10
+
+# Bands in Hz, as fractions of 0-8 kHz like enviroplus.noise (12% / 36% / rest)
+BANDS = {
+    "low": (100, 960),
+    "mid": (960, 3840),
+    "high": (3840, 8000),
+}
+
+# Full-scale sine reads 0 dBFS; silence is floored here rather than -inf
+FLOOR_DB = -120.0
+
+WAV_ENV = "ENVIROPI_NOISE_WAV"
+
+
+class AudioRing:
+    """Preallocated mono float32 ring; the writer never allocates"""
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.written = 0    # Total samples ever written
+
+    def write(self, block):
+        n = len(block)
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:n - first] = block[first:]
+        self.written += n
+
+    def read(self, position, n):
+        """n samples starting at absolute position (must still be in the ring)"""
+        start = position % self.capacity
+        if start + n <= self.capacity:
+            return self.buffer[start:start + n]
+        return np.concatenate((self.buffer[start:], self.buffer[:start + n - self.capacity]))
+
+
+class BandAnalyser:
+    """Band mean-square levels for a batch of frames in one vectorised pass"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, window=WINDOW, bands=BANDS):
+        self.window = window
+        self.hann = np.hanning(window).astype(np.float32)
+        freqs = np.fft.rfftfreq(window, 1 / sample_rate)
+
+        # One-sided power scaled so each frame's bins sum to its mean square
+        weights = np.full(len(freqs), 2.0)
+        weights[0] = 1.0
+        if window % 2 == 0:
+            weights[-1] = 1.0
+        scale = weights / (window * np.sum(self.hann ** 2))
+
+        # (bins x bands) matrix: band power = power @ matrix
+        self.names = list(bands) + ["all"]
+        matrix = np.zeros((len(freqs), len(self.names)), dtype=np.float64)
+        for i, (low, high) in enumerate(bands.values()):
+            matrix[(freqs >= low) & (freqs < high), i] = 1.0
+        matrix[1:, -1] = 1.0  # Everything but DC
+        self.matrix = matrix * scale[:, None]
+
+    def frames(self, samples):
+        """Overlapping windows (HOP apart) over a 1-D block, as a 2-D view"""
+        view = np.lib.stride_tricks.sliding_window_view(samples, self.window)
+        return view[::HOP]
+
+    def mean_square(self, frames):
+        """(n_frames x bands) mean-square level of each band in each frame"""
+        spectrum = np.fft.rfft(frames * self.hann, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        return power @ self.matrix
+
+
+def to_db(mean_square):
+    if mean_square <= 0:
+        return FLOOR_DB
+    # +3.01 dB so a full-scale sine (mean square 0.5) is 0 dBFS
+    return max(FLOOR_DB, 10 * math.log10(mean_square) + 3.0103)
+
+
+class SoundDeviceSource:
+    """The microphone via sounddevice (PortAudio)"""
+
+    def __init__(self, device=None, sample_rate=SAMPLE_RATE, blocksize=HOP):
+        self.device = device
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.overflows = 0
+        self._stream = None
+
+    def start(self, push):
+        import sounddevice
+
+        def callback(indata, frames, time_info, status):
+            if status.input_overflow:
+                self.overflows += 1
+            push(indata[:, 0])
+
+        self._stream = sounddevice.InputStream(
+            device=self.device, channels=1, samplerate=self.sample_rate,
+            blocksize=self.blocksize, dtype="float32", callback=callback)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class WavSource:
+    """A WAV file standing in for the microphone
+
+    realtime=True paces blocks like a live device (and loops the file);
+    otherwise the whole file is pushed as fast as it can be processed.
+    """
+
+    def __init__(self, path, realtime=False, blocksize=HOP):
+        self.path = path
+        self.realtime = realtime
+        self.live = realtime
+        self.blocksize = blocksize
+        self.overflows = 0
+        with wave.open(str(path), 'rb') as w:
+            self.sample_rate = w.getframerate()
+            channels, width = w.getnchannels(), w.getsampwidth()
+            raw = w.readframes(w.getnframes())
+        if width != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        samples = np.frombuffer(raw, dtype="<i2").reshape(-1, channels)[:, 0]
+        self.samples = samples.astype(np.float32) / 32768.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, push):
+        def run():
+            position = 0
+            next_time = time.monotonic()
+            while not self._stop.is_set():
+                block = self.samples[position:position + self.blocksize]
+                if len(block) == 0:
+                    if not self.realtime:
+                        break
+                    position = 0
+                    continue
+                push(block)
+                position += len(block)
+                if self.realtime:
+                    next_time += len(block) / self.sample_rate
+                    time.sleep(max(0.0, next_time - time.monotonic()))
+
+        self._stop.clear()
+        if self.realtime:
+            self._thread = threading.Thread(target=run, name="wav-source", daemon=True)
+            self._thread.start()
+        else:
+            run()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class NoiseMonitor:
+    """Continuous capture plus band levels, summarised on demand
+
+    The source's callback only copies samples into the ring; a worker thread
+    analyses every complete window, in batches, and folds the results into
+    running per-band sums (for Leq) and maxima (for peak).
+    """
+
+    def __init__(self, source, window=WINDOW):
+        self.source = source
+        self.analyser = BandAnalyser(source.sample_rate, window)
+        self.ring = AudioRing(int(source.sample_rate * RING_SECONDS))
+        self.processed = 0      # Absolute sample position of the next window
+        self.dropped = 0        # Samples overwritten before being analysed
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
+        self._new_data = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._reset()
+
+    def _reset(self):
+        n = len(self.analyser.names)
+        self._sum = np.zeros(n)
+        self._peak = np.zeros(n)
+        self._frames = 0
+
+    def _push(self, block):
+        if not getattr(self.source, "live", True) and \
+                self.ring.written + len(block) - self.processed > self.ring.capacity:
+            self.process_available()  # A file can wait; the microphone can't
+        self.ring.write(block)
+        self._new_data.set()
+
+    def process_available(self):
+        """Analyse every complete window in the ring; returns windows done"""
+        with self._process_lock:
+            return self._process()
+
+    def _process(self):
+        window = self.analyser.window
+        available = self.ring.written
+        oldest = available - self.ring.capacity
+        if self.processed < oldest:
+            self.dropped += oldest - self.processed
+            self.processed = oldest + (-oldest) % HOP
+        count = (available - self.processed - window) // HOP + 1
+        if count <= 0:
+            return 0
+
+        span = (count - 1) * HOP + window
+        samples = self.ring.read(self.processed, span)
+        levels = self.analyser.mean_square(self.analyser.frames(samples))
+        with self._lock:
+            self._sum += levels.sum(axis=0)
+            np.maximum(self._peak, levels.max(axis=0), out=self._peak)
+            self._frames += count
+        self.processed += count * HOP
+        return count
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._new_data.wait(0.5)
+            self._new_data.clear()
+            self.process_available()
+
+    def start(self):
+        self._stop.clear()
+        self.source.start(self._push)
+        self._worker = threading.Thread(target=self._run, name="noise-analyser", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self.source.stop()
+        self._stop.set()
+        self._new_data.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.process_available()
+
+    def wait(self, timeout):
+        """Block until at least one window has been analysed (or timeout); True if it has"""
+        deadline = time.monotonic() + timeout
+        while self._frames == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._frames > 0
+
+    def summary(self, reset=True):
+        """Reading fields: Leq and peak (dBFS) per band since the last summary"""
+        with self._lock:
+            frames, total, peak = self._frames, self._sum.copy(), self._peak.copy()
+            if reset:
+                self._reset()
+
+        fields = {}
+        for i, name in enumerate(self.analyser.names):
+            key = "noise_amp" if name == "all" else f"noise_{name}"
+            peak_key = "noise_peak" if name == "all" else f"noise_{name}_peak"
+            fields[key] = round(to_db(total[i] / frames), 1) if frames else None
+            fields[peak_key] = round(to_db(peak[i]), 1) if frames else None
+        return fields
+
+
+def default_source():
+    """WAV file from ENVIROPI_NOISE_WAV (looped in real time), else the microphone"""
+    path = os.environ.get(WAV_ENV)
+    if path:
+        return WavSource(path, realtime=True)
+    return SoundDeviceSource()
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    """Save float samples (-1..1) as 16-bit mono PCM"""
+    pcm = np.clip(np.asarray(samples) * 32767, -32768, 32767).astype("<i2")
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+
+
+def bench(seconds):
+    """Time analysis of synthetic audio; returns the real-time factor"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = (0.1 * np.sin(2 * np.pi * 440 * t) + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+    class ArraySource:
+        sample_rate = SAMPLE_RATE
+        live = True
+
+    monitor = NoiseMonitor(ArraySource())
+    start = time.perf_counter()
+    for i in range(0, len(audio), HOP):
+        monitor._push(audio[i:i + HOP])
+        if i % (HOP * 16) == 0:
+            monitor.process_available()  # Like the worker waking every ~0.5 s
+    monitor.process_available()
+    elapsed = time.perf_counter() - start
+    return seconds / elapsed, monitor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi noise levels")
+    parser.add_argument("--wav", help="analyse a WAV file instead of the microphone")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--bench", action="store_true", help="measure processing speed")
+    args = parser.parse_args()
+
+    if args.bench:
+        factor, monitor = bench(args.seconds)
+        print(f"Analysed {args.seconds:g}s of audio at {factor:.0f}x real time "
+              f"({monitor.summary()['noise_amp']} dBFS)")
+        return 0
+
+    source = WavSource(args.wav) if args.wav else default_source()
+    monitor = NoiseMonitor(source)
+    try:
+        monitor.start()
+        if not args.wav:
+            time.sleep(args.seconds)
+    except Exception as e:
+        print(f"Noise capture failed: {e}")
+        return 1
+    finally:
+        monitor.stop()
+
+    for key, value in monitor.summary().items():
+        print(f"{key}: {value} dBFS")
+    if monitor.dropped or source.overflows:
+        print(f"Dropped {monitor.dropped} samples, {source.overflows} input overflows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+PMS5003 particulate sensor reader
+A background thread reads the UART stream continuously and an incremental
+parser pulls out frames as bytes arrive; readings are averaged until the
+logger asks for them, so logging never waits on the ~1 s frame cadence
+
+Usage: python3 enviro_pms5003.py [DEVICE | --file RECORDING] [--seconds N]
+"""
+
+import argparse
+import io
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# Enviro+ UART
+DEVICE = os.environ.get("ENVIROPI_PMS5003", "/dev/ttyAMA0")
+BAUDRATE = 9600
+
+# Start of frame, then length (always 2 * 13 data words + 2 checksum bytes)
+HEADER = b"\x42\x4d"
+FRAME_LENGTH = 28
+FRAME_SIZE = 4 + FRAME_LENGTH
+FRAME = struct.Struct(">2sH13HH")
+
+# Data word indices: PM1.0/2.5/10 in ug/m3, "CF=1" standard particle values
+# (what pms5003.PMSData.pm_ug_per_m3() returns by default)
+PM1, PM25, PM10 = 0, 1, 2
+
+# Frames older than this don't count as the sensor being alive
+STALE_AFTER = 10
+
+
+class FrameParser:
+    """Incremental PMS5003 frame parser
+
+    feed() appends new bytes and returns any complete, valid frames. Each
+    byte is examined once: the buffer only ever holds the unparsed tail, and
+    after a bad checksum the search resumes just past the false header.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.frames = 0
+        self.checksum_errors = 0
+        self.skipped = 0        # Bytes discarded while looking for a header
+
+    def feed(self, data):
+        buf = self._buffer
+        buf += data
+        frames = []
+        pos = 0
+        while True:
+            start = buf.find(HEADER, pos)
+            if start < 0:
+                # Keep a trailing 0x42 that may be the first half of a header
+                keep = 1 if buf.endswith(HEADER[:1]) else 0
+                self.skipped += len(buf) - pos - keep
+                pos = len(buf) - keep
+                break
+            self.skipped += start - pos
+            if len(buf) - start < 4:
+                pos = start
+                break
+            length = (buf[start + 2] << 8) | buf[start + 3]
+            if length != FRAME_LENGTH:
+                self.checksum_errors += 1
+                self.skipped += 1
+                pos = start + 1
+                continue
+            if len(buf) - start < FRAME_SIZE:
+                pos = start
+                break
+            values = FRAME.unpack_from(buf, start)
+            if sum(buf[start:start + FRAME_SIZE - 2]) != values[-1]:
+                self.checksum_errors += 1
+                self.skipped += 1
+                pos = start + 1
+                continue
+            frames.append(values[2:15])
+            self.frames += 1
+            pos = start + FRAME_SIZE
+        del buf[:pos]
+        return frames
+
+
+def encode_frame(data):
+    """A valid frame carrying 13 data words (for tests and recordings)"""
+    body = struct.pack(">2sH13H", HEADER, FRAME_LENGTH, *data)
+    return body + struct.pack(">H", sum(body))
+
+
+class PMS5003Reader:
+    """Background reader averaging PM1.0/2.5/10 between summaries
+
+    stream is anything with a file descriptor (pyserial port, pty, pipe) or
+    a read() method (e.g. io.BytesIO with a recorded byte stream); reading
+    stops at end of stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parser = FrameParser()
+        self.last_frame = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._first_frame = threading.Event()
+        self._thread = None
+        try:
+            self._fd = stream.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            self._fd = None
+        self._reset()
+
+    def _reset(self):
+        self._sums = [0, 0, 0]
+        self._count = 0
+
+    def _read_chunk(self):
+        if self._fd is None:
+            return self.stream.read(256)
+        ready, _, _ = select.select([self._fd], [], [], 0.5)
+        if not ready:
+            return None
+        return os.read(self._fd, 256)
+
+    def _add(self, frames):
+        with self._lock:
+            for frame in frames:
+                self._sums[0] += frame[PM1]
+                self._sums[1] += frame[PM25]
+                self._sums[2] += frame[PM10]
+                self._count += 1
+            self.last_frame = time.monotonic()
+        self._first_frame.set()
+
+    def poll(self):
+        """Read and parse what's available; False at end of stream"""
+        try:
+            data = self._read_chunk()
+        except OSError:
+            return False  # pty closed / device gone
+        if data is None:
+            return True
+        if not data:
+            return False
+        frames = self.parser.feed(data)
+        if frames:
+            self._add(frames)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set() and self.poll():
+            pass
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pms5003", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout):
+        """Block until the first frame has arrived (or timeout); True if it has"""
+        return self._first_frame.wait(timeout)
+
+    @property
+    def alive(self):
+        return self.last_frame is not None and time.monotonic() - self.last_frame < STALE_AFTER
+
+    def summary(self, reset=True):
+        """Mean PM1.0/2.5/10 (ug/m3) over the frames since the last summary"""
+        with self._lock:
+            count, sums = self._count, list(self._sums)
+            if reset:
+                self._reset()
+        if not count:
+            return {"pm1_ug_m3": None, "pm25_ug_m3": None, "pm10_ug_m3": None}
+        return {
+            "pm1_ug_m3": round(sums[0] / count, 1),
+            "pm25_ug_m3": round(sums[1] / count, 1),
+            "pm10_ug_m3": round(sums[2] / count, 1),
+        }
+
+
+def open_serial(device=DEVICE, baudrate=BAUDRATE):
+    """The sensor's UART (pyserial)"""
+    import serial
+    return serial.Serial(device, baudrate=baudrate, timeout=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PMS5003 particulate reader")
+    parser.add_argument("device", nargs="?", default=DEVICE)
+    parser.add_argument("--file", help="parse a recorded byte stream instead")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    try:
+        stream = open(args.file, 'rb') if args.file else open_serial(args.device)
+    except Exception as e:
+        print(f"PMS5003 open failed: {e}")
+        return 1
+    reader = PMS5003Reader(stream)
+    reader.start()
+    if args.file:
+        reader._thread.join()
+    else:
+        time.sleep(args.seconds)
+    reader.stop()
+    stream.close()
+
+    p = reader.parser
+    print(f"{p.frames} frames, {p.checksum_errors} bad, {p.skipped} bytes skipped")
+    for key, value in reader.summary().items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
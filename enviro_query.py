@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Query Engine
+Statistics for one metric between two times, at any resolution, streaming
+across as many days as needed: count, mean, min, max, stddev, percentiles
+(t-digest) and a fixed-bin histogram per bucket. Every part is mergeable,
+so each closed day's results are cached (per day and per hour) and a query
+over a year merges 365 small cached partials instead of rescanning readings.
+
+Usage: python3 enviro_query.py METRIC START END [--resolution SECONDS] [--histogram] [--json]
+  START/END are YYYY-MM-DD (whole days) or naive ISO times; END is exclusive
+  e.g. python3 enviro_query.py temperature_c 2025-03-01 2026-02-28
+       python3 enviro_query.py pressure_hpa 2026-02-01 2026-02-07 --resolution 86400
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+# t-digest size: ~compression centroids, accuracy best near the tails
+COMPRESSION = 100
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Fixed histogram bins per metric: (low, high, width); values outside count
+# as under/over. Metrics not listed get no histogram.
+BINS = {
+    "temperature_c": (-20.0, 50.0, 0.5),
+    "pressure_hpa": (900.0, 1100.0, 1.0),
+    "humidity_pct": (0.0, 100.0, 1.0),
+    "light_lux": (0.0, 2000.0, 10.0),
+    "noise_amp": (-120.0, 0.0, 1.0),
+    "pm25_ug_m3": (0.0, 500.0, 1.0),
+}
+
+# Cached partials are kept per day and per hour
+DAY, HOUR = 86400, 3600
+
+CACHE_VERSION = 1
+
+
+class TDigest:
+    """Merging t-digest (k1 scale function) for streaming quantiles
+
+    Values are buffered and folded into at most ~compression centroids;
+    two digests merge by folding one's centroids into the other.
+    """
+
+    def __init__(self, compression=COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in items)
+
+        means, weights = [], []
+        done = 0
+        q_limit = self._q(self._k(0) + 1)
+        mean, weight = items[0]
+        for m, w in items[1:]:
+            if (done + weight + w) / total <= q_limit:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                q_limit = self._q(self._k(done / total) + 1)
+                mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    @property
+    def count(self):
+        return sum(self.weights) + sum(w for _, w in self._buffer)
+
+    def quantile(self, q):
+        """Estimated q-quantile (0..1), or None if empty"""
+        self._compress()
+        if not self.weights:
+            return None
+        total = sum(self.weights)
+        target = q * total
+        # Centroid i sits at the middle of its weight; min and max pin the ends
+        positions, cum = [], 0
+        for w in self.weights:
+            positions.append(cum + w / 2)
+            cum += w
+        if target <= positions[0]:
+            x0, y0, x1, y1 = 0, self.min, positions[0], self.means[0]
+        elif target >= positions[-1]:
+            x0, y0, x1, y1 = positions[-1], self.means[-1], total, self.max
+        else:
+            i = bisect.bisect_right(positions, target) - 1
+            x0, y0, x1, y1 = positions[i], self.means[i], positions[i + 1], self.means[i + 1]
+        if x1 == x0:
+            return y0
+        return y0 + (y1 - y0) * (target - x0) / (x1 - x0)
+
+    def to_dict(self):
+        self._compress()
+        return {"c": self.compression, "m": self.means, "w": self.weights, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls(d["c"])
+        digest.means, digest.weights = list(d["m"]), list(d["w"])
+        digest.min, digest.max = d["min"], d["max"]
+        return digest
+
+
+class Histogram:
+    """Fixed-width bins with under/overflow counts; merges by adding counts"""
+
+    def __init__(self, low, high, width, counts=None, under=0, over=0):
+        self.low, self.high, self.width = low, high, width
+        self.counts = counts or [0] * int(round((high - low) / width))
+        self.under, self.over = under, over
+
+    def add(self, value):
+        if value < self.low:
+            self.under += 1
+        elif value >= self.high:
+            self.over += 1
+        else:
+            self.counts[int((value - self.low) / self.width)] += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.under += other.under
+        self.over += other.over
+        return self
+
+    def to_dict(self):
+        return {"low": self.low, "high": self.high, "width": self.width,
+                "counts": self.counts, "under": self.under, "over": self.over}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["low"], d["high"], d["width"], list(d["counts"]), d["under"], d["over"])
+
+
+class Partial:
+    """Mergeable statistics for one metric over one span of time"""
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.digest = TDigest()
+        self.hist = Histogram(*BINS[metric]) if metric in BINS else None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.digest.add(value)
+        if self.hist is not None:
+            self.hist.add(value)
+
+    def merge(self, other):
+        """Fold in another partial (Chan et al. for mean/variance)"""
+        if not other.count:
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.digest.merge(other.digest)
+        if self.hist is not None and other.hist is not None:
+            self.hist.merge(other.hist)
+        return self
+
+    def result(self, percentiles=PERCENTILES, histogram=False):
+        out = {
+            "count": self.count,
+            "mean": round(self.mean, 3) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "stddev": round(math.sqrt(self.m2 / (self.count - 1)), 3) if self.count > 1 else 0.0,
+        }
+        for p in percentiles:
+            value = self.digest.quantile(p / 100) if self.count else None
+            out[f"p{p:g}"] = round(value, 3) if value is not None else None
+        if histogram and self.hist is not None:
+            out["histogram"] = self.hist.to_dict()
+        return out
+
+    def to_dict(self):
+        d = {"n": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max,
+             "digest": self.digest.to_dict()}
+        if self.hist is not None:
+            d["hist"] = self.hist.to_dict()
+        return d
+
+    @classmethod
+    def from_dict(cls, metric, d):
+        p = cls(metric)
+        p.count, p.mean, p.m2, p.min, p.max = d["n"], d["mean"], d["m2"], d["min"], d["max"]
+        p.digest = TDigest.from_dict(d["digest"])
+        if "hist" in d:
+            p.hist = Histogram.from_dict(d["hist"])
+        return p
+
+
+def metric_values(reading):
+    """(metric, value) for each numeric field; nested objects as "name.key" """
+    for name, value in reading.items():
+        if isinstance(value, dict):
+            yield from metric_values({f"{name}.{k}": v for k, v in value.items()})
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            yield name, value
+
+
+def _us(ts):
+    return enviro_storage.timestamp_us(ts)
+
+
+# --- Per-day cache ---------------------------------------------------------
+
+def cache_dir(data_dir=DATA_DIR):
+    return Path(data_dir) / "query_cache"
+
+
+def _fingerprint(day, data_dir):
+    """Size and mtime of every file a day's readings come from"""
+    out = {}
+    for path in Path(data_dir).glob(f"enviro_{day}.*"):
+        if path.name.endswith((".json", ".jsonl", ".jsonl.gz", ".col")) and ".stats." not in path.name:
+            st = path.stat()
+            out[path.name] = [st.st_size, st.st_mtime_ns]
+    return out
+
+
+def _build_cache(day, data_dir):
+    """One pass over a day: partials for every metric, per day and per hour"""
+    days, hours = {}, {}
+    for reading in enviro_storage.iter_readings(day, data_dir):
+        ts = reading.get("timestamp")
+        if not ts or not ts.startswith(day):
+            continue
+        hour = ts[11:13]
+        for metric, value in metric_values(reading):
+            if metric not in days:
+                days[metric] = Partial(metric)
+                hours[metric] = {}
+            days[metric].add(value)
+            if hour not in hours[metric]:
+                hours[metric][hour] = Partial(metric)
+            hours[metric][hour].add(value)
+    return days, hours
+
+
+def _save(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _load(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def day_partials(day, data_dir=DATA_DIR, level="day"):
+    """Cached partials for a closed day: {metric: Partial} for level="day",
+    {metric: {"HH": Partial}} for level="hour"
+
+    Cached under query_cache/ and rebuilt when the day's files change. Day
+    and hour results are stored separately so a long query at daily or
+    coarser resolution only loads the small per-day file.
+    """
+    fingerprint = _fingerprint(day, data_dir)
+    if not fingerprint:
+        return {}
+    path = cache_dir(data_dir) / f"{day}.{level}.json"
+    cached = _load(path)
+    if cached and cached.get("version") == CACHE_VERSION and cached["sources"] == fingerprint:
+        if level == "day":
+            return {m: Partial.from_dict(m, d) for m, d in cached["metrics"].items()}
+        return {m: {h: Partial.from_dict(m, d) for h, d in by_hour.items()}
+                for m, by_hour in cached["metrics"].items()}
+
+    days, hours = _build_cache(day, data_dir)
+    cache_dir(data_dir).mkdir(exist_ok=True)
+    _save(cache_dir(data_dir) / f"{day}.day.json", {
+        "version": CACHE_VERSION, "sources": fingerprint,
+        "metrics": {m: p.to_dict() for m, p in days.items()}})
+    _save(cache_dir(data_dir) / f"{day}.hour.json", {
+        "version": CACHE_VERSION, "sources": fingerprint,
+        "metrics": {m: {h: p.to_dict() for h, p in by_hour.items()} for m, by_hour in hours.items()}})
+    return days if level == "day" else hours
+
+
+def prune_cache(data_dir=DATA_DIR):
+    """Remove cached partials of days whose files retention has deleted"""
+    removed = []
+    for path in sorted(cache_dir(data_dir).glob("????-??-??.*.json")):
+        if not _fingerprint(path.name[:10], data_dir):
+            path.unlink()
+            removed.append(path)
+    return removed
+
+
+# --- Queries ---------------------------------------------------------------
+
+def _bucket(us, resolution, start_us):
+    """Bucket start (µs) for a time; None resolution means one bucket"""
+    if resolution is None:
+        return start_us
+    size = int(resolution * 1000000)
+    return us - us % size
+
+
+def query(metric, start, end, resolution=None, data_dir=DATA_DIR, today=None):
+    """{bucket start (naive ISO): Partial} for metric over [start, end)
+
+    Whole closed days (or whole hours, when the resolution is a multiple of
+    an hour but not of a day) come from the cache; the rest is streamed
+    from the readings, so memory stays proportional to the bucket count.
+    """
+    start_us, end_us = _us(start), _us(end)
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    if resolution is None or resolution % DAY == 0:
+        level = "day"
+    elif resolution % HOUR == 0:
+        level = "hour"
+    else:
+        level = None
+
+    buckets = {}
+
+    def fold(t_us, partial):
+        key = _bucket(t_us, resolution, start_us)
+        if key not in buckets:
+            buckets[key] = Partial(metric)
+        buckets[key].merge(partial)
+
+    def stream(lo_us, hi_us):
+        day = enviro_storage.from_timestamp_us(lo_us)[:10]
+        lo, hi = enviro_storage.from_timestamp_us(lo_us), enviro_storage.from_timestamp_us(hi_us)
+        for reading in enviro_storage.iter_readings(day, data_dir, lo, hi):
+            ts = reading.get("timestamp")
+            if not ts or not lo <= ts < hi:
+                continue
+            value = dict(metric_values(reading)).get(metric)
+            if value is None:
+                continue
+            key = _bucket(_us(ts), resolution, start_us)
+            if key not in buckets:
+                buckets[key] = Partial(metric)
+            buckets[key].add(value)
+
+    day_us = DAY * 1000000
+    hour_us = HOUR * 1000000
+    day_start = start_us - start_us % day_us
+    while day_start < end_us:
+        day_end = day_start + day_us
+        day = enviro_storage.from_timestamp_us(day_start)[:10]
+        lo, hi = max(start_us, day_start), min(end_us, day_end)
+        if level is None or day >= today:
+            stream(lo, hi)
+        elif level == "day" and lo == day_start and hi == day_end:
+            partial = day_partials(day, data_dir, "day").get(metric)
+            if partial is not None:
+                fold(day_start, partial)
+        else:
+            # Whole hours from the hourly cache, partial hours from the readings
+            by_hour = day_partials(day, data_dir, "hour").get(metric, {})
+            first_hour = lo + (-lo) % hour_us
+            last_hour = hi - hi % hour_us
+            if first_hour >= last_hour:
+                stream(lo, hi)
+            else:
+                if lo < first_hour:
+                    stream(lo, first_hour)
+                for h in range(first_hour, last_hour, hour_us):
+                    partial = by_hour.get(f"{(h - day_start) // hour_us:02d}")
+                    if partial is not None:
+                        fold(h, partial)
+                if last_hour < hi:
+                    stream(last_hour, hi)
+        day_start = day_end
+
+    return {enviro_storage.from_timestamp_us(k): buckets[k] for k in sorted(buckets)}
+
+
+def _parse_time(text, end=False):
+    """YYYY-MM-DD or naive ISO; a bare END date means the end of that day"""
+    if len(text) == 10:
+        day = datetime.strptime(text, "%Y-%m-%d")
+        return (day + timedelta(days=1) if end else day).isoformat()
+    return datetime.fromisoformat(text).isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi time-range statistics")
+    parser.add_argument("metric", help="e.g. temperature_c, pressure_hpa, accelerometer.z")
+    parser.add_argument("start")
+    parser.add_argument("end")
+    parser.add_argument("--resolution", type=float, help="bucket seconds (default: one bucket)")
+    parser.add_argument("--histogram", action="store_true", help="include each bucket's histogram")
+    parser.add_argument("--json", action="store_true", help="JSON output")
+    args = parser.parse_args()
+
+    start, end = _parse_time(args.start), _parse_time(args.end, end=True)
+    results = {t: p.result(histogram=args.histogram)
+               for t, p in query(args.metric, start, end, args.resolution).items()}
+    if args.json or args.histogram:
+        json.dump({"metric": args.metric, "start": start, "end": end, "buckets": results}, sys.stdout, indent=2)
+        print()
+        return 0
+
+    columns = ["count", "mean", "min", "max", "stddev"] + [f"p{p:g}" for p in PERCENTILES]
+    print(f"{'bucket':<20} " + " ".join(f"{c:>9}" for c in columns))
+    for t, r in results.items():
+        print(f"{t:<20} " + " ".join(f"{'-' if r[c] is None else r[c]:>9}" for c in columns))
+    if not results:
+        print(f"No {args.metric} readings between {start} and {end}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
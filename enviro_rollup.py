@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Rollups
+Compacts raw readings into 1-minute, 1-hour and 1-day tiers (min, max,
+mean and count per metric), each with its own retention, so years of
+history fit on the SD card
+
+Usage:
+  python3 enviro_rollup.py                          Roll up new data, archive closed days, apply retention
+  python3 enviro_rollup.py query START END SECONDS  Rows at (at least) that resolution
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+# (name, bucket seconds, characters of the bucket start that name its file)
+TIERS = [
+    ("1m", 60, 10),       # 1m_YYYY-MM-DD.jsonl
+    ("1h", 3600, 7),      # 1h_YYYY-MM.jsonl
+    ("1d", 86400, 4),     # 1d_YYYY.jsonl
+]
+
+# Days to keep each tier (None = forever). Data is only ever expired once
+# the next coarser tier has consumed it.
+RETENTION_DAYS = {
+    "raw": 7,
+    "archive": 366,     # Raw days compressed by enviro_archive
+    "1m": 31,
+    "1h": 366,
+    "1d": None,
+}
+
+
+def rollup_dir(data_dir=DATA_DIR):
+    return Path(data_dir) / "rollups"
+
+
+def _state_file(data_dir):
+    return rollup_dir(data_dir) / "state.json"
+
+
+def load_state(data_dir=DATA_DIR):
+    path = _state_file(data_dir)
+    if path.exists():
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, data_dir=DATA_DIR):
+    path = _state_file(data_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _source_files(tier_index, data_dir):
+    """Input files for a tier, oldest first (a legacy .json sorts before its day's .jsonl)"""
+    if tier_index == 0:
+        return sorted(list(Path(data_dir).glob("enviro_????-??-??.jsonl")) +
+                      list(Path(data_dir).glob("enviro_????-??-??.json")))
+    name = TIERS[tier_index - 1][0]
+    return sorted(rollup_dir(data_dir).glob(f"{name}_*.jsonl"))
+
+
+def _tier_file(tier_index, bucket_start, data_dir):
+    name, _, width = TIERS[tier_index]
+    return rollup_dir(data_dir) / f"{name}_{bucket_start[:width]}.jsonl"
+
+
+def _read_new_lines(path, offset):
+    """Complete lines appended to path since offset, and the new offset"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = []
+    for line in data[:end].splitlines():
+        try:
+            lines.append(json.loads(line))
+        except ValueError:
+            pass  # Torn line from an interrupted write
+    return lines, offset + end
+
+
+def _read_legacy(path, offset):
+    """Readings of an old whole-document day file past the first `offset`, and the new count"""
+    try:
+        with open(path, 'r') as f:
+            readings = json.load(f).get("readings", [])
+    except ValueError:
+        return [], offset  # Caught mid-rewrite; read it next time
+    return readings[offset:], len(readings)
+
+
+def _reading_metrics(reading):
+    """A raw reading as single-sample rollup metrics"""
+    metrics = {}
+    for name, value in reading.items():
+        if isinstance(value, dict):
+            # e.g. accelerometer {x, y, z} -> accelerometer.x, ...
+            metrics.update(_reading_metrics({f"{name}.{k}": v for k, v in value.items()}))
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+            continue
+        metrics[name] = {"min": value, "max": value, "mean": value, "count": 1}
+    return metrics
+
+
+def merge_metrics(into, metrics):
+    """Fold rollup metrics into an accumulating bucket"""
+    for name, m in metrics.items():
+        acc = into.get(name)
+        if acc is None:
+            into[name] = dict(m)
+            continue
+        count = acc["count"] + m["count"]
+        acc["mean"] += (m["mean"] - acc["mean"]) * m["count"] / count
+        acc["min"] = min(acc["min"], m["min"])
+        acc["max"] = max(acc["max"], m["max"])
+        acc["count"] = count
+    return into
+
+
+def bucket_start(timestamp, seconds):
+    """Start of the bucket a naive ISO timestamp falls in"""
+    us = enviro_storage.timestamp_us(timestamp)
+    size = int(seconds * 1000000)
+    return enviro_storage.from_timestamp_us(us - us % size)
+
+
+def _recover(tier_index, tier_state, data_dir):
+    """Drop output from a run that crashed before saving its state"""
+    out = tier_state.get("out")
+    if out is None:
+        return  # Nothing committed yet (or the state file was lost) - keep files
+    name = TIERS[tier_index][0]
+    for path in sorted(rollup_dir(data_dir).glob(f"{name}_*.jsonl")):
+        if path.name > out["file"]:
+            path.unlink()
+        elif path.name == out["file"] and path.stat().st_size > out["size"]:
+            os.truncate(path, out["size"])
+
+
+def _roll_tier(tier_index, tier_state, data_dir):
+    """Consume new input for one tier; returns rows written"""
+    _, seconds, _ = TIERS[tier_index]
+    source = tier_state.get("source")
+    open_row = tier_state.get("open")
+    written = 0
+
+    def emit(row):
+        nonlocal written
+        path = _tier_file(tier_index, row["t"], data_dir)
+        with open(path, 'a') as f:
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        tier_state["out"] = {"file": path.name, "size": path.stat().st_size}
+        written += 1
+
+    for path in _source_files(tier_index, data_dir):
+        if source is not None and path.name < source["file"]:
+            continue
+        offset = source["offset"] if source is not None and path.name == source["file"] else 0
+        if path.suffix == ".json":
+            items, offset = _read_legacy(path, offset)   # offset counts readings
+        else:
+            items, offset = _read_new_lines(path, offset)
+        source = {"file": path.name, "offset": offset}
+
+        for item in items:
+            if tier_index == 0:
+                ts = item.get("timestamp")
+                metrics = _reading_metrics(item)
+            else:
+                ts = item["t"]
+                metrics = item["metrics"]
+            if not ts:
+                continue
+            start = bucket_start(ts, seconds)
+            if open_row is not None and start != open_row["t"]:
+                if start < open_row["t"]:
+                    continue  # Out-of-order input (clock step); already rolled up
+                emit(open_row)
+                open_row = None
+            if open_row is None:
+                open_row = {"t": start, "metrics": {}}
+            merge_metrics(open_row["metrics"], metrics)
+
+    tier_state["source"] = source
+    tier_state["open"] = open_row
+    return written
+
+
+def rollup(data_dir=DATA_DIR):
+    """Roll up everything not yet rolled up; returns rows written per tier
+
+    Each tier keeps a byte-offset cursor into its input files (a reading
+    count for legacy .json days) plus the bucket still being filled, so a
+    run only reads data appended since the last one. A bucket is written
+    out once input from a later bucket arrives.
+    """
+    rollup_dir(data_dir).mkdir(exist_ok=True)
+    state = load_state(data_dir)
+    written = {}
+    for i, (name, _, _) in enumerate(TIERS):
+        tier_state = state.setdefault(name, {})
+        _recover(i, tier_state, data_dir)
+        written[name] = _roll_tier(i, tier_state, data_dir)
+        save_state(state, data_dir)
+    return written
+
+
+def apply_retention(data_dir=DATA_DIR, now=None):
+    """Delete expired files that a coarser tier has already consumed"""
+    now = now or datetime.now()
+    state = load_state(data_dir)
+    removed = []
+
+    # Raw day files (and their stats sidecars), consumed by the 1m tier;
+    # archived and columnar days are kept for the (longer) archive period
+    cursor = (state.get("1m", {}).get("source") or {}).get("file", "")
+    for path in Path(data_dir).glob("enviro_*"):
+        file_datetime = enviro_storage.file_date(path)
+        if file_datetime is None:
+            continue
+        day = file_datetime.strftime("%Y-%m-%d")
+        archived = any((Path(data_dir) / f"enviro_{day}{suffix}").exists() for suffix in (".jsonl.gz", ".col"))
+        days = RETENTION_DAYS["archive" if archived else "raw"]
+        if days is None or file_datetime >= now - timedelta(days=days):
+            continue
+        if enviro_storage.day_file(day, data_dir).name >= cursor:
+            continue  # Not rolled up yet
+        path.unlink()
+        removed.append(path)
+
+    for i, (name, _, width) in enumerate(TIERS):
+        days = RETENTION_DAYS[name]
+        if days is None:
+            continue
+        cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d")[:width]
+        consumer = TIERS[i + 1][0] if i + 1 < len(TIERS) else None
+        cursor = (state.get(consumer, {}).get("source") or {}).get("file", "") if consumer else None
+        for path in rollup_dir(data_dir).glob(f"{name}_*.jsonl"):
+            period = path.stem[len(name) + 1:]
+            if period >= cutoff:
+                continue
+            if cursor is not None and path.name >= cursor:
+                continue
+            path.unlink()
+            removed.append(path)
+
+    return removed
+
+
+def query(start, end, resolution, data_dir=DATA_DIR):
+    """Rows between start and end (naive ISO) at the given resolution (s)
+
+    Reads the coarsest tier whose buckets are no larger than the requested
+    resolution and merges its rows into resolution-sized buckets. Returns a
+    list of {"t", "metrics": {name: {min, max, mean, count}}}.
+    """
+    tier_index = None
+    for i, (_, seconds, _) in enumerate(TIERS):
+        if seconds <= resolution:
+            tier_index = i
+
+    if tier_index is None:
+        source = []
+        day = datetime.fromisoformat(start[:10])
+        while day.strftime("%Y-%m-%d") <= end[:10]:
+            for reading in enviro_storage.iter_readings(day.strftime("%Y-%m-%d"), data_dir, start, end):
+                source.append((reading.get("timestamp"), _reading_metrics(reading)))
+            day += timedelta(days=1)
+    else:
+        name, _, width = TIERS[tier_index]
+        source = []
+        for path in sorted(rollup_dir(data_dir).glob(f"{name}_*.jsonl")):
+            period = path.stem[len(name) + 1:]
+            if period < start[:width] or period > end[:width]:
+                continue
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue
+                    source.append((row["t"], row["metrics"]))
+
+    rows = []
+    for ts, metrics in source:
+        if not ts or ts < start or ts > end:
+            continue
+        t = bucket_start(ts, resolution)
+        if not rows or rows[-1]["t"] != t:
+            rows.append({"t": t, "metrics": {}})
+        merge_metrics(rows[-1]["metrics"], metrics)
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        if len(sys.argv) != 5:
+            print(__doc__.strip(), file=sys.stderr)
+            sys.exit(2)
+        for row in query(sys.argv[2], sys.argv[3], float(sys.argv[4])):
+            print(json.dumps(row))
+    else:
+        written = rollup()
+        print("Rolled up: " + ", ".join(f"{n} {name} rows" for name, n in written.items()))
+        import enviro_archive
+        enviro_archive.archive_closed_days()
+        for path in apply_retention():
+            print(f"Cleaned up old log: {path.name}")
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Sensor Scheduler
+One config-driven pipeline for every board: each sensor is a plugin with
+its own sample period, a deadline/priority scheduler runs them one at a
+time (so I2C access is serialised), and a log record with the mean of each
+field since the last record (or the plugin's own aggregation, e.g. energy
+averaged noise levels) is written every `interval` seconds. Driver
+modules are only imported for the plugins the config uses.
+
+Usage: python3 enviro_scheduler.py [--config FILE | --board NAME] [--once] [--publish]
+
+Config (JSON):
+  {"interval": 300,
+   "sensors": [
+     {"plugin": "bh1750", "every": 1},
+     {"plugin": "bmp280", "every": 60, "priority": 0},
+     {"plugin": "bme280", "every": 300, "fields": ["humidity_pct"]}]}
+"""
+
+import argparse
+import heapq
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+CONFIG_FILE = Path(os.environ.get("ENVIROPI_SENSORS_CONFIG", "/home/enviropi/sensors.json"))
+
+# A field not sampled for this many of its periods is logged as null
+STALE_PERIODS = 3
+
+# How long --once waits for background sensors (PMS5003, noise, motion) to have data
+WARMUP = 3.0
+
+
+class SensorPlugin:
+    """One sensor: open() lazily imports and sets up the driver, read() samples it
+
+    aggregate is how a record combines a field's samples: "mean", "last",
+    or a dict of field -> "mean" / "energy" (dB levels) / "max" / "last".
+    """
+
+    fields = []
+    aggregate = "mean"
+
+    def __init__(self, **options):
+        self.options = options
+
+    def open(self):
+        pass
+
+    def wait(self, timeout):
+        """Block until read() has data (background capture); True if it has"""
+        return True
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class BMP280Plugin(SensorPlugin):
+    fields = ["temperature_c", "pressure_hpa"]
+
+    def open(self):
+        import enviro_bmp280
+        import enviro_i2c
+        self.bmp280 = enviro_bmp280
+        self.bus = enviro_i2c.open_bus(1, board="enviropi", module="smbus")
+        self.addr = self.options.get("addr", enviro_bmp280.BMP280_ADDR)
+        self.cal = enviro_bmp280.read_calibration(self.bus, self.addr)
+
+    def read(self):
+        adc_t, adc_p = self.bmp280.read_forced(self.bus, self.options.get("profile", "enviropi"), self.addr)
+        temp, t_fine = self.bmp280.compensate_temp(adc_t, self.cal)
+        pressure = self.bmp280.compensate_pressure(adc_p, t_fine, self.cal)
+        return {"temperature_c": round(temp, 2), "pressure_hpa": round(pressure, 2)}
+
+
+class BH1750Plugin(SensorPlugin):
+    fields = ["light_lux"]
+
+    def open(self):
+        import enviro_bh1750
+        import enviro_i2c
+        bus = enviro_i2c.open_bus(1, board="enviropi", module="smbus")
+        self.sensor = enviro_bh1750.BH1750(bus, self.options.get("addr", enviro_bh1750.BH1750_ADDR))
+
+    def read(self):
+        return {"light_lux": round(self.sensor.read(), 2)}
+
+
+class BME280Plugin(SensorPlugin):
+    fields = ["temperature_c", "pressure_hpa", "humidity_pct"]
+    _driver = None  # Shared by every bme280 entry (e.g. pressure and humidity at different rates)
+
+    def open(self):
+        if BME280Plugin._driver is None:
+            from bme280 import BME280
+            import enviro_i2c
+            driver = BME280(i2c_dev=enviro_i2c.open_bus(1, board="enviroplus"))
+            driver.get_temperature()  # Discard the warm-up reading
+            BME280Plugin._driver = driver
+        self.sensor = BME280Plugin._driver
+
+    def read(self):
+        getters = {
+            "temperature_c": self.sensor.get_temperature,
+            "pressure_hpa": self.sensor.get_pressure,
+            "humidity_pct": self.sensor.get_humidity,
+        }
+        return {field: round(getters[field](), 2) for field in self.options.get("fields", self.fields)}
+
+    def close(self):
+        BME280Plugin._driver = None
+
+
+class LTR559Plugin(SensorPlugin):
+    fields = ["light_lux"]
+
+    def open(self):
+        from ltr559 import LTR559
+        import enviro_i2c
+        self.sensor = LTR559(i2c_dev=enviro_i2c.open_bus(1, board="enviroplus"))
+
+    def read(self):
+        return {"light_lux": round(self.sensor.get_lux(), 2)}
+
+
+class EnviroPHATPlugin(SensorPlugin):
+    """Enviro pHAT via the envirophat library (BMP280 + TCS3472)"""
+
+    fields = ["temperature_c", "pressure_hpa", "light_lux"]
+
+    def open(self):
+        from envirophat import light, weather
+        self.light, self.weather = light, weather
+
+    def read(self):
+        return {
+            "temperature_c": round(self.weather.temperature(), 2),
+            "pressure_hpa": round(self.weather.pressure(), 2),
+            "light_lux": round(self.light.light(), 2),
+        }
+
+
+class AccelerometerPlugin(SensorPlugin):
+    """Enviro pHAT LSM303D captured continuously; each read summarises the vibration since the last"""
+
+    fields = ["accelerometer", "motion_samples"]
+    aggregate = "last"
+
+    def open(self):
+        import enviro_motion
+        self.fields = self.fields + enviro_motion.VIBRATION_FIELDS
+        self.monitor = enviro_motion.MotionMonitor(
+            enviro_motion.envirophat_accelerometer(),
+            self.options.get("rate", enviro_motion.SAMPLE_RATE))
+        self.monitor.start()
+
+    def wait(self, timeout):
+        return self.monitor.wait(timeout)
+
+    def read(self):
+        return self.monitor.summary()
+
+    def close(self):
+        self.monitor.stop()
+
+
+class PMS5003Plugin(SensorPlugin):
+    """UART sensor with its own reader thread; each read takes the running mean"""
+
+    fields = ["pm1_ug_m3", "pm25_ug_m3", "pm10_ug_m3"]
+
+    def open(self):
+        import enviro_pms5003
+        self.reader = enviro_pms5003.PMS5003Reader(enviro_pms5003.open_serial(
+            self.options.get("device", enviro_pms5003.DEVICE)))
+        self.reader.start()
+
+    def wait(self, timeout):
+        return self.reader.wait(timeout)
+
+    def read(self):
+        return self.reader.summary()
+
+    def close(self):
+        self.reader.stop()
+        self.reader.stream.close()
+
+
+class NoisePlugin(SensorPlugin):
+    """Microphone bands; capture runs continuously, each read summarises it
+
+    Levels are Leq in dB, so a record energy-averages them; peaks take the max.
+    """
+
+    fields = ["noise_low", "noise_mid", "noise_high", "noise_amp",
+              "noise_low_peak", "noise_mid_peak", "noise_high_peak", "noise_peak"]
+    aggregate = {field: "max" if field.endswith("_peak") else "energy" for field in fields}
+
+    def open(self):
+        import enviro_noise
+        self.monitor = enviro_noise.NoiseMonitor(enviro_noise.default_source())
+        self.monitor.start()
+
+    def wait(self, timeout):
+        return self.monitor.wait(timeout)
+
+    def read(self):
+        return self.monitor.summary()
+
+    def close(self):
+        self.monitor.stop()
+
+
+PLUGINS = {
+    "bmp280": BMP280Plugin,
+    "bh1750": BH1750Plugin,
+    "bme280": BME280Plugin,
+    "ltr559": LTR559Plugin,
+    "envirophat": EnviroPHATPlugin,
+    "accelerometer": AccelerometerPlugin,
+    "pms5003": PMS5003Plugin,
+    "noise": NoisePlugin,
+}
+
+# Built-in configs matching what each logger reads today, at sensible rates
+BOARDS = {
+    "enviropi": {"interval": 300, "sensors": [
+        {"plugin": "bmp280", "every": 60, "priority": 0},
+        {"plugin": "bh1750", "every": 1},
+    ]},
+    "enviroplus": {"interval": 300, "sensors": [
+        {"plugin": "bme280", "every": 60, "priority": 0, "fields": ["temperature_c", "pressure_hpa"]},
+        {"plugin": "bme280", "every": 300, "fields": ["humidity_pct"]},
+        {"plugin": "ltr559", "every": 1},
+        {"plugin": "noise", "every": 60},
+        {"plugin": "pms5003", "every": 60},
+    ]},
+    "envirophat": {"interval": 300, "sensors": [
+        {"plugin": "envirophat", "every": 60},
+        {"plugin": "accelerometer", "every": 300},
+    ]},
+}
+
+
+def load_plugin(name):
+    """Plugin class by registry name, or "module:Class" for one kept elsewhere"""
+    if name in PLUGINS:
+        return PLUGINS[name]
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown sensor plugin {name!r}")
+    return getattr(importlib.import_module(module), attr)
+
+
+class Task:
+    """A scheduled plugin: period, priority and when it is next due"""
+
+    def __init__(self, plugin, every, priority=10, name=None):
+        self.plugin = plugin
+        self.every = every
+        self.priority = priority
+        self.name = name or type(plugin).__name__
+        self.opened = False
+        self.runs = 0
+        self.errors = 0
+
+
+class Scheduler:
+    """Earliest-deadline-first over sensor tasks plus the periodic log record
+
+    Tasks run one at a time from a heap keyed on (due, priority), so bus
+    access is serialised and a slow sensor is only read at its own rate.
+    Due times advance by whole periods, so they don't drift; slots missed
+    while another task overran are skipped, not run back to back.
+    """
+
+    def __init__(self, tasks, interval, sink, clock=time.monotonic, sleep=time.sleep, publish=None):
+        self.tasks = tasks
+        self.interval = interval
+        self.sink = sink
+        self.clock = clock
+        self.sleep = sleep
+        self.publish = publish
+        self.latest = {}    # field -> (value, clock time, period)
+        self._sums = {}     # field -> [how, total, count] since the last record
+        self._heap = []
+        self._seq = 0
+
+    def _push(self, due, priority, item):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, priority, self._seq, item))
+
+    def sample(self, task, now):
+        """Run one sensor task and fold its values in"""
+        plugin = task.plugin
+        try:
+            self._open(task)
+            values = plugin.read()
+        except Exception as e:
+            print(f"{task.name} error: {e}")
+            task.errors += 1
+            if task.opened:
+                try:
+                    plugin.close()
+                except Exception:
+                    pass
+            task.opened = False  # Re-open on its next turn
+            return
+        task.runs += 1
+        aggregate = getattr(plugin, "aggregate", "mean")
+        for field, value in values.items():
+            if value is None:
+                continue
+            self.latest[field] = (value, now, task.every)
+            how = aggregate.get(field, "mean") if isinstance(aggregate, dict) else aggregate
+            if how == "last" or not isinstance(value, (int, float)):
+                continue
+            acc = self._sums.setdefault(field, [how, None if how == "max" else 0.0, 0])
+            if how == "max":
+                acc[1] = value if acc[1] is None else max(acc[1], value)
+            elif how == "energy":
+                acc[1] += 10 ** (value / 10)
+            else:
+                acc[1] += value
+            acc[2] += 1
+
+    def _open(self, task):
+        if not task.opened:
+            task.plugin.open()
+            task.opened = True
+
+    def record(self, now):
+        """Log record: each field aggregated since the last one, else its latest value"""
+        reading = {"timestamp": datetime.now().isoformat()}
+        for field, (value, at, every) in self.latest.items():
+            acc = self._sums.get(field)
+            if acc and acc[2]:
+                how, total, count = acc
+                if how == "max":
+                    reading[field] = total
+                elif how == "energy":
+                    reading[field] = round(10 * math.log10(total / count), 2)
+                else:
+                    reading[field] = round(total / count, 2)
+            elif now - at <= every * STALE_PERIODS:
+                reading[field] = value
+            else:
+                reading[field] = None
+        self._sums = {}
+        return reading
+
+    def snapshot(self):
+        """Latest value of every field, for the shared-memory bus"""
+        reading = {"timestamp": datetime.now().isoformat()}
+        reading.update({field: value for field, (value, _, _) in self.latest.items()})
+        return reading
+
+    def run(self, until=None):
+        """Run until the clock passes `until` (forever if None)"""
+        start = self.clock()
+        for task in self.tasks:
+            self._push(start, task.priority, task)
+        self._push(start + self.interval, -1, None)  # The log record, ahead of sensors
+
+        while self._heap:
+            due, priority, _, task = self._heap[0]
+            if until is not None and due > until:
+                return
+            delay = due - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            heapq.heappop(self._heap)
+            now = self.clock()
+
+            if task is None:
+                self.sink(self.record(now))
+                every = self.interval
+            else:
+                self.sample(task, now)
+                if self.publish is not None:
+                    self.publish(self.snapshot())
+                every = task.every
+
+            due += every
+            now = self.clock()
+            if due <= now:
+                due += (now - due) // every * every + every  # Skip missed slots
+            self._push(due, priority, task)
+
+    def run_once(self, warmup=WARMUP):
+        """Read every sensor once and return a single record (cron mode)
+
+        Every plugin is opened first, then background ones (PMS5003, noise,
+        motion) get up to `warmup` seconds, together, to have something to read.
+        """
+        for task in self.tasks:
+            try:
+                self._open(task)
+            except Exception as e:
+                print(f"{task.name} error: {e}")  # sample() tries again
+        deadline = time.monotonic() + warmup
+        for task in self.tasks:
+            wait = getattr(task.plugin, "wait", None)
+            if task.opened and wait and not wait(max(0.0, deadline - time.monotonic())):
+                print(f"{task.name}: no data after {warmup:g}s")
+        now = self.clock()
+        for task in sorted(self.tasks, key=lambda t: t.priority):
+            self.sample(task, now)
+        reading = self.record(now)
+        for task in self.tasks:
+            if task.opened:
+                task.plugin.close()
+        return reading
+
+
+def build_tasks(config):
+    tasks = []
+    for spec in config["sensors"]:
+        options = {k: v for k, v in spec.items() if k not in ("plugin", "every", "priority")}
+        plugin = load_plugin(spec["plugin"])(**options)
+        tasks.append(Task(plugin, spec.get("every", config.get("interval", 300)),
+                          spec.get("priority", 10), spec["plugin"]))
+    return tasks
+
+
+def load_config(path=CONFIG_FILE):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def log_reading(reading, data_dir=DATA_DIR):
+    """Default sink: buffered append to the day file, check alerts, print a summary"""
+    import enviro_alerts
+    import enviro_writebuf
+    enviro_writebuf.append(reading, data_dir)
+    enviro_alerts.check(reading, data_dir)
+    values = ", ".join(f"{k}={v}" for k, v in reading.items() if k != "timestamp")
+    print(f"[{reading['timestamp']}] {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EnviroPi multi-rate sensor scheduler")
+    parser.add_argument("--config", type=Path, help=f"sensor config (default: {CONFIG_FILE})")
+    parser.add_argument("--board", choices=list(BOARDS), help="use a built-in config")
+    parser.add_argument("--once", action="store_true", help="read every sensor once, log, and exit (cron)")
+    parser.add_argument("--publish", action="store_true", help="also publish to the shared-memory sample bus")
+    args = parser.parse_args()
+
+    config = BOARDS[args.board] if args.board else load_config(args.config or CONFIG_FILE)
+    tasks = build_tasks(config)
+    DATA_DIR.mkdir(exist_ok=True)
+
+    scheduler = Scheduler(tasks, config.get("interval", 300), log_reading)
+    if args.once:
+        log_reading(scheduler.run_once())
+        return 0
+
+    ring = None
+    if args.publish:
+        import enviro_bus
+        ring = enviro_bus.SampleRing(create=True)
+        scheduler.publish = ring.publish
+
+    import enviro_daemon
+    enviro_daemon.exit_on_sigterm()
+    rates = ", ".join(f"{t.name} every {t.every:g}s" for t in tasks)
+    print(f"EnviroPi scheduler - {rates}; logging every {scheduler.interval:g}s")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("\nScheduler stopped.")
+    finally:
+        for task in tasks:
+            if task.opened:
+                task.plugin.close()
+        if ring is not None:
+            ring.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
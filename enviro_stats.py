@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Daily Aggregates
+Running count/sum/min/max/mean/variance per metric, kept in a small
+sidecar next to each day file and updated in O(1) as readings are logged
+
+Usage: python3 enviro_stats.py START_DATE [END_DATE]
+Prints combined stats for the date range as JSON
+"""
+
+import json
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+
+def stats_file(day, data_dir=DATA_DIR):
+    """Path of the aggregate sidecar for a day"""
+    return Path(data_dir) / f"enviro_{day}.stats.json"
+
+
+def new_day(day):
+    """Empty aggregate for a day"""
+    return {"date": day, "count": 0, "first": None, "last": None, "bytes": 0, "metrics": {}}
+
+
+def update(agg, reading):
+    """Fold one reading into an aggregate (Welford's online mean/variance)
+
+    Every numeric field is aggregated, so new sensors need no changes here.
+    """
+    ts = reading.get("timestamp")
+    agg["count"] += 1
+    if agg["first"] is None:
+        agg["first"] = ts
+    agg["last"] = ts
+
+    for name, value in reading.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            continue
+        m = agg["metrics"].get(name)
+        if m is None:
+            m = agg["metrics"][name] = {
+                "count": 0, "sum": 0.0, "min": value, "max": value,
+                "mean": 0.0, "m2": 0.0, "first": ts, "last": ts,
+            }
+        m["count"] += 1
+        m["sum"] += value
+        m["min"] = min(m["min"], value)
+        m["max"] = max(m["max"], value)
+        delta = value - m["mean"]
+        m["mean"] += delta / m["count"]
+        m["m2"] += delta * (value - m["mean"])
+        m["last"] = ts
+    return agg
+
+
+def merge(a, b):
+    """Combine two aggregates (Chan et al. parallel variance); b is later"""
+    out = {
+        "date": a.get("date"),
+        "count": a["count"] + b["count"],
+        "first": a["first"] or b["first"],
+        "last": b["last"] or a["last"],
+        "metrics": {},
+    }
+    for name in set(a["metrics"]) | set(b["metrics"]):
+        ma, mb = a["metrics"].get(name), b["metrics"].get(name)
+        if ma is None or mb is None:
+            out["metrics"][name] = dict(ma or mb)
+            continue
+        n = ma["count"] + mb["count"]
+        delta = mb["mean"] - ma["mean"]
+        out["metrics"][name] = {
+            "count": n,
+            "sum": ma["sum"] + mb["sum"],
+            "min": min(ma["min"], mb["min"]),
+            "max": max(ma["max"], mb["max"]),
+            "mean": ma["mean"] + delta * mb["count"] / n,
+            "m2": ma["m2"] + mb["m2"] + delta * delta * ma["count"] * mb["count"] / n,
+            "first": ma["first"],
+            "last": mb["last"],
+        }
+    return out
+
+
+def summary(agg):
+    """Report-friendly view: count/mean/min/max/stddev per metric"""
+    metrics = {}
+    for name, m in agg["metrics"].items():
+        metrics[name] = {
+            "count": m["count"],
+            "mean": m["mean"],
+            "min": m["min"],
+            "max": m["max"],
+            "stddev": math.sqrt(m["m2"] / (m["count"] - 1)) if m["count"] > 1 else 0.0,
+            "first": m["first"],
+            "last": m["last"],
+        }
+    return {"count": agg["count"], "first": agg["first"], "last": agg["last"], "metrics": metrics}
+
+
+def rebuild_day(day, data_dir=DATA_DIR):
+    """Recompute a day's aggregate from its readings"""
+    agg = new_day(day)
+    for reading in enviro_storage.iter_readings(day, data_dir):
+        update(agg, reading)
+    path = enviro_storage.day_file(day, data_dir)
+    agg["bytes"] = path.stat().st_size if path.exists() else 0
+    return agg
+
+
+def save_day(agg, data_dir=DATA_DIR):
+    """Atomically replace a day's sidecar"""
+    path = stats_file(agg["date"], data_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(agg, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_day(day, data_dir=DATA_DIR):
+    """A day's aggregate, rebuilt from the readings if the sidecar is missing"""
+    path = stats_file(day, data_dir)
+    if path.exists():
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            pass  # Interrupted write; rebuild below
+    agg = rebuild_day(day, data_dir)
+    if agg["count"]:
+        save_day(agg, data_dir)
+    return agg
+
+
+def record(reading, day, data_dir, size_before, size_after):
+    """Update a day's sidecar after a reading was appended to its day file
+
+    The sidecar remembers how many bytes of the day file it covers; if that
+    doesn't match where this append started (first reading of a day logged
+    before the sidecar existed, or a crash between the two writes), the day
+    is rebuilt from its readings instead.
+    """
+    return record_many([reading], day, data_dir, size_before, size_after)
+
+
+def record_many(readings, day, data_dir, size_before, size_after):
+    """record() for several readings appended to a day file in one go"""
+    agg = None
+    path = stats_file(day, data_dir)
+    if path.exists():
+        try:
+            with open(path, 'r') as f:
+                agg = json.load(f)
+        except ValueError:
+            agg = None
+
+    # A new day file starts a new aggregate unless the day already has
+    # readings elsewhere (e.g. a late write to a day that's been archived)
+    if agg is None and size_before == 0 and \
+            not any(p.exists() for p in enviro_storage.earlier_day_files(day, data_dir)):
+        agg = new_day(day)
+    if agg is not None and agg.get("bytes") == size_before:
+        for reading in readings:
+            update(agg, reading)
+        agg["bytes"] = size_after
+    else:
+        agg = rebuild_day(day, data_dir)
+
+    save_day(agg, data_dir)
+    return agg
+
+
+def range_stats(start, end=None, data_dir=DATA_DIR):
+    """Combined aggregate for every day from start to end (inclusive)"""
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.strptime(end or start, "%Y-%m-%d")
+
+    agg = new_day(start)
+    day = start_date
+    while day <= end_date:
+        agg = merge(agg, load_day(day.strftime("%Y-%m-%d"), data_dir))
+        day += timedelta(days=1)
+    return agg
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(2)
+    start = sys.argv[1]
+    end = sys.argv[2] if len(sys.argv) > 2 else start
+    result = summary(range_stats(start, end))
+    if not result["count"]:
+        print(f"No data for {start}..{end}", file=sys.stderr)
+        sys.exit(1)
+    json.dump({"start": start, "end": end, **result}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Storage
+Append-only JSON Lines day files: one reading per line, O(1) per sample
+
+Usage: python3 enviro_storage.py [YYYY-MM-DD]
+Prints the day as the classic {"date", "readings"} JSON document
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import enviro_stats
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+# Reference point for integer timestamps (naive, like the readings)
+EPOCH = datetime(1970, 1, 1)
+
+
+def day_file(day, data_dir=DATA_DIR):
+    """Path of the append-only log for a day (YYYY-MM-DD)"""
+    return Path(data_dir) / f"enviro_{day}.jsonl"
+
+
+def legacy_day_file(day, data_dir=DATA_DIR):
+    """Path of the old whole-document JSON log for a day"""
+    return Path(data_dir) / f"enviro_{day}.json"
+
+
+def earlier_day_files(day, data_dir=DATA_DIR):
+    """Files that can hold readings logged before a day's current day file
+    (legacy document, columnar conversion, archive); not all of them exist"""
+    data_dir = Path(data_dir)
+    return [legacy_day_file(day, data_dir), data_dir / f"enviro_{day}.col",
+            data_dir / f"enviro_{day}.jsonl.gz"]
+
+
+def file_date(path):
+    """Date a data file belongs to, or None if the name doesn't match"""
+    name = Path(path).name
+    if not name.startswith("enviro_"):
+        return None
+    try:
+        return datetime.strptime(name[7:17], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def timestamp_us(timestamp):
+    """Reading timestamp (naive ISO string) as integer microseconds
+
+    Counted from the naive 1970-01-01 so local wall-clock time round-trips
+    exactly through from_timestamp_us().
+    """
+    return (datetime.fromisoformat(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def from_timestamp_us(us):
+    """Inverse of timestamp_us(): back to the isoformat() string"""
+    return (EPOCH + timedelta(microseconds=int(us))).isoformat()
+
+
+def append_reading(reading, data_dir=DATA_DIR, update_stats=True):
+    """Append one reading to its day file as a single line
+
+    Also folds the reading into the day's aggregate sidecar (enviro_stats).
+    """
+    append_readings([reading], data_dir, update_stats)
+    return reading["timestamp"][:10]
+
+
+def append_readings(readings, data_dir=DATA_DIR, update_stats=True, fsync=False):
+    """Append readings to their day files: one write (and fsync) per day
+
+    Returns the number of bytes written.
+    """
+    days = {}
+    for reading in readings:
+        days.setdefault(reading["timestamp"][:10], []).append(reading)
+
+    written = 0
+    for day, day_readings in days.items():
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in day_readings).encode()
+
+        fd = os.open(day_file(day, data_dir), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # A crash mid-write can leave a torn last line; start on a fresh one
+            # so only that reading is lost, not the next one too
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                data = b"\n" + data
+            # One write() on an O_APPEND fd lands as whole lines
+            written += os.write(fd, data)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if fsync and size == 0:
+            # New day file: make its directory entry durable too
+            dir_fd = os.open(data_dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+        if update_stats:
+            try:
+                enviro_stats.record_many(day_readings, day, data_dir, size, size + len(data))
+            except (OSError, ValueError) as e:
+                print(f"Stats sidecar not updated: {e}")
+
+    return written
+
+
+def iter_readings(day, data_dir=DATA_DIR, start=None, end=None, day_file_lines=True):
+    """Yield a day's readings in logged order
+
+    start/end (naive ISO, inclusive) limit them to a time range; an
+    archived day then only decompresses the blocks that cover it.
+    day_file_lines=False leaves out the JSON Lines day file itself.
+    """
+    def in_range(readings):
+        if start is None and end is None:
+            yield from readings
+            return
+        for reading in readings:
+            ts = reading.get("timestamp") or ""
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                yield reading
+
+    legacy = legacy_day_file(day, data_dir)
+    if legacy.exists():
+        with open(legacy, 'r') as f:
+            yield from in_range(json.load(f).get("readings", []))
+
+    # A day converted to the columnar format, then (once closed) the
+    # archive of anything logged for it after that, then its day file from
+    # the first byte neither of them already holds
+    path = day_file(day, data_dir)
+    archive = Path(data_dir) / f"enviro_{day}.jsonl.gz"
+    skip = 0
+    held = False
+    col = Path(data_dir) / f"enviro_{day}.col"
+    if col.exists():
+        import enviro_columnar
+        converted = enviro_columnar.ColumnarDay(col)
+        yield from in_range(converted.readings())
+        skip = converted.covered_bytes(path)
+        held = converted.holds_archive(archive)   # Converted from the archive
+
+    # A closed day is compressed at rollover (anything logged for it
+    # afterwards goes to a new day file, read after the archive)
+    if archive.exists() and not held:
+        import enviro_archive
+        yield from enviro_archive.ArchiveDay(day, data_dir).readings(start, end)
+
+    if not day_file_lines or not path.exists():
+        return
+    with open(path, 'rb') as f:
+        f.seek(skip)
+        yield from in_range(_parse_lines(f))
+
+
+def _parse_lines(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            pass  # Torn line from an interrupted write
+
+
+def load_day(day, data_dir=DATA_DIR):
+    """Load a day in the classic {"date", "readings"} layout"""
+    return {"date": day, "readings": list(iter_readings(day, data_dir))}
+
+
+if __name__ == "__main__":
+    day = sys.argv[1] if len(sys.argv) > 1 else datetime.now().strftime("%Y-%m-%d")
+    data = load_day(day)
+    if not data["readings"]:
+        print(f"No data for {day}", file=sys.stderr)
+        sys.exit(1)
+    json.dump(data, sys.stdout, indent=2)
+    print()
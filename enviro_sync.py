@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Sync
+Mirrors a Pi's data directory locally, transferring only readings appended
+since the last pull. A per-host cursor records how far into each day file
+the mirror has got, so missed days are picked up after an outage and the
+cost of a pull depends only on what is new.
+
+Usage: python3 enviro_sync.py SOURCE [--mirror DIR] [--since YYYY-MM-DD]
+SOURCE is user@host[:/data/dir] or a local directory
+"""
+
+import argparse
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import enviro_stats
+
+# Where the Pi keeps its data
+REMOTE_DATA_DIR = "/home/enviropi/enviro_data"
+
+# Local mirrors, one directory per host
+MIRROR_ROOT = Path(os.environ.get("ENVIROPI_MIRROR_DIR", str(Path.home() / "enviro_mirror")))
+
+# Day files worth mirroring (stats sidecars are rebuilt locally)
+DAY_FILE = re.compile(r"^enviro_\d{4}-\d{2}-\d{2}\.(json|jsonl|jsonl\.gz|jsonl\.gz\.idx|col)$")
+
+# Closed-day files the Pi replaces a day file with (archive, columnar); they
+# only change as a whole, so they are copied whole when their size changes
+SNAPSHOT_SUFFIXES = (".jsonl.gz", ".jsonl.gz.idx", ".col")
+
+SSH_OPTIONS = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+
+
+class LocalSource:
+    """A data directory on this machine (also used as a stand-in Pi in tests)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = self.path.resolve().name
+        self.bytes_read = 0
+
+    def list_files(self):
+        """{file name: size} for the day files in the directory"""
+        return {p.name: p.stat().st_size for p in self.path.iterdir() if DAY_FILE.match(p.name)}
+
+    def read(self, name, offset, length):
+        with open(self.path / name, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.bytes_read += len(data)
+        return data
+
+
+class SSHSource:
+    """A Pi's data directory over ssh; one round trip per changed file
+
+    Each ssh call gets `timeout` seconds, cut short by `deadline` (a
+    time.monotonic() value) when one is set.
+    """
+
+    def __init__(self, host, data_dir=REMOTE_DATA_DIR, timeout=60):
+        self.host = host
+        self.data_dir = data_dir
+        self.timeout = timeout
+        self.deadline = None
+        self.name = host.split("@")[-1]
+        self.bytes_read = 0
+
+    def _run(self, command):
+        timeout = self.timeout
+        if self.deadline is not None:
+            timeout = max(0.0, min(timeout, self.deadline - time.monotonic()))
+        result = subprocess.run(["ssh", *SSH_OPTIONS, self.host, command],
+                                capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            raise OSError(f"ssh {self.host}: {result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    def list_files(self):
+        out = self._run(f"find {shlex.quote(self.data_dir)} -maxdepth 1 -name 'enviro_*' -printf '%f %s\\n'")
+        files = {}
+        for line in out.decode().splitlines():
+            name, _, size = line.rpartition(" ")
+            if DAY_FILE.match(name):
+                files[name] = int(size)
+        return files
+
+    def read(self, name, offset, length):
+        path = shlex.quote(f"{self.data_dir}/{name}")
+        data = self._run(f"tail -c +{offset + 1} {path} | head -c {length}")
+        self.bytes_read += len(data)
+        return data
+
+
+def source_for(spec):
+    """LocalSource for an existing directory, else SSHSource for user@host[:dir]"""
+    if Path(spec).is_dir():
+        return LocalSource(spec)
+    host, _, data_dir = spec.partition(":")
+    return SSHSource(host, data_dir or REMOTE_DATA_DIR)
+
+
+def _cursor_file(mirror):
+    return Path(mirror) / ".sync_cursor.json"
+
+
+def load_cursor(mirror):
+    path = _cursor_file(mirror)
+    if path.exists():
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_cursor(cursor, mirror):
+    path = _cursor_file(mirror)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(cursor, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def check_deadline(deadline):
+    """Raise TimeoutError once a time.monotonic() deadline (if any) has passed"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError("sync deadline passed")
+
+
+def _recover(name, entry, mirror):
+    """Drop local bytes written after the cursor was last saved"""
+    path = Path(mirror) / name
+    if path.exists() and path.stat().st_size > entry["local"]:
+        os.truncate(path, entry["local"])
+
+
+def _copy_file(source, name, size, entry, mirror, deadline=None):
+    """Copy a whole file (legacy document, archive, columnar day); returns bytes"""
+    path = Path(mirror) / name
+    data = source.read(name, 0, size)
+    check_deadline(deadline)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    entry.update(remote=size, local=size)
+    return len(data)
+
+
+def _sync_day(source, name, size, entry, mirror, deadline=None):
+    """Pull the complete new lines of one day file; returns (bytes, readings)"""
+    path = Path(mirror) / name
+    day = name[7:17]
+
+    if name.endswith(".json"):
+        # Old whole-document format is rewritten in place - copy it whole
+        return _copy_file(source, name, size, entry, mirror, deadline), 0
+
+    data = source.read(name, entry["remote"], size - entry["remote"])
+    check_deadline(deadline)
+    end = data.rfind(b"\n") + 1  # Leave a line still being written for next time
+    if not end:
+        return 0, 0
+
+    readings = []
+    for line in data[:end].splitlines():
+        try:
+            readings.append(json.loads(line))
+        except ValueError:
+            pass  # Torn line on the Pi; kept byte-for-byte like the original
+
+    size_before = entry["local"]
+    with open(path, 'ab') as f:
+        f.write(data[:end])
+    entry.update(remote=entry["remote"] + end, local=size_before + end)
+    enviro_stats.record_many(readings, day, mirror, size_before, entry["local"])
+    return end, len(readings)
+
+
+def sync(source, mirror=None, since=None, deadline=None):
+    """Bring the mirror up to date with source; returns a summary dict
+
+    Each day file's cursor holds the remote byte offset consumed and the
+    local size it produced. A file that shrank on the source (restored or
+    rewritten) is pulled again from the start. Past `deadline` (a
+    time.monotonic() value) it stops with TimeoutError before writing
+    anything else, leaving the cursor consistent for the next pull.
+    """
+    mirror = Path(mirror or MIRROR_ROOT / source.name)
+    mirror.mkdir(parents=True, exist_ok=True)
+    cursor = load_cursor(mirror)
+    files = cursor["files"]
+    summary = {"files": 0, "bytes": 0, "readings": 0, "days": []}
+
+    listed = source.list_files()
+    check_deadline(deadline)
+    closed = set()   # Days whose archive or columnar file was (re)copied
+    for name, size in sorted(listed.items()):
+        if since and name[7:17] < since:
+            continue
+        entry = files.get(name)
+        if name.endswith(SNAPSHOT_SUFFIXES):
+            if entry is None or size != entry["remote"] or not (mirror / name).exists():
+                entry = files[name] = {"remote": 0, "local": 0}
+                summary["bytes"] += _copy_file(source, name, size, entry, mirror, deadline)
+                summary["files"] += 1
+                save_cursor(cursor, mirror)
+                closed.add(name[7:17])
+            continue
+        check_deadline(deadline)
+        if entry is not None:
+            _recover(name, entry, mirror)
+        if entry is None or size < entry["remote"]:
+            entry = {"remote": 0, "local": 0}
+            (mirror / name).unlink(missing_ok=True)
+            enviro_stats.stats_file(name[7:17], mirror).unlink(missing_ok=True)
+        if size == entry["remote"]:
+            continue
+
+        pulled, readings = _sync_day(source, name, size, entry, mirror, deadline)
+        files[name] = entry
+        save_cursor(cursor, mirror)
+        if pulled:
+            summary["files"] += 1
+            summary["bytes"] += pulled
+            summary["readings"] += readings
+            summary["days"].append(name[7:17])
+
+    # A closed day's archive (or columnar file) changed: it holds everything
+    # a mirrored copy of the day file (or of an archive the .col took over)
+    # did plus whatever was logged after that pull, so copies the Pi has
+    # since removed are dropped, and the day's stats are rebuilt from what
+    # the mirror now holds
+    for day in sorted(closed):
+        check_deadline(deadline)
+        before = enviro_stats.load_day(day, mirror)["count"] if enviro_stats.stats_file(day, mirror).exists() else 0
+        for suffix in (".jsonl",) + SNAPSHOT_SUFFIXES:
+            name = f"enviro_{day}{suffix}"
+            if name not in listed and (name in files or (mirror / name).exists()):
+                (mirror / name).unlink(missing_ok=True)
+                files.pop(name, None)
+                save_cursor(cursor, mirror)
+        agg = enviro_stats.rebuild_day(day, mirror)
+        enviro_stats.save_day(agg, mirror)
+        if agg["count"] > before:
+            summary["readings"] += agg["count"] - before
+            summary["days"].append(day)
+
+    summary["mirror"] = str(mirror)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror an EnviroPi's readings incrementally")
+    parser.add_argument("source", help="user@host[:/data/dir] or a local directory")
+    parser.add_argument("--mirror", type=Path, help=f"local mirror (default: {MIRROR_ROOT}/<host>)")
+    parser.add_argument("--since", help="ignore day files before this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    try:
+        summary = sync(source_for(args.source), args.mirror, args.since)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Sync failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Synced {summary['readings']} readings ({summary['bytes']} bytes) "
+          f"from {summary['files']} files into {summary['mirror']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
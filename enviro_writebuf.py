@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+EnviroPi Write Buffer
+Group commit for the day files: readings collect in memory and are written
+out together - one append and one fsync per day file, one stats sidecar
+update - when enough have built up or the oldest has waited long enough.
+
+Each buffered reading is also appended to a small journal in the data
+directory. After a crash or power cut, the next run replays whatever the
+journal holds that hadn't reached its day file yet, so at most the last few
+seconds (what the kernel hadn't written back) can be lost instead of the
+whole buffer. The journal is emptied after every flush.
+
+Usage: python3 enviro_writebuf.py   Flush a journal left behind by a crash
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import enviro_storage
+
+# Data directory
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
+
+# Flush when this many readings (or bytes) are buffered...
+FLUSH_READINGS = int(os.environ.get("ENVIROPI_FLUSH_READINGS", 32))
+FLUSH_BYTES = 64 * 1024
+
+# ...or when the oldest buffered reading is this old (the bound on how late
+# readers see it, and on what a crash can lose if the journal is off)
+FLUSH_SECONDS = float(os.environ.get("ENVIROPI_FLUSH_SECONDS", 60))
+
+JOURNAL_NAME = ".writebuf.journal"
+
+
+def _last_timestamp(path):
+    """Timestamp of the last complete reading in a day file, or None"""
+    try:
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+    except FileNotFoundError:
+        return None
+    for line in reversed(tail.split(b"\n")):
+        try:
+            return json.loads(line)["timestamp"]
+        except (ValueError, KeyError, TypeError):
+            continue
+    return None
+
+
+class WriteBuffer:
+    """Batches readings for the day files, with a redo journal
+
+    Flushes happen on the size triggers when a reading is added, from a
+    timer once the oldest reading reaches max_age, and on close().
+    """
+
+    def __init__(self, data_dir=DATA_DIR, max_readings=FLUSH_READINGS, max_bytes=FLUSH_BYTES,
+                 max_age=FLUSH_SECONDS, fsync=True, journal=True):
+        self.data_dir = Path(data_dir)
+        self.max_readings = max_readings
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync = fsync
+        self.journal = journal
+        self._pending = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+        # Counters
+        self.readings = 0
+        self.flushes = 0
+        self.bytes_written = 0      # Day file bytes (the journal is counted separately)
+        self.journal_bytes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.recovered = 0
+
+    @property
+    def journal_file(self):
+        return self.data_dir / JOURNAL_NAME
+
+    def recover(self):
+        """Write out readings a crashed run left in the journal; returns how many
+
+        Readings at or before the last one already in their day file were
+        flushed before the crash and are skipped, so replay is idempotent.
+        """
+        with self._lock:
+            try:
+                with open(self.journal_file, 'r') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                return 0
+
+            readings, last = [], {}
+            for line in lines:
+                try:
+                    reading = json.loads(line)
+                    ts = reading["timestamp"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # Torn line from the crash
+                day = ts[:10]
+                if day not in last:
+                    last[day] = _last_timestamp(enviro_storage.day_file(day, self.data_dir))
+                if last[day] is None or ts > last[day]:
+                    readings.append(reading)
+
+            if readings:
+                self.bytes_written += enviro_storage.append_readings(readings, self.data_dir, fsync=self.fsync)
+            os.truncate(self.journal_file, 0)
+            self.recovered += len(readings)
+            return len(readings)
+
+    def add(self, reading):
+        """Buffer one reading; flushes if a size trigger is reached"""
+        line = json.dumps(reading, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self.journal:
+                fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    self.journal_bytes += os.write(fd, line.encode())
+                finally:
+                    os.close(fd)
+            self._pending.append(reading)
+            self._pending_bytes += len(line)
+            self.readings += 1
+            if len(self._pending) >= self.max_readings or self._pending_bytes >= self.max_bytes:
+                self._flush()
+            elif self._timer is None and self.max_age is not None:
+                self._timer = threading.Timer(self.max_age, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write every buffered reading now"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        start = time.perf_counter()
+        self.bytes_written += enviro_storage.append_readings(self._pending, self.data_dir, fsync=self.fsync)
+        if self.journal:
+            os.truncate(self.journal_file, 0)
+        self._pending = []
+        self._pending_bytes = 0
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def close(self):
+        self.flush()
+
+    def stats(self):
+        """Counters: readings, flushes, bytes written, flush latency (ms)"""
+        return {
+            "readings": self.readings,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "bytes_written": self.bytes_written,
+            "journal_bytes": self.journal_bytes,
+            "recovered": self.recovered,
+            "mean_flush_ms": round(self.flush_seconds / self.flushes * 1000, 3) if self.flushes else None,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+        }
+
+
+_buffers = {}
+
+def append(reading, data_dir=DATA_DIR):
+    """Buffered replacement for enviro_storage.append_reading() in the loggers
+
+    The first call for a data directory replays any journal a crash left
+    behind; everything still buffered is flushed at exit, so a cron run
+    writes its reading before it ends.
+    """
+    buffer = _buffers.get(Path(data_dir))
+    if buffer is None:
+        buffer = _buffers[Path(data_dir)] = WriteBuffer(data_dir)
+        recovered = buffer.recover()
+        if recovered:
+            print(f"Recovered {recovered} readings from the write journal")
+        atexit.register(buffer.close)
+    buffer.add(reading)
+
+
+def flush():
+    """Flush every buffer append() has opened"""
+    for buffer in _buffers.values():
+        buffer.flush()
+
+
+if __name__ == "__main__":
+    buffer = WriteBuffer(DATA_DIR)
+    print(f"Recovered {buffer.recover()} readings from {buffer.journal_file}")
+    sys.exit(0)
@@ -1,31 +1,56 @@
 #!/usr/bin/env python3
 """
 Enviro+ Data Logger
-Logs temp, pressure, humidity, light, and noise to JSON every 5 minutes
+Logs temp, pressure, humidity, light, noise and particulates to JSON every 5 minutes
+Run once from cron, or stay resident with --daemon [--interval SECONDS]
 """
 
-import json
+import os
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import enviro_alerts
+import enviro_bus
+import enviro_daemon
+import enviro_i2c
+import enviro_metrics
+import enviro_writebuf
+
 # Data directory
-DATA_DIR = Path("/home/enviropi/enviro_data")
+DATA_DIR = Path(os.environ.get("ENVIROPI_DATA_DIR", "/home/enviropi/enviro_data"))
 DATA_DIR.mkdir(exist_ok=True)
 
-def read_sensors():
-    """Read all Enviro+ sensors"""
-    data = {
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    # BME280: Temperature, Pressure, Humidity
-    try:
+# Sensor drivers stay open between samples in daemon mode
+_bme280 = None
+_ltr559 = None
+_noise = None
+_pms5003 = None     # False once we know there is no PMS5003 to read
+
+# Noise fields in every reading (Leq and peak per band, dBFS)
+NOISE_FIELDS = [
+    "noise_low", "noise_mid", "noise_high", "noise_amp",
+    "noise_low_peak", "noise_mid_peak", "noise_high_peak", "noise_peak",
+]
+
+# Logging interval (cron: */5); a reading taken from the sampler covers the
+# records published since the last one logged, or this many seconds
+LOG_INTERVAL = 300
+_last_logged = None
+
+# How long a cron run listens before logging its first noise levels
+NOISE_WARMUP = 1.0
+
+# How long a cron run waits for the PMS5003's first frame (one every ~1 s,
+# up to ~2.3 s after the fan starts)
+PMS5003_WARMUP = 3.0
+
+def get_bme280():
+    """Open the BME280 once and discard its warm-up reading"""
+    global _bme280
+    if _bme280 is None:
         from bme280 import BME280
-        from smbus2 import SMBus
-        import time
-        bus = SMBus(1)
-        bme280 = BME280(i2c_dev=bus)
+        bme280 = BME280(i2c_dev=enviro_i2c.open_bus(1, board="enviroplus"))
         
         # Discard first reading (sensor warm-up)
         _ = bme280.get_temperature()
@@ -33,62 +58,115 @@ def read_sensors():
         _ = bme280.get_pressure()
         time.sleep(0.5)
         
-        # Take actual readings
+        _bme280 = bme280
+    return _bme280
+
+def get_ltr559():
+    """Open the LTR-559 once"""
+    global _ltr559
+    if _ltr559 is None:
+        from ltr559 import LTR559
+        _ltr559 = LTR559(i2c_dev=enviro_i2c.open_bus(1, board="enviroplus"))
+    return _ltr559
+
+def get_noise():
+    """Start continuous microphone capture once; it runs in the background"""
+    global _noise
+    if _noise is None:
+        import enviro_noise
+        noise = enviro_noise.NoiseMonitor(enviro_noise.default_source())
+        noise.start()
+        noise.wait(NOISE_WARMUP)
+        _noise = noise
+    return _noise
+
+def get_pms5003():
+    """Start the PMS5003 background reader once, or None if unavailable"""
+    global _pms5003
+    if _pms5003 is None:
+        try:
+            import enviro_pms5003
+            reader = enviro_pms5003.PMS5003Reader(enviro_pms5003.open_serial())
+            reader.start()
+            if not reader.wait(PMS5003_WARMUP):
+                print(f"PMS5003: no frame within {PMS5003_WARMUP:g}s")
+            _pms5003 = reader
+        except Exception as e:
+            print(f"PMS5003 unavailable: {e}")
+            _pms5003 = False
+    return _pms5003 or None
+
+@enviro_metrics.timed("read_sensors")
+def read_sensors():
+    """Read all Enviro+ sensors"""
+    global _bme280, _ltr559, _noise
+    data = {
+        "timestamp": datetime.now().isoformat()
+    }
+    
+    # BME280: Temperature, Pressure, Humidity
+    try:
+        bme280 = get_bme280()
         data["temperature_c"] = round(bme280.get_temperature(), 2)
         data["pressure_hpa"] = round(bme280.get_pressure(), 2)
         data["humidity_pct"] = round(bme280.get_humidity(), 2)
     except Exception as e:
         print(f"BME280 error: {e}")
+        _bme280 = None  # Reopen (and warm up) on the next sample
         data["temperature_c"] = None
         data["pressure_hpa"] = None
         data["humidity_pct"] = None
     
     # LTR-559: Light
     try:
-        from ltr559 import LTR559
-        ltr = LTR559()
-        data["light_lux"] = round(ltr.get_lux(), 2)
+        data["light_lux"] = round(get_ltr559().get_lux(), 2)
     except Exception as e:
         print(f"LTR-559 error: {e}")
+        _ltr559 = None
         data["light_lux"] = None
     
-    # Microphone: Noise level (skipped - requires kernel driver setup)
-    # TODO: Enable adau7002 audio device tree overlay
-    data["noise_low"] = None
-    data["noise_mid"] = None
-    data["noise_high"] = None
-    data["noise_amp"] = None
+    # Microphone: Leq/peak per band since the last reading
+    # (needs the adau7002 audio device tree overlay)
+    try:
+        data.update(get_noise().summary())
+    except Exception as e:
+        print(f"Microphone error: {e}")
+        if _noise is not None:
+            _noise.stop()
+        _noise = None
+        data.update(dict.fromkeys(NOISE_FIELDS))
+    
+    # PMS5003: particulates averaged since the last reading (None if absent)
+    pms5003 = get_pms5003()
+    if pms5003 is not None:
+        data.update(pms5003.summary())
+    else:
+        data.update({"pm1_ug_m3": None, "pm25_ug_m3": None, "pm10_ug_m3": None})
     
     return data
 
+@enviro_metrics.timed("log_reading")
 def log_reading():
     """Log current sensor readings"""
+    global _last_logged
     try:
-        # Read sensors
-        reading = read_sensors()
-        
-        # Today's log file
-        today = datetime.now().strftime("%Y-%m-%d")
-        log_file = DATA_DIR / f"enviro_{today}.json"
-        
-        # Load existing data
-        if log_file.exists():
-            with open(log_file, 'r') as f:
-                log_data = json.load(f)
-        else:
-            log_data = {"date": today, "readings": []}
-        
-        # Append reading
-        log_data["readings"].append(reading)
+        # If the sampler is running, combine what it published since the last
+        # reading (noise and PM over the whole interval); else read sensors
+        since = _last_logged or (datetime.now() - timedelta(seconds=LOG_INTERVAL)).isoformat()
+        reading = enviro_bus.interval_reading(since) or read_sensors()
+        _last_logged = reading["timestamp"]
         
-        # Write back
-        with open(log_file, 'w') as f:
-            json.dump(log_data, f, indent=2)
+        # Append to today's log file
+        with enviro_metrics.stage("append"):
+            enviro_writebuf.append(reading, DATA_DIR)
+        enviro_alerts.check(reading, DATA_DIR)
         
         # Print summary
         print(f"[{reading['timestamp']}] {reading['temperature_c']}°C, {reading['humidity_pct']}% RH, {reading['pressure_hpa']} hPa, {reading['light_lux']} lux")
+        if reading.get('pm25_ug_m3') is not None:
+            print(f"  PM1.0 {reading['pm1_ug_m3']}, PM2.5 {reading['pm25_ug_m3']}, PM10 {reading['pm10_ug_m3']} ug/m3")
         if reading['noise_amp'] is not None:
-            print(f"  Noise: {reading['noise_amp']:.1f} amplitude")
+            print(f"  Noise: {reading['noise_amp']:.1f} dBFS (low {reading['noise_low']}, mid {reading['noise_mid']}, high {reading['noise_high']})")
         
         return reading
         
@@ -99,4 +177,4 @@ def log_reading():
         return None
 
 if __name__ == "__main__":
-    log_reading()
+    enviro_daemon.main("Enviro+ data logger", log_reading)
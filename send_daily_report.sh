@@ -6,15 +6,29 @@ set -e
 
 PI_HOST="enviropi@192.168.2.15"
 TODAY=$(date +"%Y-%m-%d")
-DATA_FILE="/home/enviropi/enviro_data/enviro_${TODAY}.json"
-LOCAL_DATA="/tmp/enviro_${TODAY}.json"
+LOCAL_DATA="/tmp/enviro_${TODAY}.stats.json"
 REPORT_HTML="/tmp/enviro_report.html"
 
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+MIRROR="${HOME}/enviro_mirror/${PI_HOST#*@}"
+
 echo "Fetching sensor data from EnviroPi..."
-scp "${PI_HOST}:${DATA_FILE}" "${LOCAL_DATA}" 2>/dev/null || {
-    echo "No data file for today yet"
-    exit 1
-}
+if [ -f "${SCRIPT_DIR}/enviro_sync.py" ]; then
+    # Pull only readings added since the last run into the local mirror,
+    # then summarise from the mirror's running aggregates
+    python3 "${SCRIPT_DIR}/enviro_sync.py" "${PI_HOST}" --mirror "${MIRROR}"
+    ENVIROPI_DATA_DIR="${MIRROR}" python3 "${SCRIPT_DIR}/enviro_stats.py" "${TODAY}" > "${LOCAL_DATA}" 2>/dev/null || {
+        echo "No data file for today yet"
+        exit 1
+    }
+else
+    # The logger keeps running daily aggregates next to each day file, so only
+    # the small summary crosses the network and nothing is rescanned here
+    ssh "${PI_HOST}" "python3 /home/enviropi/enviro_stats.py ${TODAY}" > "${LOCAL_DATA}" 2>/dev/null || {
+        echo "No data file for today yet"
+        exit 1
+    }
+fi
 
 echo "Generating report..."
 python3 << 'PYTHON_SCRIPT'
@@ -22,35 +36,33 @@ import json
 import sys
 from datetime import datetime
 
-# Read data
-with open('/tmp/enviro_' + datetime.now().strftime('%Y-%m-%d') + '.json', 'r') as f:
+# Read daily aggregates
+with open('/tmp/enviro_' + datetime.now().strftime('%Y-%m-%d') + '.stats.json', 'r') as f:
     data = json.load(f)
 
-readings = data['readings']
-if not readings:
+if not data['count']:
     print("No readings yet today")
     sys.exit(1)
 
-# Calculate stats
-temps = [r['temperature_c'] for r in readings if 'temperature_c' in r and r['temperature_c'] is not None]
-pressures = [r['pressure_hpa'] for r in readings if 'pressure_hpa' in r and r['pressure_hpa'] is not None]
-humidities = [r.get('humidity_pct') for r in readings if r.get('humidity_pct') is not None]
-lights = [r['light_lux'] for r in readings if 'light_lux' in r and r['light_lux'] is not None]
+def stat(metric, key):
+    m = data['metrics'].get(metric)
+    return m[key] if m else 0
 
-temp_avg = sum(temps) / len(temps) if temps else 0
-temp_min = min(temps) if temps else 0
-temp_max = max(temps) if temps else 0
+# Stats
+temp_avg = stat('temperature_c', 'mean')
+temp_min = stat('temperature_c', 'min')
+temp_max = stat('temperature_c', 'max')
 
-pressure_avg = sum(pressures) / len(pressures) if pressures else 0
-pressure_min = min(pressures) if pressures else 0
-pressure_max = max(pressures) if pressures else 0
+pressure_avg = stat('pressure_hpa', 'mean')
+pressure_min = stat('pressure_hpa', 'min')
+pressure_max = stat('pressure_hpa', 'max')
 
-humidity_avg = sum(humidities) / len(humidities) if humidities else 0
-humidity_min = min(humidities) if humidities else 0
-humidity_max = max(humidities) if humidities else 0
+humidity_avg = stat('humidity_pct', 'mean')
+humidity_min = stat('humidity_pct', 'min')
+humidity_max = stat('humidity_pct', 'max')
 
-light_avg = sum(lights) / len(lights) if lights else 0
-light_max = max(lights) if lights else 0
+light_avg = stat('light_lux', 'mean')
+light_max = stat('light_lux', 'max')
 
 # Generate HTML
 html = f"""<html>
@@ -67,8 +79,8 @@ html = f"""<html>
 </head>
 <body>
     <h1>🥧 EnviroPi Daily Report</h1>
-    <p><strong>Date:</strong> {data['date']}</p>
-    <p><strong>Readings:</strong> {len(readings)} samples collected</p>
+    <p><strong>Date:</strong> {data['start']}</p>
+    <p><strong>Readings:</strong> {data['count']} samples collected</p>
     
     <div class="stats">
         <h2>🌡️ Temperature</h2>
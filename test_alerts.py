@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Alert rules: sliding-window extremes, debounce, hysteresis and persistence
+Runs off-device: python3 -m pytest test_alerts.py
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+
+import enviro_alerts
+from enviro_alerts import AlertEngine, RateRule, SustainedRule, ThresholdRule, WindowExtremes
+
+START = datetime(2026, 3, 1)
+
+
+def readings(metric, values, step=300):
+    for i, value in enumerate(values):
+        yield {"timestamp": (START + timedelta(seconds=i * step)).isoformat(), metric: value}
+
+
+def run(rule, metric, values, step=300):
+    engine = AlertEngine([rule], ".", None)
+    engine.emit = lambda event: None
+    events = []
+    for reading in readings(metric, values, step):
+        events += engine.process(reading)
+    return [(e["timestamp"][11:16], e["state"]) for e in events]
+
+
+def test_window_extremes_match_brute_force():
+    rng = random.Random(1)
+    window = WindowExtremes(50)
+    samples = []
+    for t in range(1000):
+        value = rng.uniform(0, 100)
+        samples.append((t, value))
+        window.push(t, value)
+        in_window = [v for ts, v in samples if ts >= t - 50]
+        assert window.min == min(in_window)
+        assert window.max == max(in_window)
+    # Monotonic deques stay far smaller than the window
+    assert len(window._min) < 51 and len(window._max) < 51
+
+
+def test_threshold_debounce_and_hysteresis():
+    rule = ThresholdRule("hot", "temperature_c", above=30, clear=29, debounce=2)
+    values = [28, 31, 28, 31, 31, 30, 29.5, 28.5, 28.5, 31]
+    # One spike is ignored; 29.5 is inside the hysteresis band so it stays firing
+    assert run(rule, "temperature_c", values) == [("00:20", "firing"), ("00:40", "cleared")]
+
+
+def test_pressure_drop_over_three_hours():
+    rule = RateRule("falling", "pressure_hpa", window=10800, drop=3.0, clear=2.0)
+    values = [1015 - 0.1 * i for i in range(37)]       # -3.6 hPa over 3 h
+    values += [1011.4] * 40                               # Levels off
+    events = run(rule, "pressure_hpa", values)
+    assert events[0] == ("02:30", "firing")               # 30 samples x 0.1 hPa
+    assert events[1][1] == "cleared"
+    assert len(events) == 2
+
+
+def test_sustained_requires_the_full_duration():
+    rule = SustainedRule("damp", "humidity_pct", above=70, duration=1800, clear=65)
+    values = [75] * 5 + [60] + [75] * 7 + [66, 64]
+    assert run(rule, "humidity_pct", values) == [("01:00", "firing"), ("01:10", "cleared")]
+
+
+def test_state_survives_between_cron_runs(tmp_path):
+    rule_config = [{"name": "hot", "type": "threshold", "metric": "temperature_c", "above": 30, "debounce": 2}]
+    stream = list(readings("temperature_c", [31, 31, 31]))
+
+    first = AlertEngine(enviro_alerts.build_rules(rule_config), tmp_path, None)
+    first.load()
+    assert first.process(stream[0]) == []
+    first.save()
+
+    second = AlertEngine(enviro_alerts.build_rules(rule_config), tmp_path, None)
+    second.load()
+    assert second.process(stream[0]) == []  # Already seen
+    assert [e["state"] for e in second.process(stream[1])] == ["firing"]
+
+    events = [json.loads(line) for line in (tmp_path / "alerts.jsonl").read_text().splitlines()]
+    assert events[0]["rule"] == "hot" and events[0]["value"] == 31
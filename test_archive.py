@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Seekable day archives: compression, range reads and rollover
+Runs off-device: python3 -m pytest test_archive.py
+"""
+
+from datetime import datetime
+
+import enviro_archive
+import enviro_rollup
+import enviro_storage
+from enviro_archive import ArchiveDay
+from enviro_bench import synthetic_readings
+
+DAY = "2026-03-01"
+
+
+def log_day(data_dir, cadence=10):
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 86400 // cadence, cadence))
+    enviro_storage.append_readings(readings, data_dir)
+    return readings
+
+
+def test_archive_round_trip_and_size(tmp_path):
+    readings = log_day(tmp_path)
+    raw, compressed = enviro_archive.archive_day(DAY, tmp_path)
+    assert compressed * 8 < raw
+    assert not enviro_storage.day_file(DAY, tmp_path).exists()
+    assert enviro_storage.load_day(DAY, tmp_path)["readings"] == readings
+
+
+def test_range_read_only_touches_covering_blocks(tmp_path):
+    readings = log_day(tmp_path)
+    enviro_archive.archive_day(DAY, tmp_path)
+    archive = ArchiveDay(DAY, tmp_path)
+    start, end = "2026-03-01T12:00:00", "2026-03-01T12:30:00"
+    got = list(archive.readings(start, end))
+    assert got == [r for r in readings if start <= r["timestamp"] <= end]
+    assert archive.blocks_read <= 2 < len(archive.index["blocks"])
+    assert list(enviro_storage.iter_readings(DAY, tmp_path, start, end)) == got
+
+
+def test_rollover_waits_for_rollup_and_keeps_archives(tmp_path):
+    log_day(tmp_path, cadence=300)
+    now = datetime(2026, 3, 2, 0, 30)
+    assert enviro_archive.archive_closed_days(tmp_path, now) == []  # Not rolled up yet
+
+    enviro_storage.append_reading({"timestamp": "2026-03-02T00:30:00", "temperature_c": 20.0}, tmp_path)
+    enviro_rollup.rollup(tmp_path)
+    assert enviro_archive.archive_closed_days(tmp_path, now) == []  # Too soon after midnight
+    assert enviro_archive.archive_closed_days(tmp_path, datetime(2026, 3, 2, 1, 30)) == [DAY]
+
+    assert enviro_rollup.apply_retention(tmp_path, datetime(2026, 3, 20)) == []
+    removed = enviro_rollup.apply_retention(tmp_path, datetime(2027, 3, 20))
+    assert enviro_archive.archive_file(DAY, tmp_path) in removed
+
+
+def test_late_readings_are_added_to_an_existing_archive(tmp_path):
+    readings = log_day(tmp_path, cadence=60)
+    enviro_storage.append_reading({"timestamp": "2026-03-02T00:30:00", "temperature_c": 20.0}, tmp_path)
+    enviro_rollup.rollup(tmp_path)
+    assert enviro_archive.archive_closed_days(tmp_path, datetime(2026, 3, 2, 1, 30)) == [DAY]
+    size = enviro_archive.archive_file(DAY, tmp_path).stat().st_size
+
+    # A late write (or a Pi booting with an old clock) brings the day file back
+    late = [{"timestamp": "2026-03-01T23:59:30", "temperature_c": 19.5},
+            {"timestamp": "2026-03-01T08:00:30", "temperature_c": 18.0}]
+    enviro_storage.append_readings(late, tmp_path)
+    enviro_rollup.rollup(tmp_path)
+    assert enviro_archive.archive_closed_days(tmp_path, datetime(2026, 3, 2, 2, 30)) == [DAY]
+
+    assert not enviro_storage.day_file(DAY, tmp_path).exists()
+    assert enviro_archive.archive_file(DAY, tmp_path).stat().st_size > size
+    got = list(enviro_storage.iter_readings(DAY, tmp_path))
+    assert got == readings + late
+    window = list(ArchiveDay(DAY, tmp_path).readings("2026-03-01T08:00:00", "2026-03-01T08:01:00"))
+    assert late[1] in window and len(window) == 3
+
+    # Archiving the same late file again (interrupted before it was removed) adds nothing
+    enviro_storage.append_readings(late, tmp_path)
+    enviro_archive.archive_day(DAY, tmp_path)
+    assert len(list(enviro_storage.iter_readings(DAY, tmp_path))) == len(readings) + 2
+
+
+def test_legacy_days_are_rolled_up_then_expire(tmp_path):
+    import json
+    readings = list(synthetic_readings(datetime(2026, 2, 28), 288, 300))
+    legacy = enviro_storage.legacy_day_file("2026-02-28", tmp_path)
+    legacy.write_text(json.dumps({"date": "2026-02-28", "readings": readings}))
+    log_day(tmp_path, cadence=300)
+    enviro_rollup.rollup(tmp_path)
+
+    rows = enviro_rollup.query("2026-02-28T00:00:00", "2026-02-28T23:59:59", 3600, tmp_path)
+    assert len(rows) == 24
+    assert sum(row["metrics"]["temperature_c"]["count"] for row in rows) == len(readings)
+
+    # Rolled up, so it goes with the other raw days
+    enviro_rollup.apply_retention(tmp_path, datetime(2026, 3, 5))
+    assert legacy.exists()
+    assert legacy in enviro_rollup.apply_retention(tmp_path, datetime(2026, 3, 9))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Check the NumPy batch BMP280 compensation against the scalar functions
+Runs off-device: python3 -m pytest test_bmp280_compensation.py
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from enviro_bmp280 import (
+    compensate_temp, compensate_pressure, compensate_batch, compensate_batch_int
+)
+
+# Worked example from the Bosch BMP280 datasheet (section 3.12)
+CAL = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+
+
+def raw_samples():
+    """Raw ADC pairs spanning roughly -20..60 degC and 300..1100 hPa"""
+    adc_t = np.linspace(400000, 640000, 97).astype(np.int64)
+    adc_p = np.linspace(250000, 560000, 97).astype(np.int64)
+    return np.meshgrid(adc_t, adc_p)
+
+
+def test_batch_matches_scalar():
+    adc_t, adc_p = (a.ravel() for a in raw_samples())
+    temps, pressures = compensate_batch(adc_t, adc_p, CAL)
+
+    for i in range(len(adc_t)):
+        temp, t_fine = compensate_temp(int(adc_t[i]), CAL)
+        pressure = compensate_pressure(int(adc_p[i]), t_fine, CAL)
+        assert temps[i] == temp
+        assert pressures[i] == pressure
+
+
+def test_batch_keeps_shape():
+    adc_t, adc_p = raw_samples()
+    temps, pressures = compensate_batch(adc_t, adc_p, CAL)
+    assert temps.shape == adc_t.shape
+    assert pressures.shape == adc_p.shape
+
+
+def test_int_batch_matches_datasheet_example():
+    temps, pressures = compensate_batch_int([519888], [415148], CAL)
+    assert temps[0] == 25.08
+    assert pressures[0] == pytest.approx(1006.5326, abs=0.0001)
+
+
+def test_int_batch_close_to_float():
+    adc_t, adc_p = (a.ravel() for a in raw_samples())
+    temps, pressures = compensate_batch(adc_t, adc_p, CAL)
+    temps_int, pressures_int = compensate_batch_int(adc_t, adc_p, CAL)
+
+    assert np.max(np.abs(temps_int - temps)) <= 0.01
+    assert np.max(np.abs(pressures_int - pressures)) <= 0.01
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Sample bus: ring round-trip and interval aggregation for the logger
+Runs off-device: python3 -m pytest test_bus.py
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import enviro_bus
+from enviro_bus import SampleRing
+
+
+def record(t, leq, peak, pm25, temp):
+    return {"timestamp": t.isoformat(), "temperature_c": temp,
+            "noise_amp": leq, "noise_peak": peak, "pm25_ug_m3": pm25}
+
+
+@pytest.fixture
+def ring_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(enviro_bus, "_ring", None)
+    yield tmp_path / "samples"
+    enviro_bus._ring = None
+
+
+def test_peak_fields_round_trip(ring_path):
+    ring = SampleRing(ring_path, capacity=8, create=True)
+    reading = {"timestamp": "2026-03-01T12:00:00", "noise_amp": -40.0, "noise_low_peak": -12.5,
+               "noise_mid_peak": -13.0, "noise_high_peak": -20.25, "noise_peak": -10.0}
+    ring.publish(reading)
+    got = ring.latest()
+    for field in enviro_bus.PEAK_FIELDS:
+        assert got[field] == reading[field]
+    assert got["pm25_ug_m3"] is None
+
+
+def test_interval_reading_covers_every_record_since(ring_path):
+    ring = SampleRing(ring_path, capacity=64, create=True)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(seconds=60)
+    for i in range(12):   # A 5 s sampler over the last minute
+        quiet = i != 3
+        ring.publish(record(start + timedelta(seconds=5 * (i + 1)), -60.0 if quiet else -20.0,
+                            -50.0 if quiet else -5.0, 10.0 + i, 20.0 + i / 10))
+
+    reading = enviro_bus.interval_reading(start.isoformat(), path=ring_path)
+    # One loud 5 s record dominates the minute's energy average, not the arithmetic mean
+    assert reading["noise_amp"] == pytest.approx(enviro_bus.energy_mean([-60.0] * 11 + [-20.0]), abs=0.01)
+    assert reading["noise_amp"] > -31
+    assert reading["noise_peak"] == -5.0
+    assert reading["pm25_ug_m3"] == 15.5
+    assert reading["temperature_c"] == pytest.approx(21.1)
+    assert reading["timestamp"] == now.isoformat()
+
+    # Only records after the last logged reading count
+    later = enviro_bus.interval_reading((start + timedelta(seconds=30)).isoformat(), path=ring_path)
+    assert later["noise_amp"] == pytest.approx(-60.0, abs=0.01)
+    assert enviro_bus.interval_reading(now.isoformat(), path=ring_path) is None
+
+
+def test_stale_sampler_is_ignored(ring_path):
+    ring = SampleRing(ring_path, capacity=8, create=True)
+    old = datetime.now() - timedelta(minutes=5)
+    ring.publish(record(old, -40.0, -30.0, 5.0, 20.0))
+    assert enviro_bus.latest_reading(path=ring_path) is None
+    assert enviro_bus.interval_reading((old - timedelta(minutes=1)).isoformat(), path=ring_path) is None
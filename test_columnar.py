@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Columnar day files: round-trip, range queries and statistics
+Runs off-device: python3 -m pytest test_columnar.py
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import enviro_columnar
+import enviro_stats
+import enviro_storage
+from enviro_bench import synthetic_readings
+from enviro_columnar import ColumnarDay
+
+
+def day_of_readings():
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 8640, 10))
+    readings[5]["node"] = "living"
+    readings[6]["accelerometer"] = None
+    readings[7]["accelerometer"] = {"x": 0.1, "y": -0.25, "z": 1.0}
+    readings[8]["motion_samples"] = 60000
+    readings[9]["odometer"] = 123456.789   # Needs float64 to survive
+    readings[10]["humidity_pct"] = 45       # An int in a float column
+    readings[11]["accelerometer"] = {"x": 0, "y": -0.25, "z": 1.0}
+    return readings
+
+
+def test_round_trip_is_exact(tmp_path):
+    readings = day_of_readings()
+    size = enviro_columnar.write(readings, tmp_path / "day.col")
+    back = ColumnarDay(tmp_path / "day.col").readings()
+    assert [json.dumps(r) for r in back] == [json.dumps(r) for r in readings]   # 45 stays 45, not 45.0
+    as_json = sum(len(json.dumps(r, separators=(",", ":"))) + 1 for r in readings)
+    assert size < as_json / 2
+
+
+def test_range_query_matches_a_scan(tmp_path):
+    readings = day_of_readings()
+    enviro_columnar.write(readings, tmp_path / "day.col")
+    day = ColumnarDay(tmp_path / "day.col")
+    start, end = "2026-03-01T12:00:05", "2026-03-01T13:30:00"
+    expected = [r for r in readings if start <= r["timestamp"] < end]
+    assert day.readings(start, end) == expected
+    assert day.row_range(end="2026-03-01T00:00:00") == (0, 0)
+    assert day.row_range(start="2026-03-02T00:00:00") == (len(readings), len(readings))
+
+
+def test_stats_match_the_sidecar(tmp_path):
+    readings = day_of_readings()
+    agg = enviro_stats.new_day("2026-03-01")
+    for r in readings:
+        enviro_stats.update(agg, r)
+    enviro_columnar.write(readings, tmp_path / "day.col")
+    stats = ColumnarDay(tmp_path / "day.col").stats("temperature_c")
+    expected = enviro_stats.summary(agg)["metrics"]["temperature_c"]
+    assert stats["count"] == expected["count"]
+    assert stats["min"] == expected["min"] and stats["max"] == expected["max"]
+    assert stats["mean"] == pytest.approx(expected["mean"], rel=1e-6)
+    assert stats["stddev"] == pytest.approx(expected["stddev"], rel=1e-4)
+
+
+def test_converted_day_still_loads(tmp_path):
+    for r in list(synthetic_readings(datetime(2026, 3, 1), 100, 300)):
+        enviro_storage.append_reading(r, tmp_path)
+    before = enviro_storage.load_day("2026-03-01", tmp_path)
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    enviro_storage.day_file("2026-03-01", tmp_path).unlink()
+    assert enviro_storage.load_day("2026-03-01", tmp_path) == before
+
+
+def test_late_readings_after_conversion(tmp_path):
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 5, 300))
+    enviro_storage.append_readings(readings, tmp_path)
+
+    # Converted but the day file kept: nothing is read twice
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings
+
+    # More lines land in the kept day file
+    more = list(synthetic_readings(datetime(2026, 3, 1, 1), 2, 300))
+    enviro_storage.append_readings(more, tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + more
+
+    # Day file replaced, then one late reading starts a new one
+    enviro_storage.day_file("2026-03-01", tmp_path).unlink()
+    late = {"timestamp": "2026-03-01T23:59:00", "temperature_c": 18.5}
+    enviro_storage.append_reading(late, tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+
+    # Converting again folds the late reading in, still without duplicates
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+    enviro_storage.day_file("2026-03-01", tmp_path).unlink()
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+
+
+def test_archiving_a_converted_day_keeps_one_copy(tmp_path):
+    import enviro_archive
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 5, 300))
+    enviro_storage.append_readings(readings, tmp_path)
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    late = {"timestamp": "2026-03-01T23:59:00", "temperature_c": 18.5}
+    enviro_storage.append_reading(late, tmp_path)
+
+    enviro_archive.archive_day("2026-03-01", tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+
+
+def test_converting_an_archived_day_takes_over_the_archive(tmp_path, monkeypatch):
+    import enviro_archive
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 5, 300))
+    enviro_storage.append_readings(readings, tmp_path)
+    enviro_archive.archive_day("2026-03-01", tmp_path)
+
+    # Stopped before the archive was removed: still read once, and finished next time
+    monkeypatch.setattr(enviro_archive, "remove_archive", lambda day, data_dir: None)
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings
+    monkeypatch.undo()
+    late = {"timestamp": "2026-03-01T23:59:00", "temperature_c": 18.5}
+    enviro_storage.append_reading(late, tmp_path)
+    enviro_archive.archive_day("2026-03-01", tmp_path)
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+
+    enviro_columnar.convert_day("2026-03-01", tmp_path)
+    assert not enviro_archive.archive_file("2026-03-01", tmp_path).exists()
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings + [late]
+
+
+def test_converted_day_is_kept_like_an_archive(tmp_path):
+    import enviro_rollup
+    readings = list(synthetic_readings(datetime(2026, 3, 1), 24, 300))
+    enviro_storage.append_readings(readings, tmp_path)
+    enviro_storage.append_reading({"timestamp": "2026-03-02T00:30:00", "temperature_c": 20.0}, tmp_path)
+    enviro_rollup.rollup(tmp_path)
+    enviro_columnar.convert_day("2026-03-01", tmp_path, replace=True)
+    assert not enviro_storage.day_file("2026-03-01", tmp_path).exists()
+
+    enviro_rollup.apply_retention(tmp_path, datetime(2026, 3, 14))
+    assert enviro_columnar.col_file("2026-03-01", tmp_path).exists()
+    assert enviro_stats.stats_file("2026-03-01", tmp_path).exists()
+    assert list(enviro_storage.iter_readings("2026-03-01", tmp_path)) == readings
+    removed = enviro_rollup.apply_retention(tmp_path, datetime(2027, 3, 20))
+    assert enviro_columnar.col_file("2026-03-01", tmp_path) in removed
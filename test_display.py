@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+LCD renderer against a simulated ST7735 panel: only changed regions are sent
+Runs off-device: python3 -m pytest test_display.py
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+st7735 = pytest.importorskip("st7735")
+
+import display_readings
+
+
+class FakePanel:
+    """ST7735 stand-in: a native-orientation framebuffer written through
+    set_window()/data() exactly as the controller's RAMWR fills it"""
+
+    def __init__(self, rotation, native=(80, 160)):
+        self.rotation = rotation
+        self.native_w, self.native_h = native
+        self.ram = np.zeros((self.native_h, self.native_w), dtype=np.uint16)
+        self.windows = []
+        self.bytes_sent = 0
+        self._window = None
+        self._pending = []
+
+    @property
+    def width(self):
+        return self.native_w if self.rotation in (0, 180) else self.native_h
+
+    @property
+    def height(self):
+        return self.native_h if self.rotation in (0, 180) else self.native_w
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        x1 = self.native_w - 1 if x1 is None else x1
+        y1 = self.native_h - 1 if y1 is None else y1
+        self._window = (x0, y0, x1, y1)
+        self._pending = []
+        self.windows.append(self._window)
+
+    def data(self, data):
+        data = [data] if isinstance(data, int) else list(data)
+        self.bytes_sent += len(data)
+        self._pending += data
+        x0, y0, x1, y1 = self._window
+        w, h = x1 - x0 + 1, y1 - y0 + 1
+        if len(self._pending) == w * h * 2:
+            b = np.array(self._pending, dtype=np.uint16)
+            self.ram[y0:y1 + 1, x0:x1 + 1] = ((b[0::2] << 8) | b[1::2]).reshape(h, w)
+
+    def display(self, image):
+        self.set_window()
+        self.data(st7735.image_to_data(image, self.rotation))
+
+    def shows(self, image):
+        """Whether the panel RAM holds exactly this (logical) image"""
+        expected = FakePanel(self.rotation)
+        expected.display(image)
+        return (expected.ram == self.ram).all()
+
+
+def values(**changes):
+    base = {"clock": "12:00", "temp_f": "70.0°F", "temp_c": "(21.1°C)", "humidity": "40.0%",
+            "pressure_inhg": "29.92", "pressure_hpa": "inHg (1013hPa)", "light": "120"}
+    return {**base, **changes}
+
+
+@pytest.mark.parametrize("rotation", [90, 270])   # The layout is landscape
+def test_only_changed_regions_are_sent(rotation):
+    panel = FakePanel(rotation)
+    renderer = display_readings.DisplayRenderer(panel, rotation)
+    renderer.render(values())
+    full = panel.bytes_sent
+    assert full == 80 * 160 * 2 and panel.shows(renderer.frame)
+
+    panel.windows.clear()
+    assert renderer.render(values(clock="12:01", light="125")) == 2
+    assert len(panel.windows) == 2
+    assert panel.bytes_sent - full < full / 4
+    assert panel.shows(renderer.frame)
+
+    assert renderer.render(values(clock="12:01", light="125")) == 0
+    assert len(panel.windows) == 2
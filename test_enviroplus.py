@@ -41,11 +41,18 @@ print()
 
 # Test microphone (noise level)
 try:
-    from enviroplus import noise
-    low, mid, high, amp = noise.get_noise_profile()
-    print(f"✅ Microphone:")
-    print(f"   Low: {low:.1f}, Mid: {mid:.1f}, High: {high:.1f}")
-    print(f"   Amplitude: {amp:.1f}")
+    import time
+    import enviro_noise
+    mic = enviro_noise.SoundDeviceSource()
+    monitor = enviro_noise.NoiseMonitor(mic)
+    monitor.start()
+    time.sleep(2)
+    monitor.stop()
+    levels = monitor.summary()
+    print(f"✅ Microphone (2 s, dBFS):")
+    print(f"   Low: {levels['noise_low']}, Mid: {levels['noise_mid']}, High: {levels['noise_high']}")
+    print(f"   Overall: {levels['noise_amp']} (peak {levels['noise_peak']})")
+    print(f"   Dropped samples: {monitor.dropped}, input overflows: {mic.overflows}")
 except Exception as e:
     print(f"❌ Microphone failed: {e}")
 
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Run the logger read paths against the fake I2C bus (enviro_i2c)
+Runs off-device: python3 -m pytest test_fake_i2c.py
+"""
+
+import importlib
+import time
+
+import pytest
+
+import enviro_bmp280
+import enviro_i2c
+import enviro_writebuf
+
+
+@pytest.fixture
+def fake_env(tmp_path, monkeypatch):
+    """Point the loggers at the fake bus and a scratch data/cache directory"""
+    monkeypatch.setenv("ENVIROPI_FAKE_I2C", "1")
+    monkeypatch.setenv("ENVIROPI_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("ENVIROPI_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "data").mkdir()
+    enviro_i2c._buses.clear()
+    importlib.reload(enviro_bmp280)
+    yield monkeypatch
+    enviro_i2c._buses.clear()
+    monkeypatch.delenv("ENVIROPI_CACHE_DIR")
+    importlib.reload(enviro_bmp280)
+
+
+def load(name):
+    return importlib.reload(importlib.import_module(name))
+
+
+def test_read_bmp280_datasheet_values(fake_env):
+    logger = load("enviropi_logger")
+    assert isinstance(logger.bus, enviro_i2c.FakeSMBus)
+    assert logger.read_bmp280() == {"temperature_c": 25.08, "pressure_hpa": 1006.53}
+
+    # Calibration comes from the cache on later reads
+    before = logger.bus.transactions
+    logger.read_bmp280()
+    assert logger.bus.transactions - before < 10
+
+
+def test_read_bh1750(fake_env):
+    logger = load("enviropi_logger")
+    logger.bus.devices[0x23].lux = 500.0
+    assert logger.read_bh1750()["light_lux"] == pytest.approx(500.0, abs=1)
+
+
+def test_read_bh1750_adapts_to_darkness(fake_env):
+    logger = load("enviropi_logger")
+    logger.bus.devices[0x23].lux = 2.5
+    for _ in range(3):
+        lux = logger.read_bh1750()["light_lux"]
+        time.sleep(logger.bh1750.integration_time)
+    assert logger.bh1750.range_name == "dark"
+    assert lux == pytest.approx(2.5, abs=0.2)
+
+
+def test_faults_surface_as_errors(fake_env):
+    logger = load("enviropi_logger")
+    logger.bus.fault_rate = 1.0
+    assert logger.read_bh1750() == {"light_lux": None}
+    with pytest.raises(OSError):
+        logger.read_bmp280()
+    assert logger.bus.faults >= 2
+
+
+def test_latency_is_per_transaction():
+    bus = enviro_i2c.FakeSMBus(latency=0.002)
+    start = time.monotonic()
+    for _ in range(10):
+        bus.read_byte_data(0x76, enviro_bmp280.REG_CHIPID)
+    assert time.monotonic() - start >= 0.02
+    assert bus.per_device[0x76] == 10
+
+
+def test_missing_device():
+    bus = enviro_i2c.FakeSMBus(devices={})
+    with pytest.raises(OSError):
+        bus.read_byte_data(0x76, enviro_bmp280.REG_CHIPID)
+
+
+def test_enviroplus_read_sensors(fake_env):
+    pytest.importorskip("bme280")
+    pytest.importorskip("ltr559")
+    fake_env.setattr("enviro_bus.interval_reading", lambda *a, **k: None)
+    logger = load("enviroplus_logger")
+    reading = logger.read_sensors()
+    assert reading["temperature_c"] == pytest.approx(25.08, abs=0.01)
+    assert reading["pressure_hpa"] == pytest.approx(1006.53, abs=0.01)
+    assert 0 < reading["humidity_pct"] < 100
+    assert reading["light_lux"] > 0
+
+    logger.log_reading()
+    enviro_writebuf.flush()  # Normally at exit or when the buffer fills
+    assert list(logger.DATA_DIR.glob("enviro_*.jsonl"))
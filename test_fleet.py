@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Fleet collection against local directories standing in for the nodes
+Runs off-device: python3 -m pytest test_fleet.py
+"""
+
+import json
+import time
+
+import enviro_fleet
+import enviro_storage
+import enviro_sync
+
+DAY = "2026-03-01"
+
+
+class SlowSource(enviro_sync.LocalSource):
+    """Local node with network-like latency and optional failures"""
+
+    def __init__(self, path, delay=0.0, failures=0):
+        super().__init__(path)
+        self.delay = delay
+        self.failures = failures
+
+    def list_files(self):
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        return super().list_files()
+
+
+def make_node(tmp_path, name, room, offset, **kwargs):
+    data = tmp_path / "nodes" / name
+    data.mkdir(parents=True)
+    for i in range(6):
+        minute = i * 10 + offset
+        enviro_storage.append_reading(
+            {"timestamp": f"{DAY}T12:{minute:02d}:00", "temperature_c": 20.0 + offset}, data)
+    return {"name": name, "room": room, "source": SlowSource(data, **kwargs)}
+
+
+def test_collects_in_parallel(tmp_path):
+    nodes = [make_node(tmp_path, f"n{i}", f"room{i}", i, delay=0.3) for i in range(6)]
+    start = time.monotonic()
+    results = enviro_fleet.collect(nodes, tmp_path / "mirror")
+    assert time.monotonic() - start < 1.0  # Not 6 x 0.3 s
+    assert all(r["readings"] == 6 for r in results.values())
+
+
+def test_retries_and_timeouts(tmp_path):
+    flaky = make_node(tmp_path, "flaky", "hall", 1, failures=1)
+    dead = make_node(tmp_path, "dead", "attic", 2, failures=5)
+    hung = make_node(tmp_path, "hung", "cellar", 3, delay=2)
+    results = enviro_fleet.collect([flaky, dead, hung], tmp_path / "mirror",
+                                   timeout=0.2, retries=1, backoff=0.01)
+    assert results["flaky"]["readings"] == 6
+    assert "connection reset" in results["dead"]["error"]
+    assert "timed out" in results["hung"]["error"]
+
+
+def test_timed_out_node_stops_writing(tmp_path):
+    hung = make_node(tmp_path, "hung", "cellar", 3, delay=0.6)
+    results = enviro_fleet.collect([hung], tmp_path / "mirror", timeout=0.2, retries=0, backoff=0.01)
+    assert "timed out" in results["hung"]["error"]
+    time.sleep(0.8)  # Its list_files() has long since returned
+    assert not list((tmp_path / "mirror" / "hung").glob("enviro_*"))
+
+
+def test_merge_day_is_time_ordered_and_aggregated(tmp_path):
+    nodes = [
+        make_node(tmp_path, "lounge1", "lounge", 0),
+        make_node(tmp_path, "lounge2", "lounge", 2),
+        make_node(tmp_path, "bed", "bedroom", 5),
+    ]
+    enviro_fleet.collect(nodes, tmp_path / "mirror")
+    report = enviro_fleet.merge_day(nodes, DAY, tmp_path / "mirror", tmp_path / "merged")
+
+    lines = (tmp_path / "merged" / f"enviro_{DAY}.jsonl").read_text().splitlines()
+    merged = [json.loads(line) for line in lines]
+    assert len(merged) == 18
+    assert [r["timestamp"] for r in merged] == sorted(r["timestamp"] for r in merged)
+    assert {r["node"] for r in merged} == {"lounge1", "lounge2", "bed"}
+
+    assert report["rooms"]["lounge"]["count"] == 12
+    assert report["rooms"]["lounge"]["metrics"]["temperature_c"]["mean"] == 21.0
+    assert report["rooms"]["bedroom"]["metrics"]["temperature_c"]["mean"] == 25.0
+    assert report["house"]["count"] == 18
+    assert report["house"]["metrics"]["temperature_c"]["max"] == 25.0
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Pipeline metrics: stage timing, I2C counters, loop jitter and the exporters
+Runs off-device: python3 -m pytest test_metrics.py
+"""
+
+import importlib
+import urllib.request
+
+import pytest
+
+import enviro_daemon
+import enviro_i2c
+import enviro_metrics
+import enviro_writebuf
+
+
+@pytest.fixture
+def metrics_on(tmp_path, monkeypatch):
+    """Metrics enabled with a textfile directory, as if configured at startup"""
+    monkeypatch.setenv("ENVIROPI_METRICS_DIR", str(tmp_path / "prom"))
+    (tmp_path / "prom").mkdir()
+    importlib.reload(enviro_metrics)
+    yield tmp_path / "prom"
+    monkeypatch.delenv("ENVIROPI_METRICS_DIR")
+    importlib.reload(enviro_metrics)
+
+
+def test_disabled_leaves_functions_alone(monkeypatch):
+    monkeypatch.setattr(enviro_metrics, "ENABLED", False)
+
+    def read():
+        return 1
+    assert enviro_metrics.timed("read")(read) is read
+    assert enviro_metrics.stage("read") is enviro_metrics.stage("other")
+
+
+def test_stage_histogram_and_errors(metrics_on):
+    @enviro_metrics.timed("flaky")
+    def flaky(fail):
+        if fail:
+            raise ValueError("boom")
+
+    flaky(False)
+    with pytest.raises(ValueError):
+        flaky(True)
+    text = enviro_metrics.render()
+    assert "# TYPE enviropi_stage_seconds histogram" in text
+    assert 'enviropi_stage_seconds_bucket{stage="flaky",le="+Inf"} 2' in text
+    assert 'enviropi_stage_seconds_count{stage="flaky"} 2' in text
+    assert 'enviropi_stage_errors_total{stage="flaky"} 1' in text
+
+
+def test_instrumented_bus_counts_per_device(metrics_on):
+    bus = enviro_metrics.InstrumentedBus(enviro_i2c.FakeSMBus(board="enviropi"))
+    bus.read_byte_data(0x76, 0xD0)
+    bus.read_i2c_block_data(0x76, 0x88, 24)
+    with pytest.raises(OSError):
+        bus.read_byte_data(0x40, 0x00)
+    bus.fault_rate = 1.0
+    with pytest.raises(OSError):
+        bus.write_byte(0x23, 0x01)
+
+    text = enviro_metrics.render()
+    assert 'enviropi_i2c_transactions_total{device="0x76"} 2' in text
+    assert 'enviropi_i2c_errors_total{device="0x40"} 1' in text
+    assert 'enviropi_i2c_errors_total{device="0x23"} 1' in text
+    assert bus.transactions == 4
+
+
+def test_logger_sample_exports_textfile(metrics_on, tmp_path, monkeypatch):
+    monkeypatch.setenv("ENVIROPI_FAKE_I2C", "1")
+    monkeypatch.setenv("ENVIROPI_DATA_DIR", str(tmp_path / "data"))
+    (tmp_path / "data").mkdir()
+    enviro_i2c._buses.clear()
+    logger = importlib.reload(importlib.import_module("enviropi_logger"))
+    try:
+        assert isinstance(logger.bus, enviro_metrics.InstrumentedBus)
+        assert logger.log_reading()["temperature_c"] == 25.08
+        enviro_writebuf.flush()
+        path = enviro_metrics.export()
+    finally:
+        enviro_i2c._buses.clear()
+
+    text = path.read_text()
+    for stage in ("read_bmp280", "read_bh1750", "log_reading", "bmp280_compensate", "append"):
+        assert f'enviropi_stage_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'enviropi_i2c_transactions_total{device="0x76"}' in text
+    bytes_line = [l for l in text.splitlines() if l.startswith("enviropi_writebuf_bytes_total")]
+    assert bytes_line and float(bytes_line[0].split()[1]) > 0
+
+
+def test_daemon_loop_jitter_and_http_endpoint(metrics_on):
+    calls = []
+
+    def task():
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        enviro_daemon.run_every(0.01, task, align=False)
+
+    server = enviro_metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        text = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert "enviropi_loop_jitter_seconds_count 3" in text
+    assert list(metrics_on.glob("*.prom"))  # Exported after each completed iteration
+
+
+def test_large_counters_keep_every_digit(monkeypatch):
+    monkeypatch.setattr(enviro_metrics, "_writebuf_counters",
+                        lambda: {"enviropi_writebuf_bytes_total": 1234567})
+    assert "enviropi_writebuf_bytes_total 1234567\n" in enviro_metrics.render()
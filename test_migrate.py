@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Migrating mixed legacy and JSON Lines day files into a new store
+Runs off-device: python3 -m pytest test_migrate.py
+"""
+
+import json
+
+import pytest
+
+import enviro_stats
+import enviro_storage
+import enviro_migrate
+from enviro_migrate import iter_legacy, migrate
+
+
+def phat(minute):
+    return {"timestamp": f"2026-01-05T10:{minute:02d}:00", "temperature_c": 18.5, "pressure_hpa": 1001.2,
+            "light_lux": 12.0, "accelerometer": {"x": 0.01, "y": -0.02, "z": 0.98}}
+
+
+def write_legacy(path, readings, date="2026-01-05"):
+    with open(path, 'w') as f:
+        json.dump({"date": date, "readings": readings}, f, indent=2)
+
+
+def test_streaming_parse_across_chunks(tmp_path):
+    readings = [phat(m) for m in range(40)]
+    path = tmp_path / "enviro_2026-01-05.json"
+    write_legacy(path, readings)
+    assert list(iter_legacy(path, chunk_size=37)) == readings
+
+    # Cut off mid-reading: everything before the cut survives
+    text = path.read_text()
+    path.write_text(text[:len(text) // 2])
+    partial = list(iter_legacy(path, chunk_size=37))
+    assert 0 < len(partial) < 40 and partial == readings[:len(partial)]
+
+
+def test_mixed_schemas_normalised(tmp_path):
+    source, dest = tmp_path / "data", tmp_path / "new"
+    source.mkdir()
+    write_legacy(source / "enviro_2026-01-05.json", [phat(0), {"timestamp": "bad"}, phat(1)])
+    write_legacy(source / "enviro_2026-01-06.json",
+                 [{"timestamp": "2026-01-06 09:00:00", "temperature_c": 21.0, "humidity_pct": 40.0}],
+                 "2026-01-06")
+    enviro_storage.append_reading({"timestamp": "2026-01-07T08:00:00", "temperature_c": 20.0,
+                                   "pressure_hpa": 1010.0, "light_lux": 3.0}, source)
+
+    results = migrate(source, dest, workers=2)
+    assert results["2026-01-05"]["schema"] == "envirophat"
+    assert results["2026-01-05"]["skipped"] == 1
+    assert results["2026-01-06"]["schema"] == "enviroplus"
+    assert results["2026-01-07"]["schema"] == "enviropi"
+
+    plus = enviro_storage.load_day("2026-01-06", dest)["readings"][0]
+    assert plus["timestamp"] == "2026-01-06T09:00:00"
+    assert plus["noise_amp"] is None and plus["humidity_pct"] == 40.0
+    assert enviro_stats.load_day("2026-01-05", dest)["count"] == 2
+
+
+def test_rerun_only_converts_changed_days(tmp_path):
+    source, dest = tmp_path / "data", tmp_path / "new"
+    source.mkdir()
+    write_legacy(source / "enviro_2026-01-05.json", [phat(0)])
+    enviro_storage.append_reading({"timestamp": "2026-01-07T08:00:00", "temperature_c": 20.0}, source)
+    assert len(migrate(source, dest, workers=1)) == 2
+    assert migrate(source, dest, workers=1) == {}
+
+    enviro_storage.append_reading({"timestamp": "2026-01-07T08:05:00", "temperature_c": 20.5}, source)
+    assert list(migrate(source, dest, workers=1)) == ["2026-01-07"]
+    assert len(enviro_storage.load_day("2026-01-07", dest)["readings"]) == 2
+
+
+def test_columnar_backend(tmp_path):
+    pytest.importorskip("numpy")
+    source, dest = tmp_path / "data", tmp_path / "new"
+    source.mkdir()
+    write_legacy(source / "enviro_2026-01-05.json", [phat(m) for m in range(10)])
+    assert migrate(source, dest, backend="columnar", workers=1)["2026-01-05"]["output"] == "enviro_2026-01-05.col"
+    assert enviro_storage.load_day("2026-01-05", dest)["readings"] == [phat(m) for m in range(10)]
+
+
+def test_refuses_in_place(tmp_path):
+    with pytest.raises(ValueError):
+        migrate(tmp_path, tmp_path)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Accelerometer vibration summaries from synthetic motion
+Runs off-device: python3 -m pytest test_motion.py
+"""
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import enviro_motion
+from enviro_motion import MotionBuffer, MotionMonitor, summarize
+
+
+def shaking(seconds, rate=200, freq=25.0, amplitude=0.2):
+    """x vibrating at freq, y still, z carrying gravity"""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = np.zeros((len(t), 3), dtype=np.float32)
+    samples[:, 0] = 0.05 + amplitude * np.sin(2 * np.pi * freq * t)
+    samples[:, 2] = 1.0
+    return t, samples
+
+
+def test_buffer_wraps_in_time_order():
+    buffer = MotionBuffer(4)
+    for i in range(10):
+        buffer.append(float(i), i, 0, 0)
+    times, samples = buffer.contents()
+    assert list(times) == [6, 7, 8, 9]
+    assert list(samples[:, 0]) == [6, 7, 8, 9]
+
+
+def test_sine_summary():
+    fields = summarize(*shaking(10))
+    assert fields["accelerometer"] == {"x": 0.05, "y": 0.0, "z": 1.0}
+    assert fields["vib_x_rms"] == pytest.approx(0.2 / math.sqrt(2), rel=1e-3)
+    assert fields["vib_x_peak"] == pytest.approx(0.2, rel=1e-3)
+    assert fields["vib_x_crest"] == pytest.approx(math.sqrt(2), abs=0.01)
+    assert fields["vib_x_hz"] == pytest.approx(25, abs=0.2)
+    # Gravity is orientation, not vibration
+    assert fields["vib_z_rms"] == 0 and fields["vib_z_hz"] is None
+
+
+def test_frequency_uses_the_achieved_rate():
+    t, samples = shaking(10, rate=200, freq=25)
+    fields = summarize(t * 2, samples)  # Samples actually arrived at 100 Hz
+    assert fields["vib_x_hz"] == pytest.approx(12.5, abs=0.2)
+
+
+def test_monitor_reads_all_axes_at_once():
+    calls = []
+
+    def read():
+        calls.append(1)
+        n = len(calls)
+        return (n, n, n)
+
+    monitor = MotionMonitor(read, rate=500, seconds=1)
+    monitor.start()
+    monitor.wait(0.2)
+    monitor.stop()
+    _, samples = monitor.buffer.contents()
+    assert len(samples) == len(calls) > 20
+    assert (samples[:, 0] == samples[:, 1]).all() and (samples[:, 1] == samples[:, 2]).all()
+    fields = monitor.summary()
+    assert fields["motion_samples"] == len(calls)
+    assert monitor.summary()["accelerometer"] is None
+
+
+class FakeLSM303D:
+    """envirophat's lsm303d: setup() leaves CTRL_REG1 at 50 Hz"""
+
+    def __init__(self):
+        self.i2c_bus = self
+        self.addr = 0x1D
+        self.registers = {}
+        self.rates = []
+
+    def setup(self):
+        self.registers.setdefault(enviro_motion.CTRL_REG1, 0x57)
+
+    def read_byte_data(self, addr, register):
+        return self.registers[register]
+
+    def write_byte_data(self, addr, register, value):
+        self.registers[register] = value
+        self.rates.append(enviro_motion.OUTPUT_RATES[value >> 4])
+
+    def accelerometer(self):
+        return (0.0, 0.0, 1.0)
+
+
+def test_capture_raises_the_output_data_rate():
+    lsm = FakeLSM303D()
+    monitor = MotionMonitor(enviro_motion.LSM303DAccelerometer(lsm), rate=200, seconds=1)
+    monitor.start()
+    assert lsm.registers[enviro_motion.CTRL_REG1] == 0x87   # 400 Hz, all axes
+    monitor.wait(0.1)
+    monitor.stop()
+    assert lsm.registers[enviro_motion.CTRL_REG1] == 0x57
+    assert lsm.rates == [400, 50]
+    assert monitor.summary()["accelerometer"] == {"x": 0.0, "y": 0.0, "z": 1.0}
+    assert enviro_motion.output_rate_code(50) == 6 and enviro_motion.output_rate_code(2000) == 10
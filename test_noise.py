@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Noise bands from WAV files standing in for the ADAU7002 microphone
+Runs off-device: python3 -m pytest test_noise.py
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import enviro_noise
+from enviro_noise import AudioRing, NoiseMonitor, WavSource, write_wav
+
+RATE = enviro_noise.SAMPLE_RATE
+
+
+def tone(freq, seconds, amplitude):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+def analyse(path):
+    monitor = NoiseMonitor(WavSource(path))
+    monitor.start()
+    monitor.stop()
+    return monitor
+
+
+def test_ring_wraps_without_losing_samples():
+    ring = AudioRing(10)
+    data = np.arange(25, dtype=np.float32)
+    for i in range(0, 25, 3):
+        ring.write(data[i:i + 3])
+    assert ring.written == 25
+    assert list(ring.read(17, 8)) == list(range(17, 25))
+
+
+def test_tone_lands_in_its_band(tmp_path):
+    path = tmp_path / "mid.wav"
+    write_wav(path, tone(1000, 2, 0.5))
+    levels = analyse(path).summary()
+    assert levels["noise_mid"] == pytest.approx(-6.0, abs=0.2)   # 0.5 FS sine
+    assert levels["noise_low"] < -60 and levels["noise_high"] < -60
+    assert levels["noise_amp"] == pytest.approx(-6.0, abs=0.2)
+
+
+def test_leq_and_peak_over_a_long_file(tmp_path):
+    # Longer than the ring buffer, so a file source must not drop samples
+    path = tmp_path / "long.wav"
+    write_wav(path, np.concatenate([tone(200, 12, 0.5), tone(200, 12, 0.05)]))
+    monitor = analyse(path)
+    levels = monitor.summary()
+    assert monitor.dropped == 0
+    assert levels["noise_low_peak"] == pytest.approx(-6.0, abs=0.2)
+    assert levels["noise_low"] == pytest.approx(-9.0, abs=0.3)    # Half the time 20 dB down
+
+
+def test_summary_resets():
+    _, monitor = enviro_noise.bench(1)
+    assert monitor.summary()["noise_amp"] is not None
+    assert monitor.summary()["noise_amp"] is None
+
+
+def test_keeps_up_with_real_time():
+    factor, monitor = enviro_noise.bench(10)
+    assert factor > 20
+    assert monitor.dropped == 0
+
+
+def test_read_sensors_fills_noise_fields(tmp_path, monkeypatch):
+    pytest.importorskip("bme280")
+    pytest.importorskip("ltr559")
+    import importlib
+    import enviro_i2c
+    path = tmp_path / "room.wav"
+    write_wav(path, tone(300, 2, 0.1))
+    monkeypatch.setenv("ENVIROPI_NOISE_WAV", str(path))
+    monkeypatch.setenv("ENVIROPI_FAKE_I2C", "1")
+    monkeypatch.setenv("ENVIROPI_DATA_DIR", str(tmp_path))
+    enviro_i2c._buses.clear()
+    logger = importlib.reload(importlib.import_module("enviroplus_logger"))
+    try:
+        reading = logger.read_sensors()
+        assert reading["noise_low"] == pytest.approx(-20.0, abs=0.5)
+        assert reading["noise_mid"] < -40
+    finally:
+        if logger._noise is not None:
+            logger._noise.stop()
+        enviro_i2c._buses.clear()
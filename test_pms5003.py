@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+PMS5003 frame parsing and averaging against recorded bytes and a pty
+Runs off-device: python3 -m pytest test_pms5003.py
+"""
+
+import io
+import os
+import pty
+import time
+import tty
+
+from enviro_pms5003 import FrameParser, PMS5003Reader, encode_frame
+
+
+def frame(pm1, pm25, pm10):
+    return encode_frame([pm1, pm25, pm10, pm1, pm25, pm10, 500, 150, 30, 5, 1, 0, 0])
+
+
+def test_frames_split_across_reads():
+    parser = FrameParser()
+    data = frame(1, 2, 3) + frame(4, 5, 6)
+    frames = []
+    for i in range(0, len(data), 5):
+        frames += parser.feed(data[i:i + 5])
+    assert [f[:3] for f in frames] == [(1, 2, 3), (4, 5, 6)]
+    assert parser.skipped == 0
+
+
+def test_resyncs_after_garbage_and_bad_checksum():
+    parser = FrameParser()
+    corrupt = bytearray(frame(9, 9, 9))
+    corrupt[10] ^= 0xFF
+    data = b"\x00\x42\x13" + frame(1, 2, 3) + bytes(corrupt[:20]) + frame(4, 5, 6) + bytes(corrupt) + frame(7, 8, 9)
+    frames = parser.feed(data)
+    assert [f[:3] for f in frames] == [(1, 2, 3), (4, 5, 6), (7, 8, 9)]
+    assert parser.checksum_errors >= 1
+
+
+def test_header_split_at_chunk_boundary():
+    parser = FrameParser()
+    data = b"\x11\x22" + frame(1, 2, 3)
+    assert parser.feed(data[:3]) == []      # Ends with 0x42
+    assert [f[:3] for f in parser.feed(data[3:])] == [(1, 2, 3)]
+
+
+def test_averages_recorded_stream():
+    recording = b"".join(frame(i, 2 * i, 3 * i) for i in range(1, 11))
+    reader = PMS5003Reader(io.BytesIO(recording))
+    reader.start()
+    reader._thread.join(2)
+    assert reader.summary() == {"pm1_ug_m3": 5.5, "pm25_ug_m3": 11.0, "pm10_ug_m3": 16.5}
+    assert reader.summary()["pm25_ug_m3"] is None
+
+
+def test_reads_from_pty():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    reader = PMS5003Reader(os.fdopen(slave, 'rb', buffering=0))
+    reader.start()
+    try:
+        for i in range(3):
+            os.write(master, frame(10, 20, 30))
+        deadline = time.monotonic() + 2
+        while reader.parser.frames < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reader.alive
+        assert reader.summary() == {"pm1_ug_m3": 10.0, "pm25_ug_m3": 20.0, "pm10_ug_m3": 30.0}
+    finally:
+        reader.stop()
+        os.close(master)
+        reader.stream.close()
+
+
+def test_wait_for_first_frame():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    reader = PMS5003Reader(os.fdopen(slave, 'rb', buffering=0))
+    reader.start()
+    try:
+        assert not reader.wait(0.1)
+        os.write(master, frame(5, 6, 7))
+        assert reader.wait(2)
+        assert reader.summary() == {"pm1_ug_m3": 5.0, "pm25_ug_m3": 6.0, "pm10_ug_m3": 7.0}
+    finally:
+        reader.stop()
+        os.close(master)
+        reader.stream.close()
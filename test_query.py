@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Time-range queries: sketch accuracy, merging and the per-day cache
+Runs off-device: python3 -m pytest test_query.py
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import enviro_query
+import enviro_storage
+from enviro_query import Partial, TDigest
+
+TODAY = "2026-10-18"
+
+
+def log_days(data_dir, first, days, cadence=300):
+    """Logs days of temperature readings; returns every value logged"""
+    rng = random.Random(7)
+    t, values, readings = first, [], []
+    for _ in range(days * 86400 // cadence):
+        value = round(rng.gauss(18, 4), 2)
+        values.append(value)
+        readings.append({"timestamp": t.isoformat(), "temperature_c": value,
+                         "accelerometer": {"x": 0.0, "y": 0.0, "z": 1.0}})
+        t += timedelta(seconds=cadence)
+    enviro_storage.append_readings(readings, data_dir, update_stats=False)
+    return values
+
+
+def exact(values, p):
+    values = sorted(values)
+    return values[int(p / 100 * (len(values) - 1))]
+
+
+def test_tdigest_quantiles_survive_merging():
+    rng = random.Random(1)
+    values = [rng.expovariate(1) for _ in range(20000)]
+    merged = TDigest()
+    for i in range(0, len(values), 1000):
+        part = TDigest()
+        for v in values[i:i + 1000]:
+            part.add(v)
+        merged.merge(TDigest.from_dict(part.to_dict()))
+    assert len(merged.means) <= 2 * enviro_query.COMPRESSION
+    for p in (50, 95, 99):
+        assert abs(merged.quantile(p / 100) - exact(values, p)) < 0.02 * exact(values, 99)
+
+
+def test_partials_merge_like_one_pass():
+    values = [random.Random(2).uniform(-5, 35) for _ in range(5000)]
+    whole, left, right = Partial("temperature_c"), Partial("temperature_c"), Partial("temperature_c")
+    for v in values:
+        whole.add(v)
+    for v in values[:1234]:
+        left.add(v)
+    for v in values[1234:]:
+        right.add(v)
+    merged = left.merge(right).result(histogram=True)
+    expected = whole.result(histogram=True)
+    for key in ("count", "mean", "min", "max", "stddev"):
+        assert merged[key] == expected[key]
+    assert merged["histogram"]["counts"] == expected["histogram"]["counts"]
+    assert sum(merged["histogram"]["counts"]) + merged["histogram"]["over"] == 5000
+
+
+def test_query_matches_readings_at_any_resolution(tmp_path):
+    log_days(tmp_path, datetime(2026, 3, 1), 4)
+    start, end = "2026-03-01T10:30:00", "2026-03-04T05:15:00"
+    readings = [r for day in ("2026-03-01", "2026-03-02", "2026-03-03", "2026-03-04")
+                for r in enviro_storage.iter_readings(day, tmp_path)
+                if start <= r["timestamp"] < end]
+
+    for resolution in (None, 86400, 3600, 900):
+        buckets = enviro_query.query("temperature_c", start, end, resolution, tmp_path, TODAY)
+        assert sum(p.count for p in buckets.values()) == len(readings)
+    daily = enviro_query.query("temperature_c", start, end, 86400, tmp_path, TODAY)
+    assert list(daily) == ["2026-03-01T00:00:00", "2026-03-02T00:00:00",
+                           "2026-03-03T00:00:00", "2026-03-04T00:00:00"]
+    day2 = [r["temperature_c"] for r in readings if r["timestamp"].startswith("2026-03-02")]
+    assert daily["2026-03-02T00:00:00"].result()["max"] == max(day2)
+
+    hourly = enviro_query.query("accelerometer.z", start, end, 3600, tmp_path, TODAY)
+    assert min(hourly) == "2026-03-01T10:00:00" and max(hourly) == "2026-03-04T05:00:00"
+
+
+def test_long_query_uses_cached_days(tmp_path, monkeypatch):
+    values = log_days(tmp_path, datetime(2026, 1, 1), 30)
+    first = enviro_query.query("temperature_c", "2026-01-01T00:00:00", "2026-01-31T00:00:00",
+                               data_dir=tmp_path, today=TODAY)
+    assert len(list(enviro_query.cache_dir(tmp_path).glob("*.day.json"))) == 30
+
+    def no_rescan(*args, **kwargs):
+        raise AssertionError("cached day was rescanned")
+    monkeypatch.setattr(enviro_storage, "iter_readings", no_rescan)
+    again = enviro_query.query("temperature_c", "2026-01-01T00:00:00", "2026-01-31T00:00:00",
+                               data_dir=tmp_path, today=TODAY)
+    result = again["2026-01-01T00:00:00"].result()
+    assert result == first["2026-01-01T00:00:00"].result()
+    assert result["count"] == len(values)
+    assert abs(result["p95"] - exact(values, 95)) < 0.2
+
+
+def test_cache_follows_day_file_changes(tmp_path):
+    log_days(tmp_path, datetime(2026, 3, 1), 1)
+    before = enviro_query.day_partials("2026-03-01", tmp_path)["temperature_c"].count
+    enviro_storage.append_reading({"timestamp": "2026-03-01T23:59:59", "temperature_c": 99.0}, tmp_path)
+    after = enviro_query.day_partials("2026-03-01", tmp_path)["temperature_c"]
+    assert after.count == before + 1 and after.max == 99.0
+
+    enviro_storage.day_file("2026-03-01", tmp_path).unlink()
+    assert enviro_query.day_partials("2026-03-01", tmp_path) == {}
+    assert len(enviro_query.prune_cache(tmp_path)) == 2
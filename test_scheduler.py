@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Multi-rate sensor scheduling on a simulated clock
+Runs off-device: python3 -m pytest test_scheduler.py
+"""
+
+import importlib
+import subprocess
+import sys
+
+import pytest
+
+import enviro_i2c
+import enviro_scheduler
+from enviro_scheduler import Scheduler, SensorPlugin, Task
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class CountingPlugin(SensorPlugin):
+    """Returns an increasing value; takes `cost` seconds of simulated time"""
+
+    def __init__(self, clock, field, cost=0.0, log=None):
+        super().__init__()
+        self.clock, self.field, self.cost, self.log = clock, field, cost, log
+        self.count = 0
+
+    def read(self):
+        self.count += 1
+        self.clock.now += self.cost
+        if self.log is not None:
+            self.log.append(self.field)
+        return {self.field: float(self.count)}
+
+
+def test_each_sensor_runs_at_its_own_rate():
+    clock = FakeClock()
+    light = CountingPlugin(clock, "light_lux")
+    pressure = CountingPlugin(clock, "pressure_hpa", cost=0.05)
+    humidity = CountingPlugin(clock, "humidity_pct", cost=0.05)
+    records = []
+    scheduler = Scheduler([Task(light, 1), Task(pressure, 60), Task(humidity, 300)],
+                          300, records.append, clock=clock, sleep=clock.sleep)
+    scheduler.run(until=599.5)
+
+    assert light.count == 600
+    assert pressure.count == 10
+    assert humidity.count == 2
+    assert len(records) == 1
+    # Mean of every light sample in the first interval (1..300, maybe one more)
+    assert records[0]["light_lux"] == pytest.approx(150.5, abs=1)
+    assert records[0]["humidity_pct"] == 1.0
+
+
+def test_priority_breaks_ties_and_access_is_serial():
+    clock = FakeClock()
+    order = []
+    tasks = [
+        Task(CountingPlugin(clock, "low", 0.1, order), 10, priority=5),
+        Task(CountingPlugin(clock, "high", 0.1, order), 10, priority=0),
+    ]
+    Scheduler(tasks, 100, lambda r: None, clock=clock, sleep=clock.sleep).run(until=25)
+    assert order == ["high", "low"] * 3
+
+
+def test_overrun_skips_slots_instead_of_bursting():
+    clock = FakeClock()
+    slow = CountingPlugin(clock, "slow", cost=2.5)
+    Scheduler([Task(slow, 1)], 100, lambda r: None, clock=clock, sleep=clock.sleep).run(until=30)
+    assert slow.count <= 12
+
+
+def test_failed_sensor_is_reopened_and_logged_as_null():
+    clock = FakeClock()
+
+    class Flaky(SensorPlugin):
+        opens = 0
+
+        def open(self):
+            Flaky.opens += 1
+
+        def read(self):
+            raise OSError("remote I/O error")
+
+    records = []
+    good = CountingPlugin(clock, "light_lux")
+    Scheduler([Task(Flaky(), 10), Task(good, 10)], 30, records.append,
+              clock=clock, sleep=clock.sleep).run(until=30)
+    assert Flaky.opens == 4
+    assert "temperature_c" not in records[0] and records[0]["light_lux"] == 2.0
+
+
+def test_unused_drivers_are_not_imported():
+    code = ("import sys, enviro_scheduler\n"
+            "enviro_scheduler.build_tasks(enviro_scheduler.BOARDS['enviropi'])\n"
+            "print(sorted(m for m in ('bme280', 'ltr559', 'envirophat', 'enviro_pms5003', 'enviro_noise',"
+            " 'enviro_bh1750', 'enviro_bmp280') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_once_with_fake_bus(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENVIROPI_FAKE_I2C", "1")
+    monkeypatch.setenv("ENVIROPI_CACHE_DIR", str(tmp_path))
+    enviro_i2c._buses.clear()
+    try:
+        tasks = enviro_scheduler.build_tasks(enviro_scheduler.BOARDS["enviropi"])
+        reading = Scheduler(tasks, 300, None).run_once()
+        assert reading["temperature_c"] == 25.08
+        assert reading["pressure_hpa"] == 1006.53
+        assert reading["light_lux"] == pytest.approx(250, abs=1)
+    finally:
+        enviro_i2c._buses.clear()
+
+
+def test_noise_levels_are_energy_averaged():
+    clock = FakeClock()
+    levels = iter([(-60.0, -40.0), (-40.0, -20.0)])
+
+    class Noise(enviro_scheduler.NoisePlugin):
+        def open(self):
+            pass
+
+        def read(self):
+            leq, peak = next(levels)
+            return {"noise_amp": leq, "noise_peak": peak}
+
+    records = []
+    Scheduler([Task(Noise(), 60)], 120, records.append, clock=clock, sleep=clock.sleep).run(until=120)
+    # 10*log10((1e-6 + 1e-4) / 2): the louder minute dominates, not (-60 + -40) / 2
+    assert records[0]["noise_amp"] == pytest.approx(-42.97, abs=0.01)
+    assert records[0]["noise_peak"] == -20.0
+
+
+def test_once_waits_for_background_sensors():
+    import threading
+
+    class Background(SensorPlugin):
+        """First value arrives from a capture thread a little after open()"""
+
+        def open(self):
+            self.ready = threading.Event()
+            threading.Timer(0.2, self.ready.set).start()
+
+        def wait(self, timeout):
+            return self.ready.wait(timeout)
+
+        def read(self):
+            return {"pm25_ug_m3": 4.0 if self.ready.is_set() else None}
+
+    class Silent(Background):
+        def open(self):
+            self.ready = threading.Event()
+
+    tasks = [Task(Background(), 60), Task(Silent(), 60, name="silent")]
+    reading = Scheduler(tasks, 300, None).run_once(warmup=1)
+    assert reading["pm25_ug_m3"] == 4.0
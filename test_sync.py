@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Incremental sync against a local directory standing in for the Pi
+Runs off-device: python3 -m pytest test_sync.py
+"""
+
+import os
+
+import pytest
+
+import enviro_stats
+import enviro_storage
+import enviro_sync
+
+
+def reading(day, i):
+    return {"timestamp": f"{day}T{i // 60:02d}:{i % 60:02d}:00", "temperature_c": 20 + i / 100}
+
+
+def log(pi, day, start, count):
+    for i in range(start, start + count):
+        enviro_storage.append_reading(reading(day, i), pi)
+
+
+def test_pulls_only_new_readings(tmp_path):
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 100)
+    source = enviro_sync.LocalSource(pi)
+
+    assert enviro_sync.sync(source, mirror)["readings"] == 100
+    first = source.bytes_read
+
+    log(pi, "2026-03-01", 100, 5)
+    summary = enviro_sync.sync(source, mirror)
+    assert summary["readings"] == 5
+    assert source.bytes_read - first == summary["bytes"] < first / 10
+
+    name = "enviro_2026-03-01.jsonl"
+    assert (mirror / name).read_bytes() == (pi / name).read_bytes()
+    stats = enviro_stats.load_day("2026-03-01", mirror)
+    assert stats["count"] == 105
+    assert stats["bytes"] == (mirror / name).stat().st_size
+
+
+def test_nothing_new_reads_nothing(tmp_path):
+    pi = tmp_path / "pi"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    source = enviro_sync.LocalSource(pi)
+    enviro_sync.sync(source, tmp_path / "mirror")
+    before = source.bytes_read
+    assert enviro_sync.sync(source, tmp_path / "mirror")["files"] == 0
+    assert source.bytes_read == before
+
+
+def test_catches_up_missed_days(tmp_path):
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+
+    # Outage: the rest of day 1 and two more days logged before the next pull
+    log(pi, "2026-03-01", 10, 10)
+    log(pi, "2026-03-02", 0, 10)
+    log(pi, "2026-03-03", 0, 10)
+    summary = enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert summary["files"] == 3 and summary["readings"] == 30
+    assert summary["days"] == ["2026-03-01", "2026-03-02", "2026-03-03"]
+    for day in ("2026-03-01", "2026-03-02", "2026-03-03"):
+        name = f"enviro_{day}.jsonl"
+        assert (mirror / name).read_bytes() == (pi / name).read_bytes()
+
+
+def test_partial_line_waits_for_next_pull(tmp_path):
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 3)
+    path = pi / "enviro_2026-03-01.jsonl"
+    with open(path, 'a') as f:
+        f.write('{"timestamp": "2026-03-01T00:03:00", "tempe')
+    assert enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)["readings"] == 3
+
+    with open(path, 'a') as f:
+        f.write('rature_c": 20.03}\n')
+    assert enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)["readings"] == 1
+    assert (mirror / path.name).read_bytes() == path.read_bytes()
+
+
+def test_recovers_from_crash_after_local_write(tmp_path):
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 5)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+
+    # Simulate a crash after appending to the mirror but before saving the cursor
+    name = "enviro_2026-03-01.jsonl"
+    with open(mirror / name, 'a') as f:
+        f.write('{"timestamp": "2026-03-01T00:05:00"}\n')
+    log(pi, "2026-03-01", 5, 1)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert (mirror / name).read_bytes() == (pi / name).read_bytes()
+    assert enviro_stats.load_day("2026-03-01", mirror)["count"] == 6
+
+
+def test_rewritten_source_file_is_pulled_again(tmp_path):
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+
+    name = "enviro_2026-03-01.jsonl"
+    os.remove(pi / name)
+    log(pi, "2026-03-01", 50, 2)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert (mirror / name).read_bytes() == (pi / name).read_bytes()
+    assert enviro_stats.load_day("2026-03-01", mirror)["count"] == 2
+
+
+def test_day_archived_between_syncs(tmp_path):
+    import enviro_archive
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+
+    # The rest of the day is logged, then the Pi archives it before the next pull
+    log(pi, "2026-03-01", 10, 10)
+    log(pi, "2026-03-02", 0, 5)
+    enviro_archive.archive_day("2026-03-01", pi)
+    summary = enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert summary["readings"] == 15
+
+    assert not (mirror / "enviro_2026-03-01.jsonl").exists()
+    for name in ("enviro_2026-03-01.jsonl.gz", "enviro_2026-03-01.jsonl.gz.idx"):
+        assert (mirror / name).read_bytes() == (pi / name).read_bytes()
+    got = list(enviro_storage.iter_readings("2026-03-01", mirror))
+    assert got == [reading("2026-03-01", i) for i in range(20)]
+    assert enviro_stats.load_day("2026-03-01", mirror)["count"] == 20
+
+    # A late reading is appended to the archive; the mirror follows
+    log(pi, "2026-03-01", 20, 1)
+    enviro_archive.archive_day("2026-03-01", pi)
+    assert enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)["readings"] == 1
+    assert len(list(enviro_storage.iter_readings("2026-03-01", mirror))) == 21
+    assert enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)["files"] == 0
+
+
+def test_late_write_to_an_archived_day(tmp_path):
+    import enviro_archive
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    enviro_archive.archive_day("2026-03-01", pi)
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+
+    # Logged after the archive: a new day file the mirror hasn't seen
+    log(pi, "2026-03-01", 10, 1)
+    assert enviro_stats.load_day("2026-03-01", pi)["count"] == 11
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert len(list(enviro_storage.iter_readings("2026-03-01", mirror))) == 11
+    assert enviro_stats.load_day("2026-03-01", mirror)["count"] == 11
+
+
+def test_columnar_day_is_mirrored(tmp_path):
+    pytest.importorskip("numpy")
+    import enviro_columnar
+    pi, mirror = tmp_path / "pi", tmp_path / "mirror"
+    pi.mkdir()
+    log(pi, "2026-03-01", 0, 10)
+    readings = list(enviro_storage.iter_readings("2026-03-01", pi))
+    enviro_columnar.write(readings, enviro_columnar.col_file("2026-03-01", pi))
+    enviro_storage.day_file("2026-03-01", pi).unlink()
+
+    enviro_sync.sync(enviro_sync.LocalSource(pi), mirror)
+    assert list(enviro_storage.iter_readings("2026-03-01", mirror)) == readings
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Group-commit write buffer and crash recovery from its journal
+Runs off-device: python3 -m pytest test_writebuf.py
+"""
+
+import json
+
+import enviro_stats
+import enviro_storage
+from enviro_writebuf import WriteBuffer
+
+
+def reading(minute, day="2026-03-01"):
+    return {"timestamp": f"{day}T10:{minute:02d}:00", "temperature_c": 20.0 + minute}
+
+
+def test_batches_until_a_trigger(tmp_path):
+    buffer = WriteBuffer(tmp_path, max_readings=5, max_age=None)
+    for minute in range(4):
+        buffer.add(reading(minute))
+    assert not enviro_storage.day_file("2026-03-01", tmp_path).exists()
+
+    buffer.add(reading(4))
+    assert len(enviro_storage.load_day("2026-03-01", tmp_path)["readings"]) == 5
+    assert buffer.stats()["flushes"] == 1
+    assert buffer.journal_file.stat().st_size == 0
+
+    stats = enviro_stats.load_day("2026-03-01", tmp_path)
+    assert stats["count"] == 5 and stats["metrics"]["temperature_c"]["max"] == 24.0
+
+
+def test_flush_splits_by_day(tmp_path):
+    buffer = WriteBuffer(tmp_path, max_age=None)
+    buffer.add(reading(58, "2026-03-01"))
+    buffer.add(reading(0, "2026-03-02"))
+    buffer.close()
+    assert buffer.bytes_written == sum(enviro_storage.day_file(d, tmp_path).stat().st_size
+                                       for d in ("2026-03-01", "2026-03-02"))
+    assert enviro_stats.load_day("2026-03-02", tmp_path)["count"] == 1
+
+
+def test_timer_bounds_the_delay(tmp_path):
+    import time
+    buffer = WriteBuffer(tmp_path, max_age=0.1)
+    buffer.add(reading(0))
+    time.sleep(0.5)
+    assert buffer.stats()["pending"] == 0
+    assert enviro_storage.day_file("2026-03-01", tmp_path).exists()
+
+
+def test_recovery_replays_only_unflushed_readings(tmp_path):
+    buffer = WriteBuffer(tmp_path, max_readings=3, max_age=None)
+    for minute in range(5):
+        buffer.add(reading(minute))
+    # Crash: two readings only in the journal, one flushed reading still
+    # there too (journal truncate didn't survive), plus a torn line
+    journal = buffer.journal_file
+    flushed = json.dumps(reading(2), separators=(",", ":")) + "\n"
+    journal.write_text(flushed + journal.read_text() + '{"timestamp": "2026-03-01T10:0')
+
+    restarted = WriteBuffer(tmp_path, max_age=None)
+    assert restarted.recover() == 2
+    minutes = [r["timestamp"][14:16] for r in enviro_storage.iter_readings("2026-03-01", tmp_path)]
+    assert minutes == ["00", "01", "02", "03", "04"]
+    assert restarted.recover() == 0